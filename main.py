@@ -1,20 +1,17 @@
 """Main CTk GUI to be run"""
 
+# first, so startup timings include every import
+from util.startup import PLOTTING_MODULES, STARTUP, Preloader, thread_limit
+
 import logging
+import multiprocessing
 import pickle
-from collections import deque, defaultdict
+from collections import defaultdict
 from functools import partial
-from threading import Thread
-from time import sleep
 from tkinter import Menu
 
 import customtkinter as ctk
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from numba import config as numba_config
-from numba.typed import List as TypedList
-from pynput import keyboard
 
 from util.clipboard import ClipboardListener
 from util.condition_widget import (
@@ -25,52 +22,65 @@ from util.condition_widget import (
     DiskDialog,
     NetherFossilDialog,
 )
-from util.conditions import (
+from util.cache import ResultCache
+from util.checkpoint import (
+    CHECKPOINT_MINIMUM_SAMPLES,
+    Checkpointer,
+    load_checkpoint,
+    resumable,
+)
+from util.condition_model import (
     GenericCondition,
     build_first_portal_condition,
     build_third_portal_condition,
-    numba_GenericCondition,
 )
-from util.heatmap import convolve_data, generate_data
+from util.eyes import DEFAULT_STANDARD_DEVIATION
+from util.progress import ProgressTracker
+from util.peaks import SECTOR_COUNTS, TOP_PEAK_COUNT
+from util.progress_widget import ProgressDisplay
+from util.recorder import EventRecorder, session_path
+from util.sample_log import SampleLog, log_path
+from util.samples import Disk
+from util.server import DEFAULT_PORT, HeatmapServer
+from util.session import (
+    DisplacementCache,
+    apply_clipboard,
+    cached_result,
+    convolve_heatmaps,
+    draw_heatmaps,
+    eye_posterior,
+    result_distributions,
+    score_heatmaps,
+    summarize,
+)
+
+# matplotlib, pynput and the numba compiled modules are imported by a
+# Preloader once the window is up, and locally where they are used
 
 logging.basicConfig()
+STARTUP.mark("light imports")
 
 
 def validate_thread_count(value: str) -> bool:
     """Validate if a thread count value is within the valid range"""
-    return (
-        not value
-        or value.isdigit()
-        and 1 <= int(value) <= numba_config.NUMBA_DEFAULT_NUM_THREADS
-    )
-
-
-class ProgressThread(Thread):
-    """Thread to log progress of stronghold distribution generation"""
-
-    def __init__(self, parent_logger, progress, sample_count):
-        super().__init__(daemon=True)
-        self.progress = progress
-        self.logger = parent_logger.getChild("ProgressThread")
-        self.sample_count = sample_count
-
-    def run(self):
-        while 0 <= self.progress[0] < self.sample_count:
-            self.logger.info(
-                "Generated %d/%d samples (%.02f%%)",
-                self.progress[0],
-                self.sample_count,
-                self.progress[0] / self.sample_count * 100,
-            )
-            sleep(0.05)
+    return not value or value.isdigit() and 1 <= int(value) <= thread_limit()
 
 
 class KeybindWindow(ctk.CTkToplevel):
     """Keybind settings window"""
 
-    KEYBINDS = ["Reset", "Toggle Clipboard Listener"]
+    KEYBINDS = [
+        "Reset",
+        "Toggle Clipboard Listener",
+        "Undo",
+        "Redo",
+        "Not Found at Overall",
+        "Advise Next Observation",
+    ]
 
     def __init__(self, master, config_location):
+        from pynput import keyboard
+
         super().__init__(master)
         self.grab_set()
 
@@ -139,21 +149,54 @@ class MainApplication(ctk.CTk):
     """Main CTk GUI to be run"""
 
     CONFIG_LOCATION = "config.pkl"
+    CHECKPOINT_LOCATION = "checkpoint.npz"
+    RECORDING_DIRECTORY = "sessions"
+    SEED_LOG_DIRECTORY = "seed_logs"
+    # table written by util.displacement, the unfitted prior is used without one
+    DISPLACEMENT_LOCATION = "displacement.npz"
+    PROGRESS_INTERVAL_MS = 100
+    # progress ticks between progressive heatmap publishes to the api server
+    PUBLISH_INTERVAL_TICKS = 5
+    CPU_BUDGETS = (0.1, 0.25, 0.5, 0.75, 1.0)
+    CANDIDATE_COUNTS = (0, 3, 5, 10)
+    ENGINES = (
+        ("numba", "Numba (JIT)"),
+        ("numpy", "NumPy"),
+        ("exact", "Exact (salt 0 conditions only)"),
+    )
+    STARTUP_POLL_MS = 50
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = logging.getLogger("MainApplication")
         self.logger.setLevel(logging.INFO)
         ctk.set_appearance_mode("dark")
-        self.configure_mpl_theme()
 
         self.title("Auto Divine Calculator")
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.first_sh_distribution = self.all_sh_distribution = None
+        self.sample_cloud = None
+        self.displacement = DisplacementCache(self.DISPLACEMENT_LOCATION)
+        self.overall_optimal_coords = None
+        self.eye_throws = []
+        self.angle_distributions = None
+        self.sampler = None
+        # cancelled samplers whose shared memory is released once they stop
+        self.retired_samplers = []
+        self.progress_tracker = None
+        self.progress_job = None
+        self.progress_ticks = 0
+        self.server = None
+        self.recorder = None
 
         self.popout_window = None
         self.keybind_window = None
+        # set once the preloaded modules are in, see finish_startup
+        self.speculator = None
+        self.sampler_service = None
+        self.keypress_listener = None
+        self.generation_requested = False
 
         try:
             with open(self.CONFIG_LOCATION, "rb") as config_file:
@@ -161,30 +204,123 @@ class MainApplication(ctk.CTk):
         except FileNotFoundError:
             self.config = {}
 
-        self.held_keys = defaultdict(lambda: False)
-        self.keypress_listener = keyboard.Listener(
-            on_press=self.key_press_handler, on_release=self.key_release_handler
+        self.history = ResultCache(self.config.get("history_cache_mb", 256) << 20)
+        self.speculation_cache = ResultCache(
+            self.config.get("speculation_cache_mb", 256) << 20
         )
-        self.clipboard_listener = ClipboardListener(on_change=self.clipboard_handler)
 
-        self.keypress_listener.start()
+        self.held_keys = defaultdict(lambda: False)
+        self.clipboard_listener = ClipboardListener(on_change=self.clipboard_handler)
         self.clipboard_listener.start()
 
         self.place_widgets()
 
+        if self.config.get("api_server", False):
+            self.start_server()
+        if self.config.get("record_session", False):
+            self.start_recording()
+
+        # the window and condition list are usable while the plotting and
+        # sampling modules load in the background
+        STARTUP.mark("window built")
+        self.after(0, STARTUP.mark, "first paint")
+        self.preloader = Preloader()
+        self.preloader.start()
+        self.after(self.STARTUP_POLL_MS, self.startup_handler)
+
+    def startup_handler(self):
+        """Poll the preloader, building the figures and then the rest as modules arrive"""
+        if not hasattr(self, "canvas") and self.preloader.has_loaded(PLOTTING_MODULES):
+            self.place_figures()
+        if self.preloader.is_alive():
+            self.after(self.STARTUP_POLL_MS, self.startup_handler)
+            return
+        self.finish_startup()
+
+    def place_figures(self):
+        """Replace the loading placeholder with the embedded heatmap figure"""
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.configure_mpl_theme()
+        self.fig = Figure()
+        self.axes = self.fig.subplots(1, 2)
+        if self.config.get("angle_mode", False):
+            self.set_polar(True)
+        self.loading_label.destroy()
+        self.canvas = FigureCanvasTkAgg(self.fig, self)
+        self.canvas.get_tk_widget().grid(row=self.canvas_row, column=0, columnspan=2)
+        self.canvas.draw()
+        STARTUP.mark("figures shown")
+
+    def finish_startup(self):
+        """Start everything that needed the sampling modules, once they are loaded"""
+        from pynput import keyboard
+
+        from util.sampler import available_engines
+        from util.speculation import SpeculativeScheduler
+        from util.worker import SamplerService
+
+        if not hasattr(self, "canvas"):
+            self.place_figures()
+        self.speculator = SpeculativeScheduler(self.speculation_cache)
+        self.speculator.start()
+        self.sampler_service = SamplerService()
+        if self.config.get("worker_process", False):
+            self.sampler_service.start()
+        self.keypress_listener = keyboard.Listener(
+            on_press=self.key_press_handler, on_release=self.key_release_handler
+        )
+        self.keypress_listener.start()
+        for index, (engine, _) in enumerate(self.ENGINES):
+            self.engine_menu.entryconfigure(
+                index,
+                state="normal" if engine in available_engines() else "disabled",
+            )
+        # error measurement, core pinning and calibration run numba kernels too
+        if "numba" not in available_engines():
+            self.engine_menu.entryconfigure("Measure Sampling Error", state="disabled")
+            self.background_menu.entryconfigure("Pin to Cores...", state="disabled")
+            self.auto_thread_count_checkbox.configure(state="disabled")
+        self.auto_thread_count_handler()
+        STARTUP.mark("ready")
+        self.logger.info(STARTUP.report())
+        # conditions added while loading are generated now
+        if self.generation_requested:
+            self.generation_requested = False
+            self.draw_heatmap()
+
     def on_close(self):
         """Window close handler"""
-        self.config["thread_count"] = int(self.thread_count_entry.get())
+        if not self.auto_thread_count.get():
+            self.config["thread_count"] = int(self.thread_count_entry.get())
+        self.config["auto_thread_count"] = self.auto_thread_count.get()
         self.config["sample_count"] = int(self.sample_count_entry.get())
         self.config["maximum_distance"] = int(self.maximum_distance_slider.get())
         with open(self.CONFIG_LOCATION, "wb+") as config_file:
             pickle.dump(self.config, config_file)
+        if self.sampler is not None:
+            self.sampler.cancel()
+        if self.speculator is not None:
+            self.speculator.preempt()
+        if self.progress_job is not None:
+            self.after_cancel(self.progress_job)
+        if self.server is not None:
+            self.server.stop()
+        if self.sampler_service is not None:
+            self.sampler_service.stop()
+        if self.sampler is not None:
+            self.retired_samplers.append(self.sampler)
+        self.release_samplers(timeout=1.0)
+        self.stop_recording()
         self.destroy()
 
     def configure_mpl_theme(self):
         """Set the default colors of the embedded plots"""
+        from matplotlib import rcParams
+
         # TODO: this is ugly
-        plt.rcParams["axes.facecolor"] = plt.rcParams["figure.facecolor"] = tuple(
+        rcParams["axes.facecolor"] = rcParams["figure.facecolor"] = tuple(
             c / 65535
             for c in self.winfo_rgb(
                 ctk.ThemeManager.theme["CTk"]["fg_color"][
@@ -192,7 +328,7 @@ class MainApplication(ctk.CTk):
                 ]
             )
         )
-        plt.rcParams["axes.edgecolor"] = plt.rcParams["xtick.color"] = plt.rcParams[
+        rcParams["axes.edgecolor"] = rcParams["xtick.color"] = rcParams[
             "ytick.color"
         ] = tuple(
             c / 65535
@@ -215,7 +351,20 @@ class MainApplication(ctk.CTk):
             validatecommand=(self.register(validate_thread_count), "%P"),
         )
         self.thread_count_entry.insert(0, str(self.config.get("thread_count", 1)))
-        self.thread_count_entry.grid(row=row, column=1)
+        self.thread_count_entry.grid(row=row, column=1, sticky="w")
+        self.auto_thread_count = ctk.BooleanVar(
+            self, self.config.get("auto_thread_count", False)
+        )
+        self.auto_thread_count_checkbox = ctk.CTkCheckBox(
+            self,
+            text="Auto",
+            variable=self.auto_thread_count,
+            command=self.auto_thread_count_handler,
+        )
+        self.auto_thread_count_checkbox.grid(row=row, column=1, sticky="e")
+        # calibrating needs numba, the entry is disabled until it is loaded
+        if self.auto_thread_count.get():
+            self.thread_count_entry.configure(state="disabled")
         self.thread_count_label = ctk.CTkLabel(self, text="Thread Count:")
         self.thread_count_label.grid(row=row, column=0)
         self.divine_condition_list = ConditionList(self, command=self.draw_heatmap)
@@ -243,8 +392,8 @@ class MainApplication(ctk.CTk):
         self.maximum_distance_slider.grid(row=row, column=1)
         self.maximum_distance_slider.set(self.config.get("maximum_distance", 500))
         self.maximum_distance_handler(self.config.get("maximum_distance", 500))
-        self.fig, self.axes = plt.subplots(1, 2)
-        self.popout_fig, self.popout_axes = plt.subplots(1, 2)
+        # built on first use, see popout
+        self.popout_fig = self.popout_axes = None
 
         row += 1
         self.popout_button = ctk.CTkButton(
@@ -263,8 +412,15 @@ class MainApplication(ctk.CTk):
         self.regenerated_button.grid(row=row, column=1)
 
         row += 1
-        self.canvas = FigureCanvasTkAgg(self.fig, self)
-        self.canvas.get_tk_widget().grid(row=row, column=0, columnspan=2)
+        self.progress_display = ProgressDisplay(self)
+        self.progress_display.grid(row=row, column=0, columnspan=2, sticky="ew")
+        self.popout_progress_display = None
+
+        row += 1
+        # replaced by the figure once matplotlib is loaded, see place_figures
+        self.canvas_row = row
+        self.loading_label = ctk.CTkLabel(self, text="Loading...")
+        self.loading_label.grid(row=row, column=0, columnspan=2)
         self.popout_canvas = None
 
         row += 1
@@ -272,8 +428,62 @@ class MainApplication(ctk.CTk):
         self.coords_display.grid(row=row, column=0, columnspan=2)
         self.popout_coords_display = None
 
+    def auto_thread_count_handler(self):
+        """Handler to be called any time auto thread count is toggled"""
+        from util.sampler import available_engines
+
+        # calibration times the numba kernels, without numba the stored or
+        # default thread count is kept
+        if not self.auto_thread_count.get() or "numba" not in available_engines():
+            self.thread_count_entry.configure(state="normal")
+            return
+        from util.tuning import CalibrationThread, default_headroom
+
+        self.set_thread_count_entry(
+            self.config.get(
+                "calibrated_thread_count",
+                max(1, thread_limit() - default_headroom()),
+            )
+        )
+        self.thread_count_entry.configure(state="disabled")
+        self.logger.info("Calibrating thread count")
+        CalibrationThread(self.calibration_handler).start()
+
+    def set_thread_count_entry(self, thread_count: int):
+        """Overwrite the contents of the thread count entry"""
+        state = self.thread_count_entry.cget("state")
+        self.thread_count_entry.configure(state="normal")
+        self.thread_count_entry.delete(0, "end")
+        self.thread_count_entry.insert(0, str(thread_count))
+        self.thread_count_entry.configure(state=state)
+
+    def calibration_handler(self, result):
+        """Handler to be called when thread count calibration finishes"""
+        self.logger.info(
+            "Calibrated thread count: %d (%.0f accepted/s)",
+            result.thread_count,
+            result.accepted_rate,
+        )
+        self.config["calibrated_thread_count"] = result.thread_count
+        self.config["calibrated_rates"] = result.rates
+        if self.auto_thread_count.get():
+            self.after(0, self.set_thread_count_entry, result.thread_count)
+
     def popout(self):
         """Pop-out heatmap as its own window"""
+        # nothing to show before the main figure exists
+        if not hasattr(self, "canvas"):
+            return
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        if self.popout_fig is None:
+            self.popout_fig = Figure()
+            self.popout_axes = self.popout_fig.subplots(
+                1,
+                2,
+                subplot_kw={"projection": "polar" if self.angle_mode.get() else None},
+            )
         if self.popout_window is not None:
             self.popout_window.destroy()
             self.popout_window = None
@@ -283,6 +493,7 @@ class MainApplication(ctk.CTk):
 
         def on_close():
             self.popout_coords_display = None
+            self.popout_progress_display = None
             self.popout_canvas = None
             self.popout_window.destroy()
             self.popout_window = None
@@ -298,6 +509,9 @@ class MainApplication(ctk.CTk):
             width=250,
         )
         self.popout_coords_display.pack(fill="both", side="bottom", expand=True)
+        self.popout_progress_display = ProgressDisplay(self.popout_window, width=250)
+        self.popout_progress_display.pack(fill="x", side="bottom")
+        self.draw_heatmap(new_data=False)
 
     def open_keybind_window(self):
         """Open keybind settings window"""
@@ -310,6 +524,35 @@ class MainApplication(ctk.CTk):
 
         menubar.add_command(label="Keybinds", command=self.open_keybind_window)
 
+        edit_menu = Menu(self, tearoff=0)
+        edit_menu.add_command(label="Undo", command=self.divine_condition_list.undo)
+        edit_menu.add_command(label="Redo", command=self.divine_condition_list.redo)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+
+        miss_menu = Menu(self, tearoff=0)
+        miss_menu.add_command(
+            label="Not Found at Overall", command=self.exclude_overall
+        )
+        miss_menu.add_command(
+            label="Exclude Disk...", command=self.open_exclude_disk_dialog
+        )
+        miss_menu.add_command(label="Clear Exclusions", command=self.clear_exclusions)
+        menubar.add_cascade(label="Miss", menu=miss_menu)
+
+        menubar.add_command(label="Advise", command=self.advise_next_observation)
+
+        self.eye_throw_mode = ctk.BooleanVar(
+            self, self.config.get("eye_throw_mode", False)
+        )
+        eyes_menu = Menu(self, tearoff=0)
+        eyes_menu.add_checkbutton(
+            label="Eye Throw Mode",
+            variable=self.eye_throw_mode,
+            command=self.eye_throw_mode_handler,
+        )
+        eyes_menu.add_command(label="Clear Eye Throws", command=self.clear_eye_throws)
+        menubar.add_cascade(label="Eyes", menu=eyes_menu)
+
         portal_menu = Menu(self, tearoff=0)
         first_portal_menu = Menu(self, tearoff=0)
         third_portal_menu = Menu(self, tearoff=0)
@@ -376,133 +619,897 @@ class MainApplication(ctk.CTk):
             label="Buried Treasure",
             command=lambda: BuriedTreasureDialog(self.divine_condition_list),
         )
+        self.low_priority = ctk.BooleanVar(self, self.config.get("low_priority", False))
+        self.cpu_budget = ctk.DoubleVar(self, self.config.get("cpu_budget", 1.0))
+        self.background_menu = background_menu = Menu(self, tearoff=0)
+        background_menu.add_checkbutton(
+            label="Low Priority Workers",
+            variable=self.low_priority,
+            command=self.background_mode_handler,
+        )
+        cpu_budget_menu = Menu(self, tearoff=0)
+        for cpu_budget in self.CPU_BUDGETS:
+            cpu_budget_menu.add_radiobutton(
+                label=f"{cpu_budget*100:.0f}%",
+                value=cpu_budget,
+                variable=self.cpu_budget,
+                command=self.background_mode_handler,
+            )
+        background_menu.add_cascade(label="CPU Budget", menu=cpu_budget_menu)
+        background_menu.add_command(
+            label="Pin to Cores...", command=self.open_core_set_dialog
+        )
+        menubar.add_cascade(label="Background Mode", menu=background_menu)
+
+        self.engine = ctk.StringVar(self, self.config.get("engine", "numba"))
+        # engines are disabled until the sampler is loaded, see finish_startup
+        self.engine_menu = Menu(self, tearoff=0)
+        for engine, label in self.ENGINES:
+            self.engine_menu.add_radiobutton(
+                label=label,
+                value=engine,
+                variable=self.engine,
+                command=self.engine_handler,
+                state="disabled",
+            )
+        self.engine_menu.add_separator()
+        self.engine_menu.add_command(
+            label="Measure Sampling Error", command=self.measure_sampling_error
+        )
+        menubar.add_cascade(label="Engine", menu=self.engine_menu)
+
+        self.kernel = ctk.StringVar(self, self.config.get("kernel", "disk"))
+        kernel_menu = Menu(self, tearoff=0)
+        for kernel, label in (
+            ("disk", "Within Distance"),
+            ("gaussian", "Gaussian Falloff"),
+            ("cosine", "Cosine Falloff"),
+            ("travel", "Expected Travel Left"),
+        ):
+            kernel_menu.add_radiobutton(
+                label=label,
+                value=kernel,
+                variable=self.kernel,
+                command=self.kernel_handler,
+            )
+        kernel_menu.add_separator()
+        self.biome_displacement = ctk.BooleanVar(
+            self, self.config.get("biome_displacement", False)
+        )
+        kernel_menu.add_checkbutton(
+            label="Biome Displacement",
+            variable=self.biome_displacement,
+            command=self.biome_displacement_handler,
+        )
+        menubar.add_cascade(label="Kernel", menu=kernel_menu)
+
+        self.sector_count = ctk.IntVar(self, self.config.get("sector_count", 4))
+        self.candidate_count = ctk.IntVar(
+            self, self.config.get("candidate_count", TOP_PEAK_COUNT)
+        )
+        optima_menu = Menu(self, tearoff=0)
+        for sector_count in SECTOR_COUNTS:
+            optima_menu.add_radiobutton(
+                label="Quadrants" if sector_count == 4 else f"{sector_count} Sectors",
+                value=sector_count,
+                variable=self.sector_count,
+                command=self.optima_handler,
+            )
+        optima_menu.add_separator()
+        for candidate_count in self.CANDIDATE_COUNTS:
+            optima_menu.add_radiobutton(
+                label=f"{candidate_count} Ranked Candidates",
+                value=candidate_count,
+                variable=self.candidate_count,
+                command=self.optima_handler,
+            )
+        menubar.add_cascade(label="Optima", menu=optima_menu)
+
+        self.angle_mode = ctk.BooleanVar(self, self.config.get("angle_mode", False))
+        menubar.add_checkbutton(
+            label="Angle Only",
+            variable=self.angle_mode,
+            command=self.angle_mode_handler,
+        )
+
+        self.worker_process = ctk.BooleanVar(
+            self, self.config.get("worker_process", False)
+        )
+        menubar.add_checkbutton(
+            label="Sampler Process",
+            variable=self.worker_process,
+            command=self.worker_process_handler,
+        )
+
+        self.seed_log = ctk.BooleanVar(self, self.config.get("seed_log", False))
+        menubar.add_checkbutton(
+            label="Log Accepted Seeds",
+            variable=self.seed_log,
+            command=self.seed_log_handler,
+        )
+
+        self.checkpoint_runs = ctk.BooleanVar(
+            self, self.config.get("checkpoint_runs", False)
+        )
+        menubar.add_checkbutton(
+            label="Checkpoint Long Runs",
+            variable=self.checkpoint_runs,
+            command=self.checkpoint_runs_handler,
+        )
+
+        self.speculation = ctk.BooleanVar(self, self.config.get("speculation", True))
+        menubar.add_checkbutton(
+            label="Speculate",
+            variable=self.speculation,
+            command=self.speculation_handler,
+        )
+
+        self.api_server = ctk.BooleanVar(self, self.config.get("api_server", False))
+        menubar.add_checkbutton(
+            label="API Server",
+            variable=self.api_server,
+            command=self.api_server_handler,
+        )
+
+        self.record_session = ctk.BooleanVar(
+            self, self.config.get("record_session", False)
+        )
+        menubar.add_checkbutton(
+            label="Record Session",
+            variable=self.record_session,
+            command=self.record_session_handler,
+        )
+
         self.configure(menu=menubar)
 
+    def background_mode_handler(self):
+        """Handler to be called any time the background mode settings change"""
+        self.config["low_priority"] = self.low_priority.get()
+        self.config["cpu_budget"] = self.cpu_budget.get()
+
+    def engine_handler(self):
+        """Handler to be called any time the sampling engine changes"""
+        self.config["engine"] = self.engine.get()
+
+    def kernel_handler(self):
+        """Handler to be called any time the scoring kernel changes"""
+        self.config["kernel"] = self.kernel.get()
+        self.record_settings()
+        self.draw_heatmap(new_data=False)
+
+    def optima_handler(self):
+        """Handler to be called any time the sectors or candidate count change"""
+        self.config["sector_count"] = self.sector_count.get()
+        self.config["candidate_count"] = self.candidate_count.get()
+        self.record_settings()
+        self.draw_heatmap(new_data=False)
+
+    def biome_displacement_handler(self):
+        """Handler to be called any time biome displacement is toggled"""
+        self.config["biome_displacement"] = self.biome_displacement.get()
+        self.record_settings()
+        self.draw_heatmap(new_data=False)
+
+    def scored_distributions(self):
+        """
+        First and all stronghold distributions the heatmaps are scored on,
+        moved by the biome displacement model if enabled
+        """
+        sources = (self.first_sh_distribution, self.all_sh_distribution)
+        if not self.biome_displacement.get():
+            return sources
+        # slider and kernel redraws reuse the displaced copies
+        return self.displacement.displace(sources)
+
+    def measure_sampling_error(self):
+        """Compare the displayed distribution against the exact one for the current conditions"""
+        from util.exact import exact_distributions, monte_carlo_error
+
+        if self.first_sh_distribution is None:
+            return
+        exact = exact_distributions(self.divine_condition_list.conditions)
+        if exact is None:
+            text = "Sampling error unavailable, conditions are not all salt 0"
+        else:
+            error = monte_carlo_error(self.first_sh_distribution, exact[0])
+            text = (
+                f"Sampling error | total variation {error['total_variation']:.4f}"
+                f" | max {error['max_abs']:.2e}"
+            )
+        self.logger.info(text)
+        for display in self.progress_displays():
+            display.finish(text)
+
+    def eye_throw_mode_handler(self):
+        """Handler to be called any time eye throw mode is toggled"""
+        self.config["eye_throw_mode"] = self.eye_throw_mode.get()
+        self.record_settings()
+
+    def angle_mode_handler(self):
+        """Handler to be called any time angle only mode is toggled"""
+        self.config["angle_mode"] = self.angle_mode.get()
+        if hasattr(self, "axes"):
+            self.set_polar(self.angle_mode.get())
+        self.draw_heatmap()
+
+    def set_polar(self, polar: bool):
+        """Replace the plot axes with polar or cartesian ones"""
+        projection = "polar" if polar else None
+        self.fig.clear()
+        self.axes = self.fig.subplots(1, 2, subplot_kw={"projection": projection})
+        if self.popout_fig is not None:
+            self.popout_fig.clear()
+            self.popout_axes = self.popout_fig.subplots(
+                1, 2, subplot_kw={"projection": projection}
+            )
+
+    def axes_sets(self):
+        """Axes pairs of every figure that has been built"""
+        return tuple(axes for axes in (self.axes, self.popout_axes) if axes is not None)
+
+    def worker_process_handler(self):
+        """Handler to be called any time the sampler process is toggled"""
+        self.config["worker_process"] = self.worker_process.get()
+        # started by finish_startup if still loading
+        if self.sampler_service is None:
+            return
+        if self.worker_process.get():
+            # start early so the worker is warm by the next generation
+            self.sampler_service.start()
+        else:
+            self.sampler_service.stop()
+
+    def seed_log_handler(self):
+        """Handler to be called any time logging accepted seeds is toggled"""
+        self.config["seed_log"] = self.seed_log.get()
+
+    def checkpoint_runs_handler(self):
+        """Handler to be called any time checkpointing long runs is toggled"""
+        self.config["checkpoint_runs"] = self.checkpoint_runs.get()
+
+    def speculation_handler(self):
+        """Handler to be called any time speculation is toggled"""
+        self.config["speculation"] = self.speculation.get()
+        self.record_settings()
+        if not self.speculation.get() and self.speculator is not None:
+            self.speculator.preempt()
+
+    def api_server_handler(self):
+        """Handler to be called any time the api server is toggled"""
+        self.config["api_server"] = self.api_server.get()
+        if self.api_server.get():
+            self.start_server()
+        else:
+            self.stop_server()
+
+    def record_session_handler(self):
+        """Handler to be called any time session recording is toggled"""
+        self.config["record_session"] = self.record_session.get()
+        if self.record_session.get():
+            self.start_recording()
+        else:
+            self.stop_recording()
+
+    def start_recording(self):
+        """Start recording clipboard and keybind events for util.replay"""
+        if self.recorder is not None:
+            return
+        self.recorder = EventRecorder(session_path(self.RECORDING_DIRECTORY))
+        self.logger.info("Recording session to %s", self.recorder.path)
+        self.record_settings()
+
+    def stop_recording(self):
+        """Stop recording events"""
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        self.recorder = None
+
+    def record_settings(self):
+        """Record the settings a replay needs to reproduce the following events"""
+        if self.recorder is None:
+            return
+        self.recorder.record(
+            "settings",
+            {
+                "sample_count": int(self.sample_count_entry.get() or 0),
+                "thread_count": int(self.thread_count_entry.get() or 1),
+                "maximum_distance": round(self.maximum_distance_slider.get()),
+                "eye_throw_mode": self.eye_throw_mode.get(),
+                **self.sampler_settings(),
+                "kernel": self.config.get("kernel", "disk"),
+                "sector_count": self.config.get("sector_count", 4),
+                "candidate_count": self.config.get("candidate_count", TOP_PEAK_COUNT),
+                "biome_displacement": self.biome_displacement.get(),
+                "eye_standard_deviation": self.config.get(
+                    "eye_standard_deviation", DEFAULT_STANDARD_DEVIATION
+                ),
+                "speculation": self.speculation.get(),
+                "conditions": [
+                    list(condition)
+                    for condition in self.divine_condition_list.conditions.key
+                ],
+            },
+        )
+
+    def start_server(self):
+        """Start serving the localhost heatmap api"""
+        if self.server is not None:
+            return
+        try:
+            self.server = HeatmapServer(
+                self.server_add_condition,
+                self.server_remove_condition,
+                self.config.get("api_port", DEFAULT_PORT),
+            )
+        except OSError as error:
+            self.logger.error("Could not start api server: %s", error)
+            return
+        self.server.start()
+        self.publish_conditions()
+        if self.first_sh_distribution is not None:
+            self.draw_heatmap(new_data=False)
+
+    def stop_server(self):
+        """Stop serving the localhost heatmap api"""
+        if self.server is None:
+            return
+        self.server.stop()
+        self.server = None
+
+    def server_add_condition(self, condition, name):
+        """Add a condition requested through the api on the Tk thread"""
+        self.after(
+            0, partial(self.divine_condition_list.add_condition, condition, name=name)
+        )
+
+    def server_remove_condition(self, index):
+        """Remove a condition requested through the api on the Tk thread"""
+
+        def remove():
+            if index < len(self.divine_condition_list.widgets):
+                self.divine_condition_list.remove_widget(
+                    self.divine_condition_list.widgets[index]
+                )
+
+        self.after(0, remove)
+
+    def publish_conditions(self):
+        """Publish the current condition list to the api server"""
+        if self.server is None:
+            return
+        self.server.state.publish(
+            conditions=[
+                {"name": widget.name, **widget.condition._asdict()}
+                for widget in self.divine_condition_list.widgets
+            ],
+            optimal=None,
+            final=False,
+        )
+
+    def open_core_set_dialog(self):
+        """Prompt for the set of cores the workers should be pinned to"""
+        from util.governor import available_cores
+
+        value = ctk.CTkInputDialog(
+            title="Pin to Cores",
+            text=(
+                "Enter the core ids to pin workers to seperated by a space "
+                f"(available: {' '.join(map(str, available_cores()))}), "
+                "or leave empty for no pinning"
+            ),
+        ).get_input()
+        if value is None:
+            return
+        try:
+            cores = tuple(sorted({int(core) for core in value.split()}))
+        except ValueError:
+            return
+        if not set(cores) <= set(available_cores()):
+            self.logger.warning("Ignoring unavailable cores %r", cores)
+            return
+        self.config["core_set"] = cores
+
     def draw_heatmap(self, new_data: bool = True):
         """Draw heatmaps for the first ring of strongholds"""
-        # called too early
-        if not hasattr(self, "axes"):
+        # still loading, generate once the sampler is in (see finish_startup)
+        if self.speculator is None:
+            if new_data and hasattr(self, "progress_display"):
+                self.generation_requested = True
+                self.progress_display.finish("Generating once loaded...")
             return
         if new_data:
-            sample_count, thread_count = int(self.sample_count_entry.get()), int(
-                self.thread_count_entry.get()
-            )
-            conditions = TypedList.empty_list(numba_GenericCondition)
-            deque(map(conditions.append, self.divine_condition_list.conditions), 0)
-            self.logger.info(
-                "Generating %d samples on %d threads with %d conditions",
-                sample_count,
-                thread_count,
-                len(conditions),
+            self.start_generation()
+            return
+        if self.angle_mode.get():
+            self.draw_angles()
+            return
+        if self.first_sh_distribution is None:
+            return
+        radius = self.maximum_distance_slider.get() / 8
+        kernel = self.config.get("kernel", "disk")
+        first_distribution, all_distribution = self.scored_distributions()
+        scores = score_heatmaps(
+            all_distribution,
+            convolve_heatmaps(first_distribution, all_distribution, kernel, radius),
+            radius,
+            kernel,
+            self.config.get("sector_count", 4),
+            self.config.get("candidate_count", TOP_PEAK_COUNT),
+            self.sample_cloud,
+        )
+        self.overall_optimal_coords = (scores.overall.x, scores.overall.z)
+        posterior = self.eye_posterior()
+        display_text, optimal = summarize(
+            scores,
+            posterior,
+            self.maximum_distance_slider.get(),
+            len(self.eye_throws),
+        )
+        for axes in self.axes_sets():
+            draw_heatmaps(axes, scores, posterior)
+        self.coords_display.configure(text=display_text)
+        self.canvas.draw()
+        if self.recorder is not None:
+            self.recorder.record("display", display_text)
+        if self.popout_coords_display is not None:
+            self.popout_coords_display.configure(text=display_text)
+        if self.popout_canvas is not None:
+            self.popout_canvas.draw()
+        if self.server is not None:
+            self.server.state.publish(
+                self.first_sh_distribution,
+                self.all_sh_distribution,
+                optimal=optimal,
+                final=True,
             )
-            progress = np.zeros(1, np.int64)
 
-            ProgressThread(self.logger, progress, sample_count).start()
-            (
-                first_sh_distribution,
-                all_sh_distribution,
-            ) = generate_data(
-                progress,
-                sample_count,
-                thread_count,
-                conditions,
-            )
-            self.first_sh_distribution = first_sh_distribution / sample_count
-            self.all_sh_distribution = all_sh_distribution / sample_count
-            self.logger.info("Finished generation")
-        elif self.first_sh_distribution is None:
-            return
-        maximum_distance = round(self.maximum_distance_slider.get() / 8)
-        self.axes[0].clear()
-        self.axes[1].clear()
-        self.popout_axes[0].clear()
-        self.popout_axes[1].clear()
-        all_convolved_data = convolve_data(self.all_sh_distribution, maximum_distance)
-        first_convolved_data = convolve_data(
-            self.first_sh_distribution,
-            maximum_distance,
-        )
-        self.axes[0].imshow(
-            all_convolved_data,
-            origin="upper",
-            cmap="hot",
-            interpolation="nearest",
-            extent=[-350, 350, 350, -350],
-        )
-        self.axes[1].imshow(
-            first_convolved_data,
-            origin="upper",
-            cmap="hot",
-            interpolation="nearest",
-            extent=[-350, 350, 350, -350],
-        )
-        self.popout_axes[0].imshow(
-            all_convolved_data,
-            origin="upper",
-            cmap="hot",
-            interpolation="nearest",
-            extent=[-350, 350, 350, -350],
-        )
-        self.popout_axes[1].imshow(
-            first_convolved_data,
-            origin="upper",
-            cmap="hot",
-            interpolation="nearest",
-            extent=[-350, 350, 350, -350],
-        )
-        overall_optimal_coords = divmod(np.argmax(all_convolved_data), 701)
-        overall_optimal_coords = (
-            overall_optimal_coords[1] - 350,
-            overall_optimal_coords[0] - 350,
+    def draw_angles(self):
+        """Draw polar angle distributions and the best headings"""
+        from util.angles import (
+            ANGLE_BINS,
+            best_headings,
+            smooth_angles,
+            window_half_width,
+        )
+
+        if self.angle_distributions is None:
+            return
+        first_angles, all_angles, distances = self.angle_distributions
+        maximum_distance = self.maximum_distance_slider.get()
+        half_width = window_half_width(maximum_distance)
+        theta = np.radians(
+            (np.arange(ANGLE_BINS + 1) % ANGLE_BINS + 0.5) * 360 / ANGLE_BINS
         )
+        headings = best_headings(all_angles, distances, maximum_distance)
+        overall = headings["overall"]
+        optimal = {
+            "maximum_distance": round(maximum_distance),
+            "overall": {
+                "x": overall.coords[0],
+                "z": overall.coords[1],
+                "score": overall.score,
+                "yaw": overall.yaw,
+                "arc": overall.arc,
+            },
+            "quadrants": {},
+        }
+
+        def arc_text(heading):
+            return f"{heading.arc[0]:.0f}-{heading.arc[1] % 360:.0f}"
+
         display_text = (
-            "Highest Probability Coordinates:\n"
-            f"Overall: {overall_optimal_coords[0]} {overall_optimal_coords[1]} Score: {np.max(all_convolved_data)*100:.02f}%"
-        )
-        self.axes[0].plot(
-            *overall_optimal_coords,
-            marker="*",
-            c="green",
-        )
-        self.popout_axes[0].plot(
-            *overall_optimal_coords,
-            marker="*",
-            c="green",
-        )
-        for quadrant, name in enumerate(("--", "-+", "+-", "++")):
-            z_start = (quadrant & 1) * 350
-            x_start = (quadrant >> 1) * 350
-            quadrant_data = all_convolved_data[
-                z_start : z_start + 350,
-                x_start : x_start + 350,
-            ]
-            quadrant_optimal_coords = divmod(
-                np.argmax(quadrant_data),
-                quadrant_data.shape[1],
-            )
-            quadrant_optimal_coords = (
-                quadrant_optimal_coords[1] - 350 + x_start,
-                quadrant_optimal_coords[0] - 350 + z_start,
-            )
-            display_text += f"\n{name}: {quadrant_optimal_coords[0]}, {quadrant_optimal_coords[1]} {np.max(quadrant_data)*100:.02f}%"
-            if quadrant_optimal_coords == overall_optimal_coords:
-                continue
-            self.axes[0].plot(
-                *quadrant_optimal_coords,
-                marker="o",
-                c="green",
-            )
-            self.popout_axes[0].plot(
-                *quadrant_optimal_coords,
-                marker="o",
-                c="green",
+            "Best Headings (angle, yaw, 50% arc):\n"
+            f"Overall: {overall.angle:.1f} yaw {overall.yaw:.1f} arc {arc_text(overall)} "
+            f"{overall.coords[0]} {overall.coords[1]} Score: {overall.score*100:.02f}%"
+        )
+        for name, heading in headings["quadrants"].items():
+            display_text += (
+                f"\n{name}: {heading.angle:.1f} yaw {heading.yaw:.1f} "
+                f"arc {arc_text(heading)} {heading.score*100:.02f}%"
+            )
+            optimal["quadrants"][name] = {
+                "x": heading.coords[0],
+                "z": heading.coords[1],
+                "score": heading.score,
+                "yaw": heading.yaw,
+                "arc": heading.arc,
+            }
+        for axes in self.axes_sets():
+            for axis, histogram in zip(axes, (all_angles, first_angles)):
+                axis.clear()
+                # match the orientation of the heatmaps, +x right and +z down
+                axis.set_theta_zero_location("E")
+                axis.set_theta_direction(-1)
+                axis.set_yticklabels([])
+                smoothed = smooth_angles(histogram, half_width)
+                axis.plot(theta, np.append(smoothed, smoothed[0]), c="orange")
+            for heading in (*headings["quadrants"].values(), overall):
+                axes[0].plot(
+                    np.radians(heading.angle),
+                    heading.score,
+                    marker="*" if heading is overall else "o",
+                    c="green",
+                )
+            axes[0].fill_between(
+                np.radians(np.linspace(*overall.arc, 32)),
+                0,
+                overall.score,
+                color="green",
+                alpha=0.3,
             )
         self.coords_display.configure(text=display_text)
         self.canvas.draw()
+        if self.recorder is not None:
+            self.recorder.record("display", display_text)
         if self.popout_coords_display is not None:
             self.popout_coords_display.configure(text=display_text)
         if self.popout_canvas is not None:
             self.popout_canvas.draw()
+        if self.server is not None:
+            self.server.state.publish(optimal=optimal, final=True)
+
+    def eye_posterior(self):
+        """Posterior of the logged eye throws, from the samples if kept or else the heatmap"""
+        return eye_posterior(
+            self.eye_throws,
+            self.sample_cloud,
+            self.all_sh_distribution,
+            self.config.get("eye_standard_deviation", DEFAULT_STANDARD_DEVIATION),
+        )
+
+    def clear_eye_throws(self):
+        """Forget every logged eye throw"""
+        self.eye_throws.clear()
+        self.draw_heatmap(new_data=False)
+
+    def start_generation(self):
+        """Start generating a new stronghold distribution in the background"""
+        from util.sampler import SamplerThread
+        from util.worker import ProcessSampler
+
+        sample_count, thread_count = int(self.sample_count_entry.get()), int(
+            self.thread_count_entry.get()
+        )
+        conditions = self.divine_condition_list.conditions
+        engine = self.config.get("engine", "numba")
+        self.record_settings()
+        if self.sampler is not None:
+            self.sampler.cancel()
+            self.retired_samplers.append(self.sampler)
+            self.sampler = None
+        self.publish_conditions()
+        # cached results are only kept for full heatmaps
+        hit = None
+        if not self.angle_mode.get():
+            hit = cached_result(
+                (
+                    (self.history, "from history"),
+                    (self.speculation_cache, "precomputed speculatively"),
+                ),
+                conditions.key,
+                sample_count,
+            )
+        if hit is not None:
+            cached, source = hit
+            self.logger.info(
+                "Using result %s for %d conditions", source, len(conditions)
+            )
+            for display in self.progress_displays():
+                display.finish(f"Done | {source}")
+            self.set_distributions(*cached)
+            # speculation moves on to the branches of the new conditions
+            if self.speculation.get():
+                self.speculator.speculate(
+                    conditions,
+                    sample_count,
+                    thread_count=thread_count,
+                    **self.sampler_settings(),
+                )
+            return
+        # real work always takes priority over speculation
+        self.speculator.preempt()
+        self.logger.info(
+            "Generating %d samples on %d threads with %d conditions (%s engine)",
+            sample_count,
+            thread_count,
+            len(conditions),
+            engine,
+        )
+        arguments = (sample_count, thread_count, conditions)
+        settings = self.sampler_settings()
+        if (
+            self.config.get("seed_log", False)
+            and settings["mode"] == "grid"
+            and engine != "exact"
+        ):
+            try:
+                settings["sample_log"] = SampleLog(
+                    log_path(self.SEED_LOG_DIRECTORY, conditions), conditions
+                )
+            except ValueError as error:
+                self.logger.error("Not logging seeds: %s", error)
+        if (
+            self.config.get("checkpoint_runs", False)
+            and sample_count >= CHECKPOINT_MINIMUM_SAMPLES
+            and engine != "exact"
+        ):
+            resumed = None
+            if resumable(
+                self.CHECKPOINT_LOCATION, sample_count, conditions, settings["mode"]
+            ):
+                resumed = load_checkpoint(self.CHECKPOINT_LOCATION)
+            if resumed is not None:
+                self.logger.info(
+                    "Resuming checkpointed run at %d samples", resumed["buffers"][0][0]
+                )
+                # the seed stream is claimed in blocks, so the thread count
+                # set now continues it just as well
+                del resumed["thread_count"]
+                arguments = (
+                    resumed.pop("sample_count"),
+                    thread_count,
+                    resumed.pop("conditions"),
+                )
+                settings.update(resumed)
+            else:
+                settings["checkpoint"] = Checkpointer(self.CHECKPOINT_LOCATION)
+        if self.config.get("worker_process", False):
+            self.sampler = ProcessSampler(self.sampler_service, *arguments, **settings)
+        else:
+            self.sampler = SamplerThread(*arguments, **settings)
+        self.progress_tracker = ProgressTracker(sample_count)
+        self.progress_ticks = 0
+        self.sampler.start()
+        if self.progress_job is None:
+            self.progress_job = self.after(
+                self.PROGRESS_INTERVAL_MS, self.progress_handler
+            )
+
+    def sampler_settings(self) -> dict:
+        """Keyword arguments for SamplerThread from the current settings"""
+        cpu_budget = self.config.get("cpu_budget", 1.0)
+        return {
+            "cpu_budget": cpu_budget if cpu_budget < 1.0 else None,
+            "low_priority": self.config.get("low_priority", False),
+            "cores": self.config.get("core_set", ()),
+            "engine": self.config.get("engine", "numba"),
+            "mode": "angle" if self.config.get("angle_mode", False) else "grid",
+        }
+
+    def set_distributions(
+        self,
+        first_stronghold_locations,
+        all_stronghold_locations,
+        sample_count,
+        samples=None,
+        seeds=None,
+    ):
+        """Normalize raw histograms into the displayed distributions and redraw"""
+        (
+            self.first_sh_distribution,
+            self.all_sh_distribution,
+            self.sample_cloud,
+        ) = result_distributions(
+            first_stronghold_locations,
+            all_stronghold_locations,
+            sample_count,
+            samples,
+            seeds,
+        )
+        self.draw_heatmap(new_data=False)
+
+    def exclude_disk(self, disk: Disk):
+        """Re-optimize from the samples with no stronghold within disk"""
+        if self.sample_cloud is None:
+            self.logger.warning("Exclusions need a sampled (non exact) result")
+            return
+        dropped = self.sample_cloud.exclude(disk)
+        self.logger.info(
+            "Excluded %r, dropping %d samples (%d left)",
+            disk,
+            dropped,
+            self.sample_cloud.surviving_count,
+        )
+        self.show_sample_cloud()
+
+    def exclude_overall(self):
+        """Exclude the disk around the last reported overall point after a miss"""
+        if self.overall_optimal_coords is None:
+            return
+        self.exclude_disk(
+            Disk(
+                *self.overall_optimal_coords,
+                self.maximum_distance_slider.get() / 8,
+            )
+        )
+
+    def advise_next_observation(self):
+        """Rank the observations that could be made next by how much they would help"""
+        from util.advisor import advise
+
+        cloud = self.sample_cloud
+        if cloud is None or cloud.seeds is None:
+            text = "Advice needs a sampled (non exact) result"
+        else:
+            advice = advise(
+                cloud.surviving_samples(),
+                cloud.surviving_seeds(),
+                self.divine_condition_list.conditions,
+                self.maximum_distance_slider.get() / 8,
+                self.config.get("kernel", "disk"),
+            )
+            for item in advice:
+                self.logger.info(item.summary())
+            text = (
+                "Check next | "
+                + " | ".join(
+                    f"{item.observation.name} +{item.score_gain*100:.1f}%"
+                    for item in advice[:3]
+                )
+                if advice
+                else "Nothing left to check"
+            )
+        for display in self.progress_displays():
+            display.finish(text)
+
+    def clear_exclusions(self):
+        """Undo every exclusion"""
+        if self.sample_cloud is None:
+            return
+        self.sample_cloud.clear_exclusions()
+        self.show_sample_cloud()
+
+    def show_sample_cloud(self):
+        """Display the distributions of the surviving samples"""
+        cloud = self.sample_cloud
+        (
+            self.first_sh_distribution,
+            self.all_sh_distribution,
+        ) = cloud.distributions()
+        for display in self.progress_displays():
+            display.finish(
+                f"{len(cloud.exclusions)} exclusions | "
+                f"{cloud.surviving_count:,} of {cloud.sample_count:,} samples left"
+            )
+        self.draw_heatmap(new_data=False)
+
+    def open_exclude_disk_dialog(self):
+        """Prompt for a disk with no stronghold in it"""
+        value = ctk.CTkInputDialog(
+            title="Exclude Disk",
+            text=(
+                "Enter the nether x z coordinates and optionally the radius "
+                "with no stronghold seperated by a space"
+            ),
+        ).get_input()
+        if value is None:
+            return
+        try:
+            x, z, *radius = map(float, value.split())
+        except ValueError:
+            return
+        if len(radius) > 1:
+            return
+        radius = radius[0] if radius else self.maximum_distance_slider.get() / 8
+        self.exclude_disk(Disk(round(x), round(z), radius))
+
+    def set_angle_distributions(
+        self, first_angles, all_angles, distances, sample_count
+    ):
+        """Normalize raw angle histograms into the displayed distributions and redraw"""
+        self.angle_distributions = (
+            first_angles / sample_count,
+            all_angles / sample_count,
+            distances / sample_count,
+        )
+        self.draw_heatmap(new_data=False)
+
+    def progress_displays(self):
+        """Return all currently visible progress displays"""
+        return tuple(
+            display
+            for display in (self.progress_display, self.popout_progress_display)
+            if display is not None
+        )
+
+    def progress_handler(self):
+        """Poll the sampler's counters, rescheduling itself until generation finishes"""
+        self.progress_job = None
+        self.release_samplers()
+        sampler = self.sampler
+        if sampler is None:
+            return
+        stats = self.progress_tracker.update(sampler.accepted, sampler.tested)
+        for display in self.progress_displays():
+            display.show(stats)
+        self.progress_ticks += 1
+        if self.server is not None:
+            progress = {
+                "accepted": max(sampler.accepted, 0),
+                "tested": sampler.tested,
+                "sample_count": sampler.sample_count,
+                "accepted_rate": stats.accepted_rate,
+                "tested_rate": stats.tested_rate,
+                "eta": None if stats.eta == float("inf") else stats.eta,
+            }
+            if (
+                sampler.mode == "grid"
+                and self.progress_ticks % self.PUBLISH_INTERVAL_TICKS == 0
+            ):
+                first, all_ = sampler.partial_result()
+                self.server.state.publish(first, all_, progress=progress)
+            else:
+                self.server.state.publish(progress=progress)
+        if sampler.is_alive():
+            self.progress_job = self.after(
+                self.PROGRESS_INTERVAL_MS, self.progress_handler
+            )
+            return
+        self.sampler = None
+        # nothing here views the worker's shared memory past this point
+        sampler.release()
+        if sampler.result is None:
+            self.logger.error("Generation failed")
+            return
+        if sampler.exact:
+            self.logger.info("Integrated exact distribution")
+            finish_text = f"Done in {sampler.elapsed:.1f}s | exact"
+        elif sampler.impossible:
+            self.logger.warning(
+                "No seeds passed the conditions after %d tests", sampler.tested
+            )
+            finish_text = f"No valid seeds found in {sampler.tested} tested"
+        else:
+            budget_text = (
+                ""
+                if sampler.cpu_budget is None
+                else f" within a {sampler.cpu_budget*100:.0f}% CPU budget"
+            )
+            self.logger.info(
+                "Finished generation at %.0f accepted/s%s",
+                sampler.accepted_rate,
+                budget_text,
+            )
+            finish_text = (
+                f"Done in {sampler.elapsed:.1f}s | "
+                f"{sampler.accepted_rate:,.0f} accepted/s{budget_text} | "
+                f"ratio {stats.acceptance_ratio:.3g}"
+            )
+        for display in self.progress_displays():
+            display.finish(finish_text)
+        if sampler.mode == "angle":
+            self.set_angle_distributions(*sampler.result, sampler.sample_count)
+            return
+        self.set_distributions(
+            *sampler.result,
+            sampler.sample_count,
+            sampler.accepted_samples(),
+            sampler.accepted_seeds(),
+        )
+        if not sampler.impossible:
+            self.history.put(
+                sampler.condition_set.key,
+                *sampler.result,
+                sampler.sample_count,
+                sampler.accepted_samples(),
+                sampler.accepted_seeds(),
+            )
+        if self.speculation.get() and not sampler.impossible:
+            self.speculator.speculate(
+                sampler.conditions,
+                sampler.sample_count,
+                thread_count=sampler.thread_count,
+                **self.sampler_settings(),
+            )
+
+    def release_samplers(self, timeout: float = 0.0):
+        """Release the retired samplers that have stopped, waiting up to timeout for each"""
+        for sampler in self.retired_samplers:
+            sampler.join(timeout)
+        self.retired_samplers = [
+            sampler for sampler in self.retired_samplers if not sampler.release()
+        ]
 
     def maximum_distance_handler(self, distance):
         """Handler to be called any time the maximum distance changes"""
@@ -523,8 +1530,19 @@ class MainApplication(ctk.CTk):
         else:
             for setting, keycombo in self.config.get("keybinds", {}).items():
                 if all(self.held_keys[key] for key in keycombo):
+                    if self.recorder is not None:
+                        self.recorder.record("keybind", setting)
                     if setting == "Reset":
+                        self.eye_throws.clear()
                         self.divine_condition_list.clear()
+                    elif setting == "Not Found at Overall":
+                        self.exclude_overall()
+                    elif setting == "Undo":
+                        self.divine_condition_list.undo()
+                    elif setting == "Redo":
+                        self.divine_condition_list.redo()
+                    elif setting == "Advise Next Observation":
+                        self.advise_next_observation()
                     elif setting == "Toggle Clipboard Listener":
                         self.clipboard_listener.listening = (
                             not self.clipboard_listener.listening
@@ -539,77 +1557,31 @@ class MainApplication(ctk.CTk):
     def clipboard_handler(self, clipboard):
         """Handler to be called every time the clipboard contents change"""
         self.logger.debug("New clipboard: %r", clipboard)
-        # f3+i
-        if clipboard.startswith("/setblock"):
-            self.logger.info("f3+i detected, %r", clipboard)
-            _, x, _, z, full_block = clipboard.split(" ")
-            x, z = int(x), int(z)
-            block_name, *_ = full_block.split("[")
-            if block_name == "minecraft:chest":
-                self.logger.info(
-                    "Buried treasure logged chunk_x=%d, chunk_z=%d", x >> 4, z >> 4
-                )
-                self.divine_condition_list.add_buried_treasure_condition(x >> 4, z >> 4)
-            elif 0 <= x <= 15 and 0 <= z <= 15:
-                if "log" in block_name:
-                    self.logger.info("10%% 80k decorator logged z=%d", z)
-                    self.divine_condition_list.add_chance_decorator_condition(z)
-                elif block_name in (
-                    "minecraft:bone_block",
-                    "minecraft:soul_sand",
-                    "minecraft:soul_soil",
-                ):
-                    self.logger.info("Nether fossil logged x=%d", x)
-                    self.divine_condition_list.add_nether_fossil_condition(x)
-                elif block_name in (
-                    "minecraft:clay",
-                    "minecraft:gravel",
-                    "minecraft:sand",
-                ):
-                    self.logger.info("60k %s disk logged x=%d", block_name, x)
-                    self.divine_condition_list.add_disk_decorator_condition(x)
-                else:
-                    self.logger.info("80k decorator logged %d", x)
-                    self.divine_condition_list.add_decorator_condition(x)
-        elif clipboard.startswith("/execute"):
-            _, _, _, _, _, _, _, _, _, yaw, _ = clipboard.split(" ")
-            yaw = float(yaw) % 360
-            yaw = yaw if yaw <= 180.0 else yaw - 360
-            if yaw > 135 or yaw < -135:
-                portal_orientation = 1
-            elif yaw <= -45:
-                portal_orientation = 0
-            elif yaw <= 45:
-                portal_orientation = 3
-            elif yaw <= 135:
-                portal_orientation = 2
-            first_portal_logged = False
-            # check all conditions for a rand(4) and assume its portal orientation
-            for condition in self.divine_condition_list.conditions:
-                if condition.int_maximum == 4:
-                    first_portal_logged = True
-                    break
-            direction = ("East", "North", "West", "South")[portal_orientation]
-            if not first_portal_logged:
-                self.logger.info("First Portal orientation logged %s", direction)
-                self.divine_condition_list.add_condition(
-                    build_first_portal_condition(portal_orientation),
-                    name=f"First Portal {direction}",
-                    display_float_rand=False,
-                    display_int_rand=False,
-                    display_salt=False,
-                )
-            else:
-                self.logger.info("Third Portal orientation logged %s", direction)
-                self.divine_condition_list.add_condition(
-                    build_third_portal_condition(portal_orientation),
-                    name=f"Third Portal {direction}",
-                    display_float_rand=False,
-                    display_int_rand=False,
-                    display_salt=False,
-                )
+        if self.recorder is not None:
+            self.recorder.record("clipboard", clipboard)
+        action = apply_clipboard(
+            clipboard,
+            self.divine_condition_list.conditions,
+            self.eye_throws,
+            self.eye_throw_mode.get(),
+        )
+        if action is None:
+            return
+        self.logger.info(action.message)
+        if action.throw is not None:
+            self.draw_heatmap(new_data=False)
+            return
+        self.divine_condition_list.add_condition(
+            action.condition,
+            name=action.name,
+            display_float_rand=False,
+            display_int_rand=False,
+            display_salt=False,
+        )
 
 
 if __name__ == "__main__":
+    # frozen builds must run the spawned sampler worker instead of the gui
+    multiprocessing.freeze_support()
     app = MainApplication()
     app.mainloop()
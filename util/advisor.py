@@ -0,0 +1,256 @@
+"""Ranking of the observations a runner could make next by what they would tell us"""
+
+import argparse
+from typing import NamedTuple
+
+import numpy as np
+
+from . import vectorized
+from .condition_model import GenericCondition
+from .kernels import fft_convolve, radial_kernel
+from .speculation import LAVA_POOL, WATER_POOL
+
+# heatmap cells per side of an advisor cell, 32 nether blocks
+ADVISOR_CELL_SIZE = 4
+# advisor cells per side of a heatmap
+ADVISOR_GRID_SIZE = -(-701 // ADVISOR_CELL_SIZE)
+# heatmap cells per side of the cells the information gain is measured over
+INFORMATION_CELL_SIZE = 16
+# samples the advice is computed from, a fixed subset of larger clouds
+MAXIMUM_ADVISOR_SAMPLES = 200_000
+PORTAL_DIRECTIONS = ("East", "North", "West", "South")
+
+
+class Observation(NamedTuple):
+    """
+    Something that can be checked in game, whose outcome is the rng call of
+    a generator salted with salt
+
+    float_maximum 0.0 observes a rand(int_maximum), int_maximum 0 whether a
+    float rand is below float_maximum, and both a float chance followed by a
+    rand(int_maximum) if the chance passed, the failed chance being the last
+    outcome
+    """
+
+    name: str
+    salt: int
+    int_maximum: int
+    float_maximum: float
+    outcome_names: tuple
+
+    def outcome_labels(self, seeds: np.ndarray) -> np.ndarray:
+        """Index of the outcome each seed would show"""
+        states = vectorized.init(np.asarray(seeds, np.int64) + np.int64(self.salt))
+        if self.float_maximum == 0.0:
+            return vectorized.next_int(states, self.int_maximum)[1]
+        states, chance_rand = vectorized.next_float(states)
+        float_maximum = np.float32(self.float_maximum)
+        if self.int_maximum == 0:
+            return (chance_rand < float_maximum).astype(np.int64)
+        values = vectorized.next_int(vectorized.next_seed(states), self.int_maximum)[1]
+        # the int of a failed chance is never seen
+        return np.where(chance_rand > float_maximum, self.int_maximum, values)
+
+    def outcome_condition(self, outcome: int) -> GenericCondition:
+        """Condition logging an outcome"""
+        if self.float_maximum == 0.0:
+            return GenericCondition(self.salt, self.int_maximum, outcome, 0.0)
+        if self.int_maximum == 0:
+            return GenericCondition(
+                self.salt, 0, 0, self.float_maximum if outcome else -self.float_maximum
+            )
+        if outcome == self.int_maximum:
+            return GenericCondition(self.salt, 0, 0, -self.float_maximum)
+        return GenericCondition(
+            self.salt, self.int_maximum, outcome, self.float_maximum
+        )
+
+    def observed_by(self, condition) -> bool:
+        """Whether a logged condition already fixes the outcome"""
+        salt, int_maximum, _, float_maximum = condition
+        return (
+            salt == self.salt
+            and abs(float_maximum) == self.float_maximum
+            and int_maximum in (self.int_maximum, 0)
+        )
+
+
+# the catalog of the Portal Orientation and Chunk 0,0 menus
+OBSERVATIONS = (
+    Observation("First Portal", 0, 4, 0.0, PORTAL_DIRECTIONS),
+    # the third portal doesn't use the float rand but consumes it, so its
+    # chance always passes
+    Observation("Third Portal", 0, 4, 2.0, PORTAL_DIRECTIONS),
+    Observation(
+        "Water Pool", WATER_POOL.salt, 0, WATER_POOL.float_maximum, ("None", "Water")
+    ),
+    Observation(
+        "Lava Pool", LAVA_POOL.salt, 0, LAVA_POOL.float_maximum, ("None", "Lava")
+    ),
+    Observation("Nether Fossil X", 0, 16, 0.0, tuple(f"X {x}" for x in range(16))),
+    Observation(
+        "80k Chance Decorator Z",
+        80000,
+        16,
+        0.1,
+        tuple(f"Z {z}" for z in range(16)) + ("None",),
+    ),
+    Observation("80k Decorator X", 80000, 16, 0.0, tuple(f"X {x}" for x in range(16))),
+    Observation(
+        "60k Disk Decorator X", 60000, 16, 0.0, tuple(f"X {x}" for x in range(16))
+    ),
+)
+
+
+class Advice(NamedTuple):
+    """Expected value of making an observation"""
+
+    observation: Observation
+    # expected best point score once the outcome is known, minus the current one
+    score_gain: float
+    # mutual information between the outcome and the first stronghold's cell
+    information: float
+    # probability of each outcome
+    probabilities: np.ndarray
+
+    def summary(self) -> str:
+        """One line description"""
+        likely = np.argsort(self.probabilities)[::-1][:2]
+        return (
+            f"{self.observation.name}: +{self.score_gain*100:.2f}% score, "
+            f"{self.information:.2f} bits (likeliest "
+            + ", ".join(
+                f"{self.observation.outcome_names[outcome]} "
+                f"{self.probabilities[outcome]*100:.0f}%"
+                for outcome in likely
+            )
+            + ")"
+        )
+
+
+def best_scores(
+    cells: np.ndarray, labels: np.ndarray, outcome_count: int, kernel, counts
+) -> np.ndarray:
+    """
+    Best point score of the samples of each outcome, scored like the all
+    strongholds heatmap on advisor cells
+    """
+    size = ADVISOR_GRID_SIZE * ADVISOR_GRID_SIZE
+    histograms = np.bincount(
+        (labels[:, None] * size + cells).ravel(), minlength=outcome_count * size
+    ).reshape(outcome_count, ADVISOR_GRID_SIZE, ADVISOR_GRID_SIZE)
+    scores = np.zeros(outcome_count)
+    for outcome in np.flatnonzero(counts):
+        scores[outcome] = (
+            fft_convolve(histograms[outcome].astype(np.float64), kernel).max()
+            / counts[outcome]
+        )
+    return scores
+
+
+def mutual_information(first_cells: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Bits of information an outcome gives on the first stronghold's cell, less
+    the Miller-Madow estimate of the plug-in bias so tiny outcomes don't win
+    """
+    _, cells = np.unique(first_cells, return_inverse=True)
+    cell_count = int(cells.max()) + 1
+    outcome_count = int(labels.max()) + 1
+    joint = np.bincount(
+        labels * cell_count + cells, minlength=outcome_count * cell_count
+    ).reshape(outcome_count, cell_count) / len(labels)
+    outcomes = joint.sum(axis=1, keepdims=True)
+    positions = joint.sum(axis=0, keepdims=True)
+    nonzero = joint > 0
+    information = np.sum(
+        joint[nonzero] * np.log2(joint[nonzero] / (outcomes @ positions)[nonzero])
+    )
+    bias = (
+        (np.count_nonzero(outcomes) - 1)
+        * (np.count_nonzero(positions) - 1)
+        / (2 * len(labels) * np.log(2))
+    )
+    return max(float(information - bias), 0.0)
+
+
+def advise(
+    samples: np.ndarray,
+    seeds: np.ndarray,
+    conditions=(),
+    radius: float = 500 / 8,
+    kernel: str = "disk",
+    observations=OBSERVATIONS,
+) -> list[Advice]:
+    """
+    Advice for each observation not fixed by conditions, most valuable first,
+    computed from (n, 3, 2) start chunks of accepted samples and their seeds
+
+    radius is in heatmap cells like the maximum distance slider / 8
+    """
+    conditions = tuple(conditions)
+    if len(samples) > MAXIMUM_ADVISOR_SAMPLES:
+        subset = np.random.default_rng(0).choice(
+            len(samples), MAXIMUM_ADVISOR_SAMPLES, replace=False
+        )
+        samples, seeds = samples[subset], seeds[subset]
+    if not len(samples):
+        return []
+    heatmap = samples.astype(np.int64) * 2 + 350
+    coarse = heatmap // ADVISOR_CELL_SIZE
+    cells = coarse[:, :, 0] + ADVISOR_GRID_SIZE * coarse[:, :, 1]
+    fine = heatmap[:, 0] // INFORMATION_CELL_SIZE
+    first_cells = fine[:, 0] + 701 * fine[:, 1]
+    kernel = radial_kernel(kernel, radius / ADVISOR_CELL_SIZE)
+    current = best_scores(
+        cells, np.zeros(len(samples), np.int64), 1, kernel, np.array([len(samples)])
+    )[0]
+    advice = []
+    for observation in observations:
+        if any(observation.observed_by(condition) for condition in conditions):
+            continue
+        labels = observation.outcome_labels(seeds)
+        outcome_count = int(labels.max()) + 1
+        counts = np.bincount(labels, minlength=outcome_count)
+        probabilities = counts / len(labels)
+        scores = best_scores(cells, labels, outcome_count, kernel, counts)
+        advice.append(
+            Advice(
+                observation,
+                float(probabilities @ scores - current),
+                mutual_information(first_cells, labels),
+                probabilities,
+            )
+        )
+    advice.sort(key=lambda item: (item.score_gain, item.information), reverse=True)
+    return advice
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from .condition_model import build_first_portal_condition
+    from .sampler import SamplerThread
+
+    parser = argparse.ArgumentParser(
+        description="Rank the next observations after logging a first portal"
+    )
+    parser.add_argument("--direction", type=int, default=0, choices=range(4))
+    parser.add_argument("--sample-count", type=int, default=1_000_000)
+    parser.add_argument("--maximum-distance", type=float, default=500.0)
+    parser.add_argument("--kernel", default="disk")
+    args = parser.parse_args()
+    conditions = (build_first_portal_condition(args.direction),)
+    sampler = SamplerThread(args.sample_count, 1, conditions)
+    sampler.run()
+    start = perf_counter()
+    ranked = advise(
+        sampler.accepted_samples(),
+        sampler.accepted_seeds(),
+        conditions,
+        args.maximum_distance / 8,
+        args.kernel,
+    )
+    elapsed = perf_counter() - start
+    for item in ranked:
+        print(item.summary())
+    print(f"Advised in {elapsed*1000:.0f}ms")
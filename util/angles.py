@@ -0,0 +1,345 @@
+"""Angle-only stronghold distributions for picking a nether travel heading"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from . import vectorized
+from .seed_stream import counter_seeds, new_key
+
+try:
+    import numba
+    from numba_progress.numba_atomic import atomic_add, atomic_min
+
+    from . import conditions, java_random
+    from .heatmap import CHUNK_SIZE, claim_chunk, reserve_quota
+    from .seed_stream import counter_seed
+except ImportError:
+    numba = None
+
+# 0.5 degree angle bins
+ANGLE_BINS = 720
+# 1 chunk bins over the [88, 168) chunk distance range of the first ring
+DISTANCE_BINS = 80
+MINIMUM_RING_DISTANCE = 88
+# mean distance of the first ring in blocks
+MEAN_RING_DISTANCE = 128 * 16
+# fraction of a quadrant's probability the confidence arc must contain
+CONFIDENCE = 0.5
+# seeds tested per thread with no accepted samples before giving up
+IMPOSSIBLE_TEST_COUNT = 100000
+QUADRANTS = {
+    # name: range of the generator angle in degrees
+    "--": (180, 270),
+    "-+": (90, 180),
+    "+-": (270, 360),
+    "++": (0, 90),
+}
+
+
+class Heading(NamedTuple):
+    """Best heading within a range of angles"""
+
+    angle: float
+    score: float
+    arc: tuple[float, float]
+    distance: float
+
+    @property
+    def yaw(self) -> float:
+        """Minecraft yaw facing the heading"""
+        return (self.angle - 90 + 180) % 360 - 180
+
+    @property
+    def coords(self) -> tuple[int, int]:
+        """Nether coordinates at the given distance along the heading"""
+        angle = np.radians(self.angle)
+        return (
+            round(np.cos(angle) * self.distance / 8),
+            round(np.sin(angle) * self.distance / 8),
+        )
+
+
+if numba is not None:
+
+    @numba.njit(
+        numba.void(
+            numba.int64[:],
+            numba.int64[:],
+            numba.int64[:],
+            numba.int64,
+            numba.int64,
+            conditions.numba_ConditionArrays,
+            numba.uint64[:],
+            numba.uint64[:],
+            numba.uint64[:],
+            numba.int64,
+            numba.uint64,
+        ),
+        nogil=True,
+    )
+    def sample_angle_chunks(
+        progress,
+        claimed,
+        reserved,
+        count,
+        thread_count,
+        divine_conditions,
+        first_angles,
+        all_angles,
+        distances,
+        tested_limit,
+        seed_key,
+    ):
+        """One worker of accumulate_angles, sampling claimed blocks until done"""
+        angle_bins = np.empty(CHUNK_SIZE, dtype=np.int64)
+        distance_bins = np.empty(CHUNK_SIZE, dtype=np.int64)
+        while atomic_add(progress, 0, 0) >= 0 and atomic_add(reserved, 0, 0) < count:
+            start, end = claim_chunk(
+                claimed, reserved, count, thread_count, tested_limit
+            )
+            if start >= end:
+                return
+            accepted = 0
+            for index in range(start, end):
+                seed = counter_seed(seed_key, index)
+                if not conditions.test_condition_arrays(seed, divine_conditions):
+                    continue
+                state = java_random.init(seed)
+                state, rand_0 = java_random.next_double(state)
+                state, rand_1 = java_random.next_double(state)
+                angle_bins[accepted] = np.int64(rand_0 * ANGLE_BINS)
+                distance_bins[accepted] = np.int64(rand_1 * DISTANCE_BINS)
+                accepted += 1
+            tested_count = atomic_add(progress, 1, end - start) + end - start
+            if accepted == 0:
+                # assume impossible
+                if (
+                    tested_count > IMPOSSIBLE_TEST_COUNT * thread_count
+                    and atomic_add(reserved, 0, 0) == 0
+                ):
+                    atomic_min(progress, 0, -1)
+                continue
+
+            _, kept = reserve_quota(reserved, count, accepted)
+            for i in range(kept):
+                atomic_add(first_angles, angle_bins[i], 1)
+                for j in range(3):
+                    atomic_add(
+                        all_angles,
+                        (angle_bins[i] + j * ANGLE_BINS // 3) % ANGLE_BINS,
+                        1,
+                    )
+                atomic_add(distances, distance_bins[i], 1)
+            atomic_add(progress, 0, kept)
+
+    @numba.njit(
+        numba.void(
+            numba.int64[:],
+            numba.uint64,
+            numba.uint64,
+            conditions.numba_ConditionArrays,
+            numba.uint64[:],
+            numba.uint64[:],
+            numba.uint64[:],
+            numba.int64,
+            numba.uint64,
+        ),
+        nogil=True,
+        parallel=True,
+    )
+    def accumulate_angles(
+        progress,
+        count,
+        thread_count,
+        divine_conditions,
+        first_angles,
+        all_angles,
+        distances,
+        tested_limit,
+        seed_key,
+    ):
+        """
+        Add the ring angle and first stronghold distance of seeds passing all
+        divine conditions to 1d histograms, with the same progress protocol and
+        block scheduling as heatmap.accumulate_data
+
+        Angles are binned straight from the generator's rand so no trig is needed
+        """
+        claimed = progress[1:].copy()
+        reserved = progress[:1].copy()
+        for _ in numba.prange(thread_count):
+            sample_angle_chunks(
+                progress,
+                claimed,
+                reserved,
+                np.int64(count),
+                np.int64(thread_count),
+                divine_conditions,
+                first_angles,
+                all_angles,
+                distances,
+                tested_limit,
+                seed_key,
+            )
+
+
+def accumulate_angles_vectorized(
+    progress,
+    count,
+    divine_conditions,
+    first_angles,
+    all_angles,
+    distances,
+    tested_limit=np.iinfo(np.int64).max,
+    seed_key=None,
+    chunk_size=vectorized.DEFAULT_CHUNK_SIZE,
+):
+    """Array equivalent of accumulate_angles"""
+    if seed_key is None:
+        seed_key = new_key()
+    divine_conditions = tuple(divine_conditions)
+    while 0 <= progress[0] < count and progress[1] < tested_limit:
+        size = int(min(chunk_size, tested_limit - progress[1]))
+        seeds = counter_seeds(seed_key, progress[1], size)
+        accepted = np.flatnonzero(
+            vectorized.test_all_conditions(seeds, divine_conditions)
+        )
+        remaining = count - progress[0]
+        if accepted.size > remaining:
+            size = int(accepted[remaining - 1]) + 1
+            accepted = accepted[:remaining]
+        progress[1] += size
+        if not accepted.size:
+            if progress[0] == 0 and progress[1] > vectorized.IMPOSSIBLE_TEST_COUNT:
+                progress[0] = -1
+            continue
+        states, rand_0 = vectorized.next_double(vectorized.init(seeds[accepted]))
+        rand_1 = vectorized.next_double(states)[1]
+        angle_bins = (rand_0 * ANGLE_BINS).astype(np.int64)
+        first_angles += np.bincount(angle_bins, minlength=ANGLE_BINS).astype(np.uint64)
+        for i in range(3):
+            all_angles += np.bincount(
+                (angle_bins + i * ANGLE_BINS // 3) % ANGLE_BINS, minlength=ANGLE_BINS
+            ).astype(np.uint64)
+        distances += np.bincount(
+            (rand_1 * DISTANCE_BINS).astype(np.int64), minlength=DISTANCE_BINS
+        ).astype(np.uint64)
+        progress[0] += accepted.size
+
+
+def interval_histogram(intervals, bins: int) -> np.ndarray:
+    """Histogram of a uniform distribution over [low, high) intervals of [0, 1)"""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    histogram = np.zeros(bins, np.float64)
+    for low, high in intervals:
+        histogram += np.clip(
+            np.minimum(edges[1:], high) - np.maximum(edges[:-1], low), 0.0, None
+        )
+    return histogram / histogram.sum()
+
+
+def exact_angles(divine_conditions):
+    """
+    Exact normalized (first angles, all angles, distances) histograms of a
+    salt 0 condition set, or None if unsupported or impossible
+    """
+    from .exact import exact_constraints
+
+    constraints = exact_constraints(divine_conditions)
+    if constraints is None:
+        return None
+    angle_intervals, distance_interval = constraints
+    if (
+        sum(high - low for low, high in angle_intervals) <= 0
+        or distance_interval[1] <= distance_interval[0]
+    ):
+        return None
+    first_angles = interval_histogram(angle_intervals, ANGLE_BINS)
+    all_angles = sum(np.roll(first_angles, i * ANGLE_BINS // 3) for i in range(3))
+    return (
+        first_angles,
+        all_angles,
+        interval_histogram((distance_interval,), DISTANCE_BINS),
+    )
+
+
+def window_half_width(maximum_distance: float) -> int:
+    """Half width in bins of the angle window reaching maximum_distance blocks off the ring"""
+    return max(
+        0,
+        round(
+            np.degrees(np.arctan2(maximum_distance, MEAN_RING_DISTANCE))
+            * ANGLE_BINS
+            / 360
+        ),
+    )
+
+
+def smooth_angles(histogram: np.ndarray, half_width: int) -> np.ndarray:
+    """Circularly convolve an angle histogram with a box of the given half width"""
+    kernel = np.zeros(len(histogram))
+    kernel[: half_width + 1] = 1
+    if half_width:
+        kernel[-half_width:] = 1
+    return np.fft.irfft(np.fft.rfft(histogram) * np.fft.rfft(kernel), n=len(histogram))
+
+
+def confidence_arc(histogram, peak: int, confidence=CONFIDENCE):
+    """
+    Grow a contiguous arc of bins from peak, always taking the more likely
+    neighbour, until it holds confidence of the histogram's probability
+    """
+    target = histogram.sum() * confidence
+    start = end = peak
+    mass = histogram[peak]
+    while mass < target and (start > 0 or end < len(histogram) - 1):
+        below = histogram[start - 1] if start > 0 else -1.0
+        above = histogram[end + 1] if end < len(histogram) - 1 else -1.0
+        if above >= below:
+            end += 1
+            mass += above
+        else:
+            start -= 1
+            mass += below
+    return start, end + 1
+
+
+def median_distance(distances: np.ndarray) -> float:
+    """Median first ring distance in blocks"""
+    cumulative = np.cumsum(distances)
+    if cumulative[-1] <= 0:
+        return float(MEAN_RING_DISTANCE)
+    index = np.searchsorted(cumulative, cumulative[-1] / 2)
+    return float((MINIMUM_RING_DISTANCE + index + 0.5) * 16)
+
+
+def best_headings(all_angles, distances, maximum_distance: float) -> dict:
+    """
+    Best overall and per quadrant headings from normalized angle histograms,
+    scoring each heading by the probability of a stronghold within the window
+    """
+    smoothed = smooth_angles(all_angles, window_half_width(maximum_distance))
+    distance = median_distance(distances)
+
+    def heading(low, high):
+        start = low * ANGLE_BINS // 360
+        width = (high - low) * ANGLE_BINS // 360
+        # rotate so the range starts at bin 0 and can't wrap
+        window = np.roll(smoothed, -start)[:width]
+        peak = int(np.argmax(window))
+        arc_start, arc_end = confidence_arc(np.roll(all_angles, -start)[:width], peak)
+        arc_low = ((start + arc_start) * 360 / ANGLE_BINS) % 360
+        return Heading(
+            ((start + peak + 0.5) * 360 / ANGLE_BINS) % 360,
+            float(window[peak]),
+            (arc_low, arc_low + (arc_end - arc_start) * 360 / ANGLE_BINS),
+            distance,
+        )
+
+    overall_peak = (int(np.argmax(smoothed)) * 360) // ANGLE_BINS
+    return {
+        # a single stronghold's sector around the overall peak
+        "overall": heading(overall_peak - 60, overall_peak + 60),
+        "quadrants": {name: heading(*bounds) for name, bounds in QUADRANTS.items()},
+    }
@@ -0,0 +1,108 @@
+"""Memory-bounded caches of generated stronghold distributions"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+
+import numpy as np
+
+
+class CachedResult(NamedTuple):
+    """Raw histograms of a finished generation run"""
+
+    first_stronghold_locations: np.ndarray
+    all_stronghold_locations: np.ndarray
+    sample_count: int
+    # (n, 3, 2) start chunks of the accepted samples, if they were kept
+    samples: np.ndarray = None
+    # seeds of the kept samples, row for row
+    seeds: np.ndarray = None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the histograms and samples"""
+        return (
+            self.first_stronghold_locations.nbytes
+            + self.all_stronghold_locations.nbytes
+            + (0 if self.samples is None else self.samples.nbytes)
+            + (0 if self.seeds is None else self.seeds.nbytes)
+        )
+
+    def distributions(self):
+        """Histograms normalized by the sample count"""
+        return (
+            self.first_stronghold_locations / self.sample_count,
+            self.all_stronghold_locations / self.sample_count,
+        )
+
+
+def compact_histogram(histogram: np.ndarray) -> np.ndarray:
+    """Copy a histogram into the smallest unsigned dtype that fits its counts"""
+    if not np.issubdtype(histogram.dtype, np.integer):
+        # exact distributions are not counts
+        return histogram.astype(np.float32)
+    maximum = int(histogram.max()) if histogram.size else 0
+    for dtype in (np.uint16, np.uint32):
+        if maximum <= np.iinfo(dtype).max:
+            return histogram.astype(dtype)
+    return histogram.copy()
+
+
+class ResultCache:
+    """Thread-safe LRU of condition key -> CachedResult bounded by total memory"""
+
+    def __init__(self, maximum_bytes: int) -> None:
+        self.maximum_bytes = maximum_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, minimum_sample_count: int = 0) -> CachedResult:
+        """Return the result for key if it has enough samples, marking it recently used"""
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None or result.sample_count < minimum_sample_count:
+                return None
+            self.entries.move_to_end(key)
+            return result
+
+    def put(
+        self,
+        key,
+        first_stronghold_locations,
+        all_stronghold_locations,
+        sample_count,
+        samples=None,
+        seeds=None,
+    ):
+        """Store compacted copies of the histograms, evicting the least recently used"""
+        kept = samples is not None and len(samples)
+        result = CachedResult(
+            compact_histogram(first_stronghold_locations),
+            compact_histogram(all_stronghold_locations),
+            sample_count,
+            samples.copy() if kept else None,
+            seeds.copy() if kept and seeds is not None else None,
+        )
+        if result.nbytes > self.maximum_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+            self.entries[key] = result
+            self.nbytes += result.nbytes
+            while self.nbytes > self.maximum_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        """Remove all entries"""
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
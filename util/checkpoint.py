@@ -0,0 +1,271 @@
+"""Atomic on-disk checkpoints of long sampling runs and resuming them exactly"""
+
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from .cache import compact_histogram
+from .condition_model import GenericCondition, condition_key
+
+CHECKPOINT_VERSION = 3
+# seconds between checkpoints
+CHECKPOINT_INTERVAL = 60.0
+# checkpoints are spaced out further if writing them takes more than this
+# fraction of the run's wall time
+MAX_IO_FRACTION = 0.01
+# runs this large are checkpointed when enabled
+CHECKPOINT_MINIMUM_SAMPLES = 10_000_000
+
+
+def samples_path(path: str) -> str:
+    """Append-only file of the kept samples next to a checkpoint"""
+    return path + ".samples"
+
+
+def seeds_path(path: str) -> str:
+    """Append-only file of the kept samples' seeds next to a checkpoint"""
+    return path + ".seeds"
+
+
+def run_log_path(path: str) -> str:
+    """
+    Sample log of a checkpointed run next to its checkpoint, appended to the
+    shared log of its conditions once the run finishes
+    """
+    return path + ".log"
+
+
+def write_atomic(path: str, arrays: dict):
+    """Write an npz to a temporary file and move it over path once it is on disk"""
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class Checkpointer:
+    """Periodically saves a sampler's progress so the run survives being closed"""
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = CHECKPOINT_INTERVAL,
+        saved_rows: int = 0,
+        log_records: int = None,
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        # kept samples already in the samples file
+        self.saved_rows = saved_rows
+        # records in the run's own sample log as of the checkpoint, if it has one
+        self.log_records = log_records
+        self.due = perf_counter() + interval
+        self.last_duration = 0.0
+        self.last_bytes = 0
+
+    def maybe_save(self, sampler) -> bool:
+        """Save if a checkpoint is due, only call between bursts"""
+        if perf_counter() < self.due:
+            return False
+        self.save(sampler)
+        return True
+
+    def save(self, sampler):
+        """Save the sampler's state, which must not be changing"""
+        start = perf_counter()
+        # the log is flushed along with every checkpoint so a resumed run
+        # knows exactly which of its samples were logged
+        sampler.flush_log(0)
+        progress = sampler.progress.copy()
+        kept_rows = len(sampler.accepted_samples())
+        written = 0
+        # only the samples accepted since the last checkpoint are written, past
+        # any rows left over from a checkpoint that never completed
+        for path, rows in (
+            (samples_path(self.path), sampler.samples),
+            (seeds_path(self.path), sampler.seeds),
+        ):
+            row_bytes = rows.itemsize * int(np.prod(rows.shape[1:]))
+            with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+                file.seek(self.saved_rows * row_bytes)
+                file.write(rows[self.saved_rows : kept_rows].tobytes())
+                file.truncate()
+                file.flush()
+                os.fsync(file.fileno())
+            written += (kept_rows - self.saved_rows) * row_bytes
+        arrays = {
+            "version": np.int64(CHECKPOINT_VERSION),
+            "settings": np.str_(json.dumps(checkpoint_settings(sampler))),
+            "progress": progress,
+            "kept_rows": np.int64(kept_rows),
+            "log_records": np.int64(
+                -1 if sampler.sample_log is None else len(sampler.sample_log)
+            ),
+        }
+        # heatmaps are mostly empty, store the nonzero cells in the smallest dtype
+        for i, histogram in enumerate(sampler.histograms):
+            indices = np.flatnonzero(histogram)
+            arrays[f"indices_{i}"] = indices.astype(np.uint32)
+            arrays[f"counts_{i}"] = compact_histogram(histogram[indices])
+        write_atomic(self.path, arrays)
+        self.saved_rows = kept_rows
+        self.last_bytes = written + sum(array.nbytes for array in arrays.values())
+        self.last_duration = perf_counter() - start
+        self.due = perf_counter() + max(
+            self.interval, self.last_duration / MAX_IO_FRACTION
+        )
+
+    def remove(self):
+        """Delete the checkpoint once the run is complete"""
+        for path in (self.path, samples_path(self.path), seeds_path(self.path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def checkpoint_settings(sampler) -> dict:
+    """SamplerThread keyword arguments needed to continue the same run"""
+    return {
+        "sample_count": sampler.sample_count,
+        "thread_count": sampler.thread_count,
+        "conditions": [
+            [int(salt), int(int_maximum), int(int_value), float(float_maximum)]
+            for salt, int_maximum, int_value, float_maximum in sampler.conditions
+        ],
+        "engine": sampler.engine,
+        "mode": sampler.mode,
+        "seed_key": sampler.seed_key,
+    }
+
+
+def read_settings(path: str) -> dict:
+    """Settings of the run saved in a checkpoint, or None if there is none"""
+    try:
+        with np.load(path) as checkpoint:
+            if int(checkpoint["version"]) != CHECKPOINT_VERSION:
+                return None
+            return json.loads(str(checkpoint["settings"]))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def resumable(path: str, sample_count, conditions, mode: str) -> bool:
+    """Whether path holds an unfinished run of the same distribution"""
+    settings = read_settings(path)
+    return (
+        settings is not None
+        and settings["sample_count"] == sample_count
+        and settings["mode"] == mode
+        # reordered or repeated conditions are still the same distribution
+        and condition_key(settings["conditions"]) == condition_key(conditions)
+    )
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    SamplerThread keyword arguments continuing the run saved at path,
+    including its buffers and a Checkpointer to keep checkpointing to it
+    """
+    from .sampler import histogram_shapes, sample_rows
+
+    settings = read_settings(path)
+    if settings is None:
+        return None
+    with np.load(path) as checkpoint:
+        progress = checkpoint["progress"].copy()
+        kept_rows = int(checkpoint["kept_rows"])
+        log_records = (
+            int(checkpoint["log_records"]) if "log_records" in checkpoint else -1
+        )
+        histograms = []
+        for i, shape in enumerate(histogram_shapes(settings["mode"])):
+            histogram = np.zeros(int(np.prod(shape)), np.uint64)
+            histogram[checkpoint[f"indices_{i}"]] = checkpoint[f"counts_{i}"]
+            histograms.append(histogram)
+    samples = np.zeros(
+        (
+            sample_rows(settings["mode"], settings["sample_count"]),
+            3,
+            2,
+        ),
+        np.int16,
+    )
+    seeds = np.zeros(len(samples), np.int64)
+    if kept_rows:
+        samples[:kept_rows] = np.fromfile(
+            samples_path(path), np.int16, kept_rows * 3 * 2
+        ).reshape(-1, 3, 2)
+        seeds[:kept_rows] = np.fromfile(seeds_path(path), np.int64, kept_rows)
+    settings["conditions"] = tuple(
+        GenericCondition(*condition) for condition in settings["conditions"]
+    )
+    settings["buffers"] = (progress, tuple(histograms), samples)
+    settings["seeds"] = seeds
+    settings["checkpoint"] = Checkpointer(
+        path, saved_rows=kept_rows, log_records=None if log_records < 0 else log_records
+    )
+    return settings
+
+
+if __name__ == "__main__":
+    from .sampler import SamplerThread
+
+    parser = argparse.ArgumentParser(
+        description="Run or resume a checkpointed reference heatmap"
+    )
+    parser.add_argument("checkpoint", help="checkpoint file, resumed if it exists")
+    parser.add_argument("--output", default="heatmap.npz")
+    parser.add_argument("--sample-count", type=int, default=100_000_000)
+    parser.add_argument("--thread-count", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--condition",
+        action="append",
+        default=[],
+        metavar="SALT,INT_MAXIMUM,INT_VALUE,FLOAT_MAXIMUM",
+    )
+    parser.add_argument("--interval", type=float, default=CHECKPOINT_INTERVAL)
+    args = parser.parse_args()
+    resumed = load_checkpoint(args.checkpoint)
+    if resumed is not None:
+        print(f"Resuming at {resumed['buffers'][0][0]} accepted samples")
+        resumed["checkpoint"] = Checkpointer(
+            args.checkpoint,
+            args.interval,
+            resumed["checkpoint"].saved_rows,
+            resumed["checkpoint"].log_records,
+        )
+        # the seed stream is claimed in blocks, so any thread count continues it
+        resumed["thread_count"] = args.thread_count
+        sampler = SamplerThread(**resumed)
+    else:
+        sampler = SamplerThread(
+            args.sample_count,
+            args.thread_count,
+            tuple(
+                GenericCondition(
+                    int(salt), int(int_maximum), int(int_value), float(float_maximum)
+                )
+                for salt, int_maximum, int_value, float_maximum in (
+                    condition.split(",") for condition in args.condition
+                )
+            ),
+            checkpoint=Checkpointer(args.checkpoint, args.interval),
+        )
+    sampler.start()
+    while sampler.is_alive():
+        sampler.join(10)
+        print(f"{max(sampler.accepted, 0)}/{sampler.sample_count} accepted")
+    if sampler.result is None:
+        raise SystemExit("No result, the conditions may be impossible")
+    np.savez(
+        args.output,
+        first=sampler.result[0],
+        all=sampler.result[1],
+        sample_count=sampler.sample_count,
+        tested=sampler.tested,
+    )
+    print(f"Saved to {args.output}")
@@ -1,10 +1,128 @@
-"""Clipboard update listening thread"""
+"""Clipboard update listening thread and parsing of the copied commands"""
 
 from threading import Thread
+from typing import NamedTuple
 
 import pyperclip
 import time
 
+from .condition_model import (
+    GenericCondition,
+    build_buried_treasure_condition,
+    build_chance_decorator_condition,
+    build_decorator_condition,
+    build_disk_decorator_condition,
+    build_first_portal_condition,
+    build_nether_fossil_condition,
+    build_third_portal_condition,
+)
+from .eyes import EyeThrow, parse_throw
+
+PORTAL_DIRECTIONS = ("East", "North", "West", "South")
+
+
+class ClipboardAction(NamedTuple):
+    """A condition to add or an eye throw to log, parsed from the clipboard"""
+
+    message: str
+    condition: GenericCondition = None
+    name: str = None
+    throw: EyeThrow = None
+
+
+def parse_clipboard(
+    clipboard: str, conditions, eye_throw_mode: bool = False
+) -> ClipboardAction:
+    """
+    Parse a copied f3+i /setblock or f3+c /execute command, returning None if
+    it is neither
+
+    conditions are the current ones, a portal orientation is the first
+    portal's unless one was already logged
+    """
+    # f3+i
+    if clipboard.startswith("/setblock"):
+        try:
+            _, x, _, z, full_block = clipboard.split(" ")
+            x, z = int(x), int(z)
+        except ValueError:
+            return None
+        block_name, *_ = full_block.split("[")
+        if block_name == "minecraft:chest":
+            return ClipboardAction(
+                f"Buried treasure logged chunk_x={x >> 4}, chunk_z={z >> 4}",
+                build_buried_treasure_condition(x >> 4, z >> 4),
+                f"Buried Treasure {x >> 4},{z >> 4}",
+            )
+        if not (0 <= x <= 15 and 0 <= z <= 15):
+            return None
+        if "log" in block_name:
+            return ClipboardAction(
+                f"10% 80k decorator logged z={z}",
+                build_chance_decorator_condition(z),
+                f"10% 80k Decorator Z {z}",
+            )
+        if block_name in (
+            "minecraft:bone_block",
+            "minecraft:soul_sand",
+            "minecraft:soul_soil",
+        ):
+            return ClipboardAction(
+                f"Nether fossil logged x={x}",
+                build_nether_fossil_condition(x),
+                f"Nether Fossil X {x}",
+            )
+        if block_name in (
+            "minecraft:clay",
+            "minecraft:gravel",
+            "minecraft:sand",
+        ):
+            return ClipboardAction(
+                f"60k {block_name} disk logged x={x}",
+                build_disk_decorator_condition(x),
+                f"60k Disk Decorator X {x}",
+            )
+        return ClipboardAction(
+            f"80k decorator logged {x}",
+            build_decorator_condition(x),
+            f"80k Decorator X {x}",
+        )
+    if not clipboard.startswith("/execute"):
+        return None
+    # f3+c
+    if eye_throw_mode:
+        throw = parse_throw(clipboard)
+        if throw is None:
+            return None
+        return ClipboardAction(f"Eye throw logged {throw!r}", throw=throw)
+    try:
+        _, _, _, _, _, _, _, _, _, yaw, _ = clipboard.split(" ")
+        yaw = float(yaw) % 360
+    except ValueError:
+        return None
+    yaw = yaw if yaw <= 180.0 else yaw - 360
+    if yaw > 135 or yaw < -135:
+        portal_orientation = 1
+    elif yaw <= -45:
+        portal_orientation = 0
+    elif yaw <= 45:
+        portal_orientation = 3
+    else:
+        portal_orientation = 2
+    direction = PORTAL_DIRECTIONS[portal_orientation]
+    # check all conditions for a rand(4) and assume its portal orientation
+    if not any(condition.int_maximum == 4 for condition in conditions):
+        return ClipboardAction(
+            f"First Portal orientation logged {direction}",
+            build_first_portal_condition(portal_orientation),
+            f"First Portal {direction}",
+        )
+    return ClipboardAction(
+        f"Third Portal orientation logged {direction}",
+        build_third_portal_condition(portal_orientation),
+        f"Third Portal {direction}",
+    )
+
 
 class ClipboardListener(Thread):
     """Clipboard update listening thread"""
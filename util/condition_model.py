@@ -0,0 +1,158 @@
+"""Pure-data divine condition definitions usable without numba"""
+
+import hashlib
+import json
+from functools import cached_property
+from typing import NamedTuple
+
+import numpy as np
+
+
+class GenericCondition(NamedTuple):
+    """Generic rng condition to be checked"""
+
+    salt: np.int64
+    int_maximum: np.int64
+    int_value: np.int64
+    float_maximum: np.float64
+
+
+def build_buried_treasure_condition(chunk_x: int, chunk_z: int) -> GenericCondition:
+    """Build a GenericCondition checking if a buried treasure can spawn at the provided chunk"""
+    return GenericCondition(
+        np.int64(chunk_x) * np.int64(341873128712)
+        + np.int64(chunk_z) * np.int64(132897987541)
+        + np.int64(10387320),
+        0,
+        0,
+        0.01,
+    )
+
+
+def build_nether_fossil_condition(x: int) -> GenericCondition:
+    """Build a GenericCondition checking the chunk x offset of a nether fossil"""
+    return GenericCondition(0, 16, x, 0.0)
+
+
+def build_decorator_condition(x: int) -> GenericCondition:
+    """Build a GenericCondition checking the chunk x offset of an 80k decorator"""
+    return GenericCondition(80000, 16, x, 0.0)
+
+
+def build_disk_decorator_condition(x: int) -> GenericCondition:
+    """Build a GenericCondition checking the chunk x offset of a 60k disk decorator"""
+    return GenericCondition(60000, 16, x, 0.0)
+
+
+def build_chance_decorator_condition(z: int) -> GenericCondition:
+    """Build a GenericCondition checking the chunk z offset of a 10% chance 80k decorator"""
+    return GenericCondition(80000, 16, z, 0.1)
+
+
+def build_first_portal_condition(direction: int) -> GenericCondition:
+    """
+    Build a GenericCondition checking if the direction of the first portal
+    of the dimension attempts to spawn in the specified direction
+    """
+    return GenericCondition(0, 4, direction, 0.0)
+
+
+def build_third_portal_condition(direction: int) -> GenericCondition:
+    """
+    Build a GenericCondition checking if the direction of the third portal
+    of the dimension attempts to spawn in the specified direction
+    """
+    # this is hacky, third portal doesn't actually use the float rand
+    # but it consumes the same amount of calls
+    return GenericCondition(0, 4, direction, 2.0)
+
+
+def condition_key(conditions) -> tuple:
+    """
+    Canonical key of a set of conditions
+
+    All conditions must pass independently so order and duplicates don't matter
+    """
+    return tuple(
+        sorted(
+            {
+                (int(salt), int(int_maximum), int(int_value), float(float_maximum))
+                for salt, int_maximum, int_value, float_maximum in conditions
+            }
+        )
+    )
+
+
+class ConditionArrays(NamedTuple):
+    """Struct of arrays form of a condition set, consumed directly by the numba kernels"""
+
+    salts: np.ndarray
+    int_maxima: np.ndarray
+    int_values: np.ndarray
+    float_maxima: np.ndarray
+
+
+def condition_arrays(conditions) -> ConditionArrays:
+    """ConditionArrays of conditions in their canonical order"""
+    columns = tuple(zip(*condition_key(conditions))) or ((), (), (), ())
+    return ConditionArrays(
+        np.array(columns[0], np.int64),
+        np.array(columns[1], np.int64),
+        np.array(columns[2], np.int64),
+        np.array(columns[3], np.float64),
+    )
+
+
+def condition_digest(conditions) -> str:
+    """Hash of a set of conditions, stable across runs and processes"""
+    key = json.dumps(condition_key(conditions))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class ConditionSet:
+    """
+    Immutable snapshot of a list of conditions, safe to share between threads
+
+    Its canonical forms are computed once on first use, and two sets are equal
+    if they accept the same seeds
+    """
+
+    def __init__(self, conditions=()) -> None:
+        self.conditions = tuple(
+            GenericCondition(*condition) for condition in conditions
+        )
+
+    @classmethod
+    def of(cls, conditions) -> "ConditionSet":
+        """conditions as a ConditionSet, without copying one that already is"""
+        return conditions if isinstance(conditions, cls) else cls(conditions)
+
+    def __iter__(self):
+        return iter(self.conditions)
+
+    def __len__(self) -> int:
+        return len(self.conditions)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ConditionSet) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"ConditionSet({self.conditions!r})"
+
+    @cached_property
+    def key(self) -> tuple:
+        """condition_key of the set"""
+        return condition_key(self.conditions)
+
+    @cached_property
+    def arrays(self) -> ConditionArrays:
+        """condition_arrays of the set"""
+        return condition_arrays(self.key)
+
+    @cached_property
+    def digest(self) -> str:
+        """condition_digest of the set"""
+        return condition_digest(self.key)
@@ -1,10 +1,17 @@
 """GUI widgets for handling divine conditions"""
 
-from typing import Iterable
-
 import customtkinter as ctk
 
-from .conditions import GenericCondition, build_buried_treasure_condition
+from .condition_model import (
+    ConditionSet,
+    GenericCondition,
+    build_buried_treasure_condition,
+    build_chance_decorator_condition,
+    build_decorator_condition,
+    build_disk_decorator_condition,
+    build_nether_fossil_condition,
+)
+from .session import EditHistory
 
 
 class NetherFossilDialog(ctk.CTkInputDialog):
@@ -118,6 +125,10 @@ class ConditionList(ctk.CTkScrollableFrame):
         super().__init__(*args, width, height, **kwargs)
         self.command = command
         self.widgets: list[ConditionWidget] = []
+        # replaced rather than modified on every edit so other threads can
+        # read it without touching the widgets
+        self.model = ConditionSet()
+        self.history = EditHistory()
         self.add_condition_button = ctk.CTkButton(
             self,
             text="Add Generic Condition",
@@ -127,7 +138,7 @@ class ConditionList(ctk.CTkScrollableFrame):
 
     def add_nether_fossil_condition(self, x):
         self.add_condition(
-            GenericCondition(0, 16, x, 0.0),
+            build_nether_fossil_condition(x),
             name=f"Nether Fossil X {x}",
             display_salt=False,
             display_int_rand=False,
@@ -136,7 +147,7 @@ class ConditionList(ctk.CTkScrollableFrame):
 
     def add_decorator_condition(self, x):
         self.add_condition(
-            GenericCondition(80000, 16, x, 0.0),
+            build_decorator_condition(x),
             name=f"80k Decorator X {x}",
             display_salt=False,
             display_int_rand=False,
@@ -145,7 +156,7 @@ class ConditionList(ctk.CTkScrollableFrame):
 
     def add_disk_decorator_condition(self, x):
         self.add_condition(
-            GenericCondition(60000, 16, x, 0.0),
+            build_disk_decorator_condition(x),
             name=f"60k Disk Decorator X {x}",
             display_salt=False,
             display_int_rand=False,
@@ -154,7 +165,7 @@ class ConditionList(ctk.CTkScrollableFrame):
 
     def add_chance_decorator_condition(self, z):
         self.add_condition(
-            GenericCondition(80000, 16, z, 0.1),
+            build_chance_decorator_condition(z),
             name=f"10% 80k Decorator Z {z}",
             display_salt=False,
             display_int_rand=False,
@@ -172,30 +183,75 @@ class ConditionList(ctk.CTkScrollableFrame):
 
     def add_condition(self, condition, **kwargs):
         """Add a condition to the list and create a widget for it"""
+        self.push_undo()
         self.widgets.append(ConditionWidget(self, condition, **kwargs))
         self.widgets[-1].pack()
+        self.update_model()
         if self.command is not None:
             self.command()
 
     def remove_widget(self, widget):
         """Remove widget and its condition from the list"""
+        self.push_undo()
         widget.pack_forget()
         idx = self.widgets.index(widget)
         self.widgets.pop(idx)
+        self.update_model()
         if self.command is not None:
             self.command()
 
     def clear(self):
         """Remove all widgets and conditions from the list"""
+        self.push_undo()
         while self.widgets:
             self.widgets.pop().pack_forget()
+        self.update_model()
         if self.command is not None:
             self.command()
 
+    def snapshot(self) -> tuple:
+        """Return the current conditions along with the options of their widgets"""
+        return tuple((widget.condition, widget.options) for widget in self.widgets)
+
+    def push_undo(self):
+        """Record the current state before an edit"""
+        self.history.push(self.snapshot())
+
+    def restore(self, snapshot):
+        """Replace all widgets with those of a snapshot"""
+        while self.widgets:
+            self.widgets.pop().destroy()
+        for condition, options in snapshot:
+            self.widgets.append(ConditionWidget(self, condition, **options))
+            self.widgets[-1].pack()
+        self.update_model()
+        if self.command is not None:
+            self.command()
+
+    def update_model(self):
+        """Take a new snapshot of the widgets' conditions"""
+        self.model = ConditionSet(widget.condition for widget in self.widgets)
+
+    def undo(self) -> bool:
+        """Revert the last edit, returning whether there was one"""
+        snapshot = self.history.undo(self.snapshot())
+        if snapshot is None:
+            return False
+        self.restore(snapshot)
+        return True
+
+    def redo(self) -> bool:
+        """Reapply the last undone edit, returning whether there was one"""
+        snapshot = self.history.redo(self.snapshot())
+        if snapshot is None:
+            return False
+        self.restore(snapshot)
+        return True
+
     @property
-    def conditions(self) -> Iterable[GenericCondition]:
-        """Return a generator that iterates over all GenericConditions of the widgets in the list"""
-        return (widget.condition for widget in self.widgets)
+    def conditions(self) -> ConditionSet:
+        """Snapshot of the conditions of the widgets in the list, safe to read from any thread"""
+        return self.model
 
 
 class ConditionWidget(ctk.CTkFrame):
@@ -216,6 +272,13 @@ class ConditionWidget(ctk.CTkFrame):
     ):
         super().__init__(master, *args, width, height, **kwargs)
 
+        self.name = name
+        self.options = {
+            "name": name,
+            "display_int_rand": display_int_rand,
+            "display_float_rand": display_float_rand,
+            "display_salt": display_salt,
+        }
         if name:
             self.name_label = ctk.CTkLabel(self, text=name)
             self.name_label.pack(side="left", padx=5)
@@ -264,8 +327,24 @@ class ConditionWidget(ctk.CTkFrame):
         )
         self.delete_button.pack(side="right", padx=5)
 
-    @property
-    def condition(self) -> GenericCondition:
+        self.condition = self.read_entries()
+        for entry in (
+            self.salt_entry,
+            self.int_maximum_entry,
+            self.int_value_entry,
+            self.float_maximum_entry,
+        ):
+            entry.bind("<KeyRelease>", self.entry_handler)
+            entry.bind("<FocusOut>", self.entry_handler)
+
+    def entry_handler(self, _event=None):
+        """Handler to be called any time one of the entries may have been edited"""
+        condition = self.read_entries()
+        if condition != self.condition:
+            self.condition = condition
+            self.master.update_model()
+
+    def read_entries(self) -> GenericCondition:
         """Build a GenericCondition from the widget's entries"""
         try:
             return GenericCondition(
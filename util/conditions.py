@@ -1,54 +1,18 @@
 """Divine conditions to be checked during seed testing"""
 
-
-from typing import NamedTuple
-
 import numba
-import numpy as np
 
 from . import java_random
-
-
-class GenericCondition(NamedTuple):
-    """Generic rng condition to be checked"""
-
-    salt: np.int64
-    int_maximum: np.int64
-    int_value: np.int64
-    float_maximum: np.float64
-
-
-def build_buried_treasure_condition(chunk_x: int, chunk_z: int) -> GenericCondition:
-    """Build a GenericCondition checking if a buried treasure can spawn at the provided chunk"""
-    return GenericCondition(
-        np.int64(chunk_x) * np.int64(341873128712)
-        + np.int64(chunk_z) * np.int64(132897987541)
-        + np.int64(10387320),
-        0,
-        0,
-        0.01,
-    )
-
-
-def build_first_portal_condition(direction: int) -> GenericCondition:
-    """
-    Build a GenericCondition checking if the direction of the first portal
-    of the dimension attempts to spawn in the specified direction
-    """
-    return GenericCondition(0, 4, direction, 0.0)
-
-
-def build_third_portal_condition(direction: int) -> GenericCondition:
-    """
-    Build a GenericCondition checking if the direction of the third portal
-    of the dimension attempts to spawn in the specified direction
-    """
-    # this is hacky, third portal doesn't actually use the float rand
-    # but it consumes the same amount of calls
-    return GenericCondition(0, 4, direction, 2.0)
-
+from .condition_model import (
+    GenericCondition,
+    build_buried_treasure_condition,
+    build_first_portal_condition,
+    build_third_portal_condition,
+    condition_arrays,
+)
 
 numba_GenericCondition = numba.typeof(GenericCondition(0, 0, 0, 0.0))
+numba_ConditionArrays = numba.typeof(condition_arrays(()))
 
 
 def njit_condition(*args, **kwargs):
@@ -112,6 +76,36 @@ def test_all_conditions(seed, conditions):
     return True
 
 
+@njit_condition(numba_ConditionArrays)
+def test_condition_arrays(seed, conditions):
+    """Test the conditions of ConditionArrays sequentially, like test_all_conditions"""
+    for i in range(conditions.salts.shape[0]):
+        if conditions.int_maxima[i] != 0:
+            if conditions.float_maxima[i] != 0.0:
+                if not test_float_int_pair_rand(
+                    seed,
+                    conditions.salts[i],
+                    conditions.float_maxima[i],
+                    conditions.int_maxima[i],
+                    conditions.int_values[i],
+                ):
+                    return False
+            else:
+                if not test_int_rand(
+                    seed,
+                    conditions.salts[i],
+                    conditions.int_maxima[i],
+                    conditions.int_values[i],
+                ):
+                    return False
+        else:
+            if not test_float_rand(
+                seed, conditions.salts[i], conditions.float_maxima[i]
+            ):
+                return False
+    return True
+
+
 @njit_condition(numba.types.ListType(numba.types.Tuple((numba.int64, numba.float32))))
 def test_floats(seed, pairs):
     """Test a list of (salt, maximum) pairs sequentially"""
@@ -0,0 +1,181 @@
+"""
+Displacement of stronghold start chunks by the biome search, applied to the
+heatmaps as per distance band convolutions
+
+1.16 moves each stronghold to a random valid biome position found within 112
+blocks of its chunk's center, in steps of 4 blocks. Only that displacement is
+modeled, the search also advances the rng the later strongholds are placed with
+"""
+
+import argparse
+
+import numpy as np
+
+from .kernels import fft_convolve
+
+# blocks searched in each direction from the chunk center
+SEARCH_RADIUS = 112
+# biome positions are checked every 4 blocks
+SEARCH_STEP = 4
+# furthest displacement in chunks
+MAXIMUM_OFFSET = (8 + SEARCH_RADIUS) // 16
+# band edges in blocks from the origin of the undisplaced position
+DEFAULT_BAND_EDGES = (0.0, 1536.0, 2048.0, 2560.0, 4096.0)
+
+
+def offset_weights() -> np.ndarray:
+    """
+    Probability of each chunk offset along one axis, -MAXIMUM_OFFSET to
+    MAXIMUM_OFFSET, if every searched position is a valid biome
+    """
+    positions = np.arange(-SEARCH_RADIUS, SEARCH_RADIUS + 1, SEARCH_STEP)
+    counts = np.bincount((8 + positions) // 16 + MAXIMUM_OFFSET)
+    return counts / counts.sum()
+
+
+class DisplacementModel:
+    """
+    Chunk offset kernels of strongholds whose undisplaced position lies in
+    each distance band
+
+    kernels[band, dz + MAXIMUM_OFFSET, dx + MAXIMUM_OFFSET] is the
+    probability of moving by (dx, dz) chunks
+    """
+
+    def __init__(self, band_edges, kernels, counts=None) -> None:
+        self.band_edges = np.asarray(band_edges, np.float64)
+        self.kernels = np.asarray(kernels, np.float64)
+        # samples each band was fitted from, 0 for the prior
+        self.counts = (
+            np.zeros(len(self.kernels), np.int64)
+            if counts is None
+            else np.asarray(counts, np.int64)
+        )
+
+    def save(self, path: str):
+        """Save the table as a small npz"""
+        np.savez_compressed(
+            path,
+            band_edges=self.band_edges,
+            kernels=self.kernels.astype(np.float32),
+            counts=self.counts,
+        )
+
+    @property
+    def fitted(self) -> bool:
+        """Whether any band was fitted to generated data rather than the prior"""
+        return bool(self.counts.any())
+
+
+def prior_model(band_edges=DEFAULT_BAND_EDGES) -> DisplacementModel:
+    """Uniform search over valid biomes everywhere, the same in every band"""
+    weights = offset_weights()
+    kernel = np.outer(weights, weights)
+    return DisplacementModel(
+        band_edges, np.repeat(kernel[None], len(band_edges) - 1, axis=0)
+    )
+
+
+def load_model(path: str) -> DisplacementModel:
+    """Model saved by DisplacementModel.save"""
+    with np.load(path) as table:
+        return DisplacementModel(table["band_edges"], table["kernels"], table["counts"])
+
+
+def fit_model(
+    origins: np.ndarray, displaced: np.ndarray, band_edges=DEFAULT_BAND_EDGES
+) -> DisplacementModel:
+    """
+    Empirical kernels from (n, 2) undisplaced and displaced start chunks, as
+    exported from biome layer generation for many seeds
+
+    Bands without data keep the prior
+    """
+    origins = np.asarray(origins, np.int64)
+    offsets = np.asarray(displaced, np.int64) - origins
+    distances = np.hypot(*(origins.T * 16 + 8))
+    bands = np.digitize(distances, band_edges) - 1
+    size = 2 * MAXIMUM_OFFSET + 1
+    model = prior_model(band_edges)
+    inside = (np.abs(offsets) <= MAXIMUM_OFFSET).all(axis=1)
+    for band in range(len(band_edges) - 1):
+        selected = inside & (bands == band)
+        count = int(np.count_nonzero(selected))
+        if not count:
+            continue
+        dx, dz = offsets[selected].T + MAXIMUM_OFFSET
+        model.kernels[band] = (
+            np.bincount(dz * size + dx, minlength=size * size).reshape(size, size)
+            / count
+        )
+        model.counts[band] = count
+    return model
+
+
+def cell_kernel(chunk_kernel: np.ndarray) -> np.ndarray:
+    """Chunk offset kernel on the heatmap grid, where a chunk spans 2 cells"""
+    size = 2 * chunk_kernel.shape[0] - 1
+    kernel = np.zeros((size, size))
+    kernel[::2, ::2] = chunk_kernel
+    return kernel
+
+
+def band_masks(band_edges, shape=(701, 701)) -> np.ndarray:
+    """Band index of every heatmap cell by its distance from the origin in blocks"""
+    # chunk centers fall on the even cells
+    centers = (np.arange(shape[0]) - shape[0] // 2) * 8 + 8
+    distances = np.hypot(*np.meshgrid(centers, centers))
+    return np.digitize(distances, band_edges) - 1
+
+
+def displace(data: np.ndarray, model: DisplacementModel) -> np.ndarray:
+    """
+    Spread a heatmap's mass by the kernel of each cell's distance band, one
+    FFT convolution per distinct kernel
+
+    The mass of each kernel falling outside the heatmap is lost
+    """
+    data = np.asarray(data, np.float64)
+    bands = band_masks(model.band_edges, data.shape)
+    result = np.zeros(data.shape)
+    # identical kernels, like all of the prior's, share one convolution
+    groups = {}
+    for band, kernel in enumerate(model.kernels):
+        groups.setdefault(kernel.tobytes(), (kernel, []))[1].append(band)
+    for kernel, group in groups.values():
+        masked = np.where(np.isin(bands, group), data, 0.0)
+        if masked.any():
+            result += fft_convolve(masked, cell_kernel(kernel))
+    # cells outside every band are left in place
+    result += np.where((bands < 0) | (bands >= len(model.kernels)), data, 0.0)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Fit a displacement table from a csv of undisplaced and displaced "
+            "start chunks (chunk_x,chunk_z,displaced_x,displaced_z per line), "
+            "or save the prior if none is given"
+        )
+    )
+    parser.add_argument("output", help="table to write, e.g. displacement.npz")
+    parser.add_argument("--pairs", help="csv exported from biome generation")
+    parser.add_argument(
+        "--band-edges",
+        type=float,
+        nargs="+",
+        default=DEFAULT_BAND_EDGES,
+        help="in blocks",
+    )
+    args = parser.parse_args()
+    if args.pairs is None:
+        model = prior_model(args.band_edges)
+    else:
+        pairs = np.loadtxt(args.pairs, np.int64, delimiter=",", ndmin=2)
+        model = fit_model(pairs[:, :2], pairs[:, 2:], args.band_edges)
+    model.save(args.output)
+    for band, count in enumerate(model.counts):
+        low, high = model.band_edges[band : band + 2]
+        source = f"{count} pairs" if count else "prior"
+        print(f"{low:.0f}-{high:.0f} blocks: {source}")
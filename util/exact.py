@@ -0,0 +1,198 @@
+"""
+Sampling-free stronghold distributions for condition sets using only salt 0
+
+Salt 0 conditions read the same java_random.init(seed) stream as
+gen_first_ring_strongholds: the first rand of a power of two int or a float
+constrains the top bits of the stronghold angle's rand_0, and the int of a
+float/int pair (third portal) constrains the top bits of rand_1, the first
+stronghold's distance. Every constraint is an interval, so the distribution
+can be integrated directly instead of sampled: the distance is integrated
+analytically by traversing the chunks each angle's ray passes through, and
+the angle by a fine midpoint rule.
+
+The result is exact up to the angle quadrature (far below chunk resolution)
+and the assumption that consecutive 48 bit LCG outputs are equidistributed.
+"""
+
+import math
+
+import numba
+import numpy as np
+
+FLOAT_UNITS = 1 << 24
+# angle quadrature points per full circle
+DEFAULT_ANGLE_RESOLUTION = 1 << 18
+
+
+def intersect(intervals, low, high) -> list:
+    """Intersect a list of [low, high) intervals with [low, high)"""
+    return [
+        (max(start, low), min(end, high))
+        for start, end in intervals
+        if max(start, low) < min(end, high)
+    ]
+
+
+def int_interval(int_maximum, int_value):
+    """Interval of a rand in [0, 1) whose top bits give int_value, None if unsupported"""
+    if int_maximum <= 0 or int_maximum & (int_maximum - 1):
+        # only power of two maximums map to the top bits of the state
+        return None
+    if not 0 <= int_value < int_maximum:
+        return (0.0, 0.0)
+    return (int_value / int_maximum, (int_value + 1) / int_maximum)
+
+
+def float_interval(float_maximum, inclusive: bool):
+    """
+    Interval of rand_0 passing a float32 comparison against float_maximum
+
+    The float is (state >> 24) / 2**24 and shares its top 24 bits with rand_0,
+    so the passing values of n = state >> 24 form a prefix or suffix of [0, 2**24)
+    """
+    float_maximum = float(np.float32(float_maximum))
+    if float_maximum >= 0.0:
+        # chance < maximum or chance <= maximum
+        limit = float_maximum * FLOAT_UNITS
+        count = math.floor(limit) + 1 if inclusive else math.ceil(limit)
+        return (0.0, min(max(count, 0), FLOAT_UNITS) / FLOAT_UNITS)
+    # -chance < maximum or -chance <= maximum
+    limit = -float_maximum * FLOAT_UNITS
+    start = math.ceil(limit) if inclusive else math.floor(limit) + 1
+    return (min(start, FLOAT_UNITS) / FLOAT_UNITS, 1.0)
+
+
+def exact_constraints(conditions):
+    """
+    Translate conditions into rand_0 intervals and a rand_1 interval,
+    returning None if any condition is not supported
+    """
+    angle_intervals = [(0.0, 1.0)]
+    distance_interval = (0.0, 1.0)
+    for salt, int_maximum, int_value, float_maximum in conditions:
+        if salt != 0:
+            return None
+        if int_maximum != 0:
+            interval = int_interval(int_maximum, int_value)
+            if interval is None:
+                return None
+            if float_maximum != 0.0:
+                angle_intervals = intersect(
+                    angle_intervals, *float_interval(float_maximum, inclusive=True)
+                )
+                distance_interval = (
+                    max(distance_interval[0], interval[0]),
+                    min(distance_interval[1], interval[1]),
+                )
+            else:
+                angle_intervals = intersect(angle_intervals, *interval)
+        else:
+            angle_intervals = intersect(
+                angle_intervals, *float_interval(float_maximum, inclusive=False)
+            )
+    return angle_intervals, distance_interval
+
+
+@numba.njit(
+    numba.void(
+        numba.float64[:],
+        numba.float64,
+        numba.float64,
+        numba.float64,
+        numba.float64,
+        numba.float64[:],
+    ),
+    nogil=True,
+)
+def integrate_rays(
+    angles, weight, angle_offset, minimum_distance, maximum_distance, histogram
+):
+    """
+    Add weight * the fraction of [minimum_distance, maximum_distance) spent
+    in each chunk along the ray at every angle to a flat 701*701 histogram
+    """
+    distance_range = maximum_distance - minimum_distance
+    if distance_range <= 0:
+        return
+    for angle in angles:
+        cos = np.cos(angle + angle_offset)
+        sin = np.sin(angle + angle_offset)
+        distance = minimum_distance
+        chunk_x = np.int64(np.round(cos * distance))
+        chunk_z = np.int64(np.round(sin * distance))
+        while distance < maximum_distance:
+            # distances at which the ray leaves the current chunk in x and z
+            if cos > 0:
+                exit_x = (chunk_x + 0.5) / cos
+            elif cos < 0:
+                exit_x = (chunk_x - 0.5) / cos
+            else:
+                exit_x = np.inf
+            if sin > 0:
+                exit_z = (chunk_z + 0.5) / sin
+            elif sin < 0:
+                exit_z = (chunk_z - 0.5) / sin
+            else:
+                exit_z = np.inf
+            next_distance = min(exit_x, exit_z, maximum_distance)
+            histogram[(chunk_x * 2 + 350) + 701 * (chunk_z * 2 + 350)] += (
+                weight * (next_distance - distance) / distance_range
+            )
+            if exit_x <= next_distance:
+                chunk_x += 1 if cos > 0 else -1
+            if exit_z <= next_distance:
+                chunk_z += 1 if sin > 0 else -1
+            distance = next_distance
+
+
+def ring_distances(rand_interval):
+    """Stronghold distance range in chunks for a range of its rand"""
+    return tuple(
+        np.float64(4) * np.float64(32)
+        + (rand - np.float64(0.5)) * np.float64(32) * np.float64(2.5)
+        for rand in rand_interval
+    )
+
+
+def exact_distributions(conditions, angle_resolution=DEFAULT_ANGLE_RESOLUTION):
+    """
+    Exact normalized (first, all) stronghold distributions of a salt 0
+    condition set, or None if the conditions are unsupported or impossible
+    """
+    constraints = exact_constraints(conditions)
+    if constraints is None:
+        return None
+    angle_intervals, distance_interval = constraints
+    total = sum(end - start for start, end in angle_intervals)
+    if total <= 0 or distance_interval[1] <= distance_interval[0]:
+        return None
+    first = np.zeros(701 * 701, np.float64)
+    all_ = np.zeros(701 * 701, np.float64)
+    for start, end in angle_intervals:
+        point_count = max(1, math.ceil((end - start) * angle_resolution))
+        # midpoints of equal sub-intervals of rand_0
+        rands = start + (np.arange(point_count) + 0.5) * ((end - start) / point_count)
+        angles = rands * np.pi * np.float64(2)
+        weight = (end - start) / point_count / total
+        integrate_rays(angles, weight, 0.0, *ring_distances(distance_interval), first)
+        angle_offset = 0.0
+        for i in range(3):
+            if i:
+                angle_offset += np.pi * 2.0 / 3.0
+            integrate_rays(
+                angles,
+                weight,
+                angle_offset,
+                *ring_distances(distance_interval if i == 0 else (0.0, 1.0)),
+                all_,
+            )
+    return np.reshape(first, (701, 701)), np.reshape(all_, (701, 701))
+
+
+def monte_carlo_error(estimate, exact) -> dict:
+    """Measure how far a sampled distribution is from the exact one"""
+    difference = np.abs(estimate - exact)
+    return {
+        "total_variation": float(difference.sum() / 2),
+        "max_abs": float(difference.max()),
+    }
@@ -0,0 +1,183 @@
+"""Bayesian updates of the stronghold distribution from eye of ender throws"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+# standard deviation of a measured throw angle in degrees
+DEFAULT_STANDARD_DEVIATION = 0.1
+# eyes point this many blocks into the stronghold's start chunk (1.16)
+TARGET_OFFSET = 4
+# probability mass of the reported credible region
+CREDIBLE_MASS = 0.9
+# samples this far below the best log likelihood are dropped as negligible
+LOG_WEIGHT_CUTOFF = 30.0
+
+
+class EyeThrow(NamedTuple):
+    """Overworld position and measured yaw of an eye of ender throw"""
+
+    x: float
+    z: float
+    yaw: float
+
+
+class EyePosterior(NamedTuple):
+    """Posterior over the start chunk of the stronghold the eyes point to"""
+
+    # 701*701 heatmap of probabilities, indexed like the divine heatmaps
+    probabilities: np.ndarray
+    chunk_x: int
+    chunk_z: int
+    probability: float
+    credible_region: np.ndarray
+
+    @property
+    def coords(self) -> tuple[int, int]:
+        """Overworld block coordinates the eyes point to"""
+        return (
+            self.chunk_x * 16 + TARGET_OFFSET,
+            self.chunk_z * 16 + TARGET_OFFSET,
+        )
+
+    @property
+    def nether_coords(self) -> tuple[int, int]:
+        """Nether block coordinates of the start chunk, in the units of the heatmaps"""
+        return self.chunk_x * 2, self.chunk_z * 2
+
+    @property
+    def credible_radius(self) -> float:
+        """Distance in blocks from the argmax to the furthest chunk of the credible region"""
+        z, x = np.nonzero(self.credible_region)
+        if not len(x):
+            return 0.0
+        return float(
+            np.hypot((x - 350) / 2 - self.chunk_x, (z - 350) / 2 - self.chunk_z).max()
+            * 16
+        )
+
+
+def parse_throw(clipboard: str) -> EyeThrow:
+    """Parse an overworld F3+C /execute command, returning None if it is not one"""
+    parts = clipboard.split(" ")
+    if len(parts) != 11 or parts[0] != "/execute" or parts[2] != "minecraft:overworld":
+        return None
+    try:
+        x, _, z, yaw, _ = map(float, parts[6:])
+    except ValueError:
+        return None
+    return EyeThrow(x, z, yaw)
+
+
+def yaw_error(throw: EyeThrow, chunk_x, chunk_z):
+    """Angle in radians between the throw and the directions to stronghold start chunks"""
+    delta_x = chunk_x * 16 + TARGET_OFFSET - throw.x
+    delta_z = chunk_z * 16 + TARGET_OFFSET - throw.z
+    # a yaw faces (-sin(yaw), cos(yaw))
+    yaw = np.radians(throw.yaw)
+    facing_x, facing_z = -np.sin(yaw), np.cos(yaw)
+    return np.arctan2(
+        facing_x * delta_z - facing_z * delta_x, facing_x * delta_x + facing_z * delta_z
+    )
+
+
+def log_likelihood(throws, chunk_x, chunk_z, standard_deviation):
+    """Gaussian log likelihood of every throw pointing at the given start chunks"""
+    total = np.zeros(np.shape(chunk_x))
+    for throw in throws:
+        total -= (
+            0.5
+            * (yaw_error(throw, chunk_x, chunk_z) / np.radians(standard_deviation)) ** 2
+        )
+    return total
+
+
+def build_posterior(indices: np.ndarray, weights: np.ndarray) -> EyePosterior:
+    """Normalize unnormalized posterior weights of the given flat 701*701 heatmap cells"""
+    total = weights.sum()
+    if total <= 0:
+        return None
+    weights = weights / total
+    # smallest set of cells holding CREDIBLE_MASS of the probability
+    order = np.argsort(weights)[::-1]
+    count = int(np.searchsorted(np.cumsum(weights[order]), CREDIBLE_MASS)) + 1
+    probabilities = np.zeros(701 * 701)
+    probabilities[indices] = weights
+    region = np.zeros(701 * 701, np.bool_)
+    region[indices[order[:count]]] = True
+    z, x = divmod(int(indices[order[0]]), 701)
+    return EyePosterior(
+        probabilities.reshape(701, 701),
+        (x - 350) // 2,
+        (z - 350) // 2,
+        float(weights[order[0]]),
+        region.reshape(701, 701),
+    )
+
+
+def grid_posterior(
+    all_sh_distribution, throws, standard_deviation=DEFAULT_STANDARD_DEVIATION
+) -> EyePosterior:
+    """
+    Posterior using the all strongholds heatmap as the prior
+
+    The heatmap only holds marginals, so each chunk is treated as the target
+    independently of where the other two strongholds are
+    """
+    if not throws:
+        return None
+    indices = np.flatnonzero(all_sh_distribution)
+    z, x = np.divmod(indices, 701)
+    chunk_x, chunk_z = (x - 350) // 2, (z - 350) // 2
+    log_weights = log_likelihood(throws, chunk_x, chunk_z, standard_deviation)
+    keep = log_weights > log_weights.max() - LOG_WEIGHT_CUTOFF
+    return build_posterior(
+        indices[keep],
+        all_sh_distribution.ravel()[indices[keep]]
+        * np.exp(log_weights[keep] - log_weights.max()),
+    )
+
+
+def sample_posterior(
+    samples, throws, standard_deviation=DEFAULT_STANDARD_DEVIATION
+) -> EyePosterior:
+    """
+    Posterior using (n, 3, 2) start chunk samples as the prior
+
+    Each throw is matched against whichever of the sample's strongholds is
+    nearest to where it was thrown, as eyes do
+    """
+    if not throws or not len(samples):
+        return None
+    # one contiguous column per stronghold, argmin over an axis of 3 is slow
+    chunk_x = [samples[:, i, 0].astype(np.float64) for i in range(3)]
+    chunk_z = [samples[:, i, 1].astype(np.float64) for i in range(3)]
+    log_weights = np.zeros(len(samples))
+    for throw in throws:
+        distances = [
+            (x * 16 - throw.x) ** 2 + (z * 16 - throw.z) ** 2
+            for x, z in zip(chunk_x, chunk_z)
+        ]
+        nearer_1 = distances[1] < distances[0]
+        nearer_2 = distances[2] < np.minimum(distances[0], distances[1])
+        target_x = np.where(nearer_2, chunk_x[2], np.where(nearer_1, *chunk_x[1::-1]))
+        target_z = np.where(nearer_2, chunk_z[2], np.where(nearer_1, *chunk_z[1::-1]))
+        log_weights += log_likelihood((throw,), target_x, target_z, standard_deviation)
+        # weights only ever drop, so prune before the next throw
+        keep = np.flatnonzero(log_weights > log_weights.max() - LOG_WEIGHT_CUTOFF)
+        chunk_x = [x[keep] for x in chunk_x]
+        chunk_z = [z[keep] for z in chunk_z]
+        log_weights, target_x, target_z = (
+            log_weights[keep],
+            target_x[keep],
+            target_z[keep],
+        )
+    # the posterior is over the stronghold the latest throw points to
+    indices, inverse = np.unique(
+        (target_x * 2 + 350).astype(np.int64)
+        + 701 * (target_z * 2 + 350).astype(np.int64),
+        return_inverse=True,
+    )
+    return build_posterior(
+        indices, np.bincount(inverse, np.exp(log_weights - log_weights.max()))
+    )
@@ -0,0 +1,149 @@
+"""CPU governance of the numba sampling workers so the game keeps its frame rate"""
+
+import ctypes
+import os
+import sys
+
+import numba
+import numpy as np
+
+# nice value applied to workers on linux
+LINUX_LOW_PRIORITY = 10
+# THREAD_PRIORITY_LOWEST
+WINDOWS_LOW_PRIORITY = -2
+
+if sys.platform == "linux":
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _setpriority = _libc.setpriority
+    _setpriority.argtypes = (ctypes.c_int, ctypes.c_uint, ctypes.c_int)
+    _setpriority.restype = ctypes.c_int
+    _sched_setaffinity = _libc.sched_setaffinity
+    _sched_setaffinity.argtypes = (ctypes.c_int, ctypes.c_size_t, ctypes.c_void_p)
+    _sched_setaffinity.restype = ctypes.c_int
+
+    @numba.njit(numba.boolean())
+    def _lower_thread_priority():
+        # on linux PRIO_PROCESS with who=0 only affects the calling thread
+        return _setpriority(0, 0, LINUX_LOW_PRIORITY) == 0
+
+    @numba.njit(numba.boolean(numba.uint64[:]))
+    def _set_thread_affinity(mask):
+        return _sched_setaffinity(0, mask.size * 8, mask.ctypes.data) == 0
+
+elif sys.platform == "win32":
+    _kernel32 = ctypes.WinDLL("kernel32")
+    _get_current_thread = _kernel32.GetCurrentThread
+    _get_current_thread.argtypes = ()
+    _get_current_thread.restype = ctypes.c_void_p
+    _set_thread_priority = _kernel32.SetThreadPriority
+    _set_thread_priority.argtypes = (ctypes.c_void_p, ctypes.c_int)
+    _set_thread_priority.restype = ctypes.c_int
+    _set_thread_affinity_mask = _kernel32.SetThreadAffinityMask
+    _set_thread_affinity_mask.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+    _set_thread_affinity_mask.restype = ctypes.c_size_t
+
+    @numba.njit(numba.boolean())
+    def _lower_thread_priority():
+        return _set_thread_priority(_get_current_thread(), WINDOWS_LOW_PRIORITY) != 0
+
+    @numba.njit(numba.boolean(numba.uint64[:]))
+    def _set_thread_affinity(mask):
+        return _set_thread_affinity_mask(_get_current_thread(), mask[0]) != 0
+
+else:
+
+    @numba.njit(numba.boolean())
+    def _lower_thread_priority():
+        return False
+
+    @numba.njit(numba.boolean(numba.uint64[:]))
+    def _set_thread_affinity(mask):
+        return False
+
+
+@numba.njit(
+    numba.void(numba.uint64, numba.boolean, numba.uint64[:], numba.boolean[:]),
+    parallel=True,
+)
+def _configure_workers(thread_count, lower_priority, mask, configured):
+    for i in numba.prange(thread_count * 64):
+        thread_id = numba.get_thread_id()
+        if configured[thread_id]:
+            continue
+        success = True
+        if lower_priority:
+            success &= _lower_thread_priority()
+        if mask.size:
+            success &= _set_thread_affinity(mask)
+        configured[thread_id] = success
+
+
+def build_affinity_mask(cores) -> np.ndarray:
+    """Build a cpu_set_t style bitmask from an iterable of core ids"""
+    cores = tuple(cores)
+    if not cores:
+        return np.zeros(0, np.uint64)
+    mask = np.zeros(max(cores) // 64 + 1, np.uint64)
+    for core in cores:
+        mask[core // 64] |= np.uint64(1 << (core % 64))
+    return mask
+
+
+def available_cores() -> tuple[int, ...]:
+    """Core ids that workers may be pinned to"""
+    if hasattr(os, "sched_getaffinity"):
+        return tuple(sorted(os.sched_getaffinity(0)))
+    return tuple(range(os.cpu_count() or 1))
+
+
+# cores of the process before any worker was pinned, kernels also run on the
+# launching thread so its own affinity can't be relied on afterwards
+PROCESS_CORES = available_cores()
+# whether a run has pinned the worker pool, which every later run shares
+_pinned = False
+
+
+def workers_pinned() -> bool:
+    """Whether the worker pool is pinned to a core set by an earlier run"""
+    return _pinned
+
+
+def _run_on_workers(thread_count: int, lower_priority: bool, mask) -> int:
+    """Configure thread_count workers, returning how many succeeded"""
+    configured = np.zeros(numba.config.NUMBA_NUM_THREADS, np.bool_)
+    # workers are handed iterations arbitrarily, retry until each one has run one
+    for _ in range(8):
+        _configure_workers(thread_count, lower_priority, mask, configured)
+        if configured[:thread_count].all():
+            break
+    return int(configured.sum())
+
+
+def configure_workers(thread_count: int, lower_priority: bool, cores=()) -> int:
+    """
+    Lower the priority of and/or pin each numba worker thread
+
+    This must be called from the thread that launches the kernels, after
+    numba.set_num_threads. Priority cannot be raised back without privileges,
+    so lowered workers stay lowered for the rest of the process. Without
+    cores, workers pinned by an earlier run are unpinned again.
+    Returns the number of workers that were configured successfully.
+    """
+    global _pinned
+    mask = build_affinity_mask(cores)
+    if not mask.size and _pinned:
+        # every worker of the pool may have been pinned, not only this run's
+        pool_size = numba.config.NUMBA_NUM_THREADS
+        numba.set_num_threads(pool_size)
+        try:
+            unpinned = _run_on_workers(
+                pool_size, False, build_affinity_mask(PROCESS_CORES)
+            )
+        finally:
+            numba.set_num_threads(thread_count)
+        _pinned = unpinned < pool_size
+    if mask.size:
+        _pinned = True
+    if not lower_priority and not mask.size:
+        return thread_count
+    return _run_on_workers(thread_count, lower_priority, mask)
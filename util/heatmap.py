@@ -1,95 +1,243 @@
 import numba
 import numpy as np
-from numba_progress.numba_atomic import atomic_add
+from numba_progress.numba_atomic import atomic_add, atomic_min
 
 from . import conditions, stronghold
+from .seed_stream import counter_seed
+
+# seeds tested per thread with no accepted samples before giving up
+IMPOSSIBLE_TEST_COUNT = 100000
+# most seeds a worker claims at once
+CHUNK_SIZE = 4096
+# fewest seeds a worker claims at once, once the tail is shared out
+MINIMUM_CHUNK_SIZE = 64
 
 
 @numba.njit(
-    numba.types.types.UniTuple(numba.uint64[:, :], 2)(
+    numba.types.UniTuple(numba.int64, 2)(
         numba.int64[:],
+        numba.int64[:],
+        numba.int64,
+        numba.int64,
+        numba.int64,
+    ),
+    nogil=True,
+)
+def claim_chunk(claimed, reserved, count, thread_count, tested_limit):
+    """
+    Claim the next block of seed indices, returning its [start, end), which is
+    empty once tested_limit is reached
+
+    Blocks shrink as the seeds estimated to be left run out, so the tail is
+    shared between every worker rather than left to whoever claimed it
+    """
+    tested = atomic_add(claimed, 0, 0)
+    accepted = atomic_add(reserved, 0, 0)
+    remaining = tested_limit - tested
+    if 0 < accepted < count:
+        remaining = min(remaining, (count - accepted) * (tested // accepted + 1))
+    size = min(max(remaining // (2 * thread_count), MINIMUM_CHUNK_SIZE), CHUNK_SIZE)
+    start = atomic_add(claimed, 0, size)
+    return start, min(start + size, tested_limit)
+
+
+@numba.njit(
+    numba.types.UniTuple(numba.int64, 2)(numba.int64[:], numba.int64, numba.int64),
+    nogil=True,
+)
+def reserve_quota(reserved, count, accepted):
+    """
+    Reserve sample indices for a block's accepted samples, returning the first
+    index and how many of them still fit within count
+    """
+    first = atomic_add(reserved, 0, accepted)
+    return first, min(max(count - first, 0), accepted)
+
+
+@numba.njit(
+    numba.void(
+        numba.int64[:],
+        numba.int64[:],
+        numba.int64[:],
+        numba.int64,
+        numba.int64,
+        conditions.numba_ConditionArrays,
+        numba.uint64[:],
+        numba.uint64[:],
+        numba.int16[:, :, :],
+        numba.int64[:],
+        numba.int64,
         numba.uint64,
-        numba.uint64,
-        numba.types.ListType(conditions.numba_GenericCondition),
+        numba.int64,
     ),
     nogil=True,
-    parallel=True,
 )
-def generate_data(progress, count, thread_count, divine_conditions):
-    first_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
-    all_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
-    for _ in numba.prange(thread_count):
-        tested_count = np.zeros(1, dtype=np.uint64)
-        while 0 <= atomic_add(progress, 0, 0) < count:
-            seed = np.random.randint(-(1 << 47) + 1, 1 << 47)
+def sample_chunks(
+    progress,
+    claimed,
+    reserved,
+    count,
+    thread_count,
+    divine_conditions,
+    first_stronghold_locations,
+    all_stronghold_locations,
+    samples,
+    seeds,
+    tested_limit,
+    seed_key,
+    row_offset,
+):
+    """One worker of accumulate_data, sampling claimed blocks until done"""
+    chunks = np.empty((CHUNK_SIZE, 3, 2), dtype=np.int16)
+    chunk_seeds = np.empty(CHUNK_SIZE, dtype=np.int64)
+    while atomic_add(progress, 0, 0) >= 0 and atomic_add(reserved, 0, 0) < count:
+        start, end = claim_chunk(claimed, reserved, count, thread_count, tested_limit)
+        if start >= end:
+            return
+        accepted = 0
+        for index in range(start, end):
+            seed = counter_seed(seed_key, index)
+            if not conditions.test_condition_arrays(seed, divine_conditions):
+                continue
             strongholds = stronghold.gen_first_ring_strongholds(seed)
-            atomic_add(tested_count, 0, 1)
+            for i in range(3):
+                chunks[accepted, i, 0] = strongholds[i][0]
+                chunks[accepted, i, 1] = strongholds[i][1]
+            chunk_seeds[accepted] = seed
+            accepted += 1
+        tested_count = atomic_add(progress, 1, end - start) + end - start
+        if accepted == 0:
             # assume impossible
             if (
-                atomic_add(tested_count, 0, 0) > 100000
-                and atomic_add(progress, 0, 0) == 0
+                tested_count > IMPOSSIBLE_TEST_COUNT * thread_count
+                and atomic_add(reserved, 0, 0) == 0
             ):
-                atomic_add(progress, 0, -1)
-
-            if not conditions.test_all_conditions(seed, divine_conditions):
-                continue
+                atomic_min(progress, 0, -1)
+            continue
 
+        first, kept = reserve_quota(reserved, count, accepted)
+        for i in range(kept):
             atomic_add(
                 first_stronghold_locations,
-                (strongholds[0][0] * 2 + 350) + 701 * (strongholds[0][1] * 2 + 350),
-                1,
-            )
-            atomic_add(
-                all_stronghold_locations,
-                (strongholds[0][0] * 2 + 350) + 701 * (strongholds[0][1] * 2 + 350),
-                1,
-            )
-            atomic_add(
-                all_stronghold_locations,
-                (strongholds[1][0] * 2 + 350) + 701 * (strongholds[1][1] * 2 + 350),
-                1,
-            )
-            atomic_add(
-                all_stronghold_locations,
-                (strongholds[2][0] * 2 + 350) + 701 * (strongholds[2][1] * 2 + 350),
+                (chunks[i, 0, 0] * 2 + 350) + 701 * (chunks[i, 0, 1] * 2 + 350),
                 1,
             )
+            for j in range(3):
+                atomic_add(
+                    all_stronghold_locations,
+                    (chunks[i, j, 0] * 2 + 350) + 701 * (chunks[i, j, 1] * 2 + 350),
+                    1,
+                )
+            index = first + i - row_offset
+            if 0 <= index < samples.shape[0]:
+                samples[index] = chunks[i]
+            if 0 <= index < seeds.shape[0]:
+                seeds[index] = chunk_seeds[i]
+        atomic_add(progress, 0, kept)
 
-            atomic_add(progress, 0, 1)
-    return np.reshape(first_stronghold_locations, (701, 701)), np.reshape(
-        all_stronghold_locations, (701, 701)
-    )
 
+@numba.njit(
+    numba.void(
+        numba.int64[:],
+        numba.uint64,
+        numba.uint64,
+        conditions.numba_ConditionArrays,
+        numba.uint64[:],
+        numba.uint64[:],
+        numba.int16[:, :, :],
+        numba.int64[:],
+        numba.int64,
+        numba.uint64,
+        numba.int64,
+    ),
+    nogil=True,
+    parallel=True,
+)
+def accumulate_data(
+    progress,
+    count,
+    thread_count,
+    divine_conditions,
+    first_stronghold_locations,
+    all_stronghold_locations,
+    samples,
+    seeds,
+    tested_limit,
+    seed_key,
+    row_offset,
+):
+    """
+    Add stronghold locations of seeds passing all divine conditions to flat
+    701*701 histograms until exactly count samples have been accepted or
+    progress[1] reaches tested_limit
 
-def circular_kernel(kernel_size):
-    """Build a circular kernel of the given radius"""
+    Workers claim blocks of the seed stream and reserve their share of count
+    once per block, so the shared counters are only touched once per block
+    rather than once per seed
 
-    radius = kernel_size // 2
+    The start chunks of each accepted sample are also stored in samples at
+    its accepted index minus row_offset, if it fits, and likewise its seed in
+    seeds
 
-    def within_radius(x, y):
-        return ((x - radius) ** 2 + (y - radius) ** 2 <= radius**2).astype(np.float64)
+    progress[0] counts accepted samples (-1 if the conditions appear impossible)
+    and progress[1] counts tested seeds, which doubles as the position in the
+    seed stream of seed_key so every seed below it has been fully accounted
+    for once the call returns
+    """
+    # blocks are claimed from and samples reserved on private counters so that
+    # progress only ever counts finished blocks and kept samples
+    claimed = progress[1:].copy()
+    reserved = progress[:1].copy()
+    for _ in numba.prange(thread_count):
+        sample_chunks(
+            progress,
+            claimed,
+            reserved,
+            np.int64(count),
+            np.int64(thread_count),
+            divine_conditions,
+            first_stronghold_locations,
+            all_stronghold_locations,
+            samples,
+            seeds,
+            tested_limit,
+            seed_key,
+            row_offset,
+        )
 
-    return np.fromfunction(within_radius, (kernel_size, kernel_size), dtype=np.float64)
 
+@numba.njit(
+    numba.types.types.UniTuple(numba.uint64[:, :], 2)(
+        numba.int64[:],
+        numba.uint64,
+        numba.uint64,
+        conditions.numba_ConditionArrays,
+    ),
+    nogil=True,
+)
+def generate_data(progress, count, thread_count, divine_conditions):
+    """
+    Sample stronghold locations of seeds passing all divine conditions, given
+    as condition_model.ConditionArrays
 
-def convolve_data(data, radius):
-    """Convolve 2d map of data by circular kernel of specified radius"""
-    data = np.pad(data, radius * 2)
-    size = data.shape[0]
-    kernel_size = np.round(radius * 2)
-    kernel = np.fft.fft2(
-        np.fft.ifftshift(
-            np.pad(
-                circular_kernel(kernel_size),
-                (
-                    (((size - kernel_size) + 1) // 2, (size - kernel_size) // 2),
-                    (((size - kernel_size) + 1) // 2, (size - kernel_size) // 2),
-                ),
-                "constant",
-            )
-        ),
-        s=(size, size),
+    progress[0] counts accepted samples (-1 if the conditions appear impossible)
+    and progress[1] counts tested seeds
+    """
+    first_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
+    all_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
+    accumulate_data(
+        progress,
+        count,
+        thread_count,
+        divine_conditions,
+        first_stronghold_locations,
+        all_stronghold_locations,
+        np.zeros((0, 3, 2), dtype=np.int16),
+        np.zeros(0, dtype=np.int64),
+        np.iinfo(np.int64).max,
+        np.uint64(np.random.randint(0, np.iinfo(np.int64).max)),
+        np.int64(0),
+    )
+    return np.reshape(first_stronghold_locations, (701, 701)), np.reshape(
+        all_stronghold_locations, (701, 701)
     )
-    return np.real(np.fft.ifft2(np.fft.fft2(data) * kernel))[
-        radius * 2 : -radius * 2, radius * 2 : -radius * 2
-    ]
@@ -0,0 +1,486 @@
+"""
+Fair-share job queue serving the heatmaps of many clients from one machine
+
+Each client has a session holding its current condition set. Sessions asking
+for the same set share one job, finished jobs are kept in a shared
+ResultCache, and the kernel is time sliced between the jobs of the clients
+that have been served the least so far. Partial heatmaps are published to
+every waiting session as its job progresses
+"""
+
+import argparse
+import json
+import logging
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer
+from threading import Condition, Thread
+from time import monotonic, perf_counter
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from .cache import ResultCache
+from .condition_model import ConditionSet, build_first_portal_condition
+from .sampler import SamplerThread, histogram_shapes
+from .server import DEFAULT_PORT, HeatmapRequestHandler, HeatmapState, parse_condition
+from .speculation import predict_next_conditions
+
+# target wall time of a single burst of a job before the next one is picked
+QUANTUM_DURATION = 0.05
+# least time between two partial results of a job
+PUBLISH_INTERVAL = 0.25
+# sessions not heard from for longer are dropped
+SESSION_TIMEOUT = 600.0
+# how a submission was answered
+SOURCES = ("queued", "deduplicated", "cached")
+
+
+class Session:
+    """A client's current condition set and the results published to it"""
+
+    def __init__(self, client: str, service: float) -> None:
+        self.client = client
+        # long-polled by the client like the single user server's state
+        self.state = HeatmapState()
+        self.condition_set = None
+        self.job = None
+        # seconds of kernel time spent on the client's jobs, shared jobs
+        # split evenly between their sessions
+        self.service = service
+        self.last_seen = monotonic()
+
+
+class Job:
+    """Sampling of one condition set, shared by every session waiting on it"""
+
+    def __init__(self, sampler: SamplerThread) -> None:
+        self.sampler = sampler
+        self.sessions = set()
+        # seeds tested per burst, steered towards QUANTUM_DURATION
+        self.burst_tests = 1000
+        self.published = 0.0
+
+    @property
+    def key(self) -> tuple:
+        """condition_key of the job's conditions"""
+        return self.sampler.condition_set.key
+
+
+class JobQueue(Thread):
+    """
+    Thread running the jobs of every session, one burst at a time
+
+    The next burst goes to the job of the session with the least service, so
+    a client waiting on a rare condition set can't starve the others and a
+    new client is served as soon as the running burst ends
+    """
+
+    def __init__(
+        self,
+        sample_count: int,
+        thread_count: int,
+        engine: str = "numba",
+        cache_bytes: int = 1 << 30,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.logger = logging.getLogger("JobQueue")
+        self.sample_count = sample_count
+        self.thread_count = thread_count
+        self.engine = engine
+        self.cache = ResultCache(cache_bytes)
+        self.condition = Condition()
+        self.sessions = {}
+        self.jobs = {}
+        self.counts = dict.fromkeys(SOURCES, 0)
+        self.stopped = False
+
+    def session(self, client: str) -> Session:
+        """The session of client, created if new, must be called with the condition held"""
+        session = self.sessions.get(client)
+        if session is None:
+            # new clients start level with the least served client
+            session = Session(
+                client,
+                min((other.service for other in self.sessions.values()), default=0.0),
+            )
+            self.sessions[client] = session
+        session.last_seen = monotonic()
+        return session
+
+    def state(self, client: str) -> HeatmapState:
+        """The published state of client, whose session is kept alive"""
+        with self.condition:
+            return self.session(client).state
+
+    def submit(self, client: str, conditions) -> str:
+        """
+        Replace the condition set of client, returning which of SOURCES
+        answers it
+        """
+        condition_set = ConditionSet.of(conditions)
+        with self.condition:
+            self.expire_sessions()
+            session = self.session(client)
+            self.detach(session)
+            session.condition_set = condition_set
+            session.state.publish(
+                conditions=[condition._asdict() for condition in condition_set],
+                progress=None,
+                optimal=None,
+                final=False,
+                impossible=False,
+            )
+            cached = self.cache.get(condition_set.key, self.sample_count)
+            if cached is not None:
+                source = "cached"
+                first, all_ = cached.distributions()
+                session.state.publish(
+                    first,
+                    all_,
+                    # the seeds tested by the run it came from aren't kept
+                    progress=self.progress(
+                        cached.sample_count, None, cached.sample_count
+                    ),
+                    final=True,
+                )
+            elif condition_set.key in self.jobs:
+                source = "deduplicated"
+                session.job = self.jobs[condition_set.key]
+                session.job.sessions.add(session)
+                self.publish_partial(session.job, (session,))
+            else:
+                source = "queued"
+                # only the histograms are served, so no sample rows are kept
+                shapes = histogram_shapes("grid")
+                sampler = SamplerThread(
+                    self.sample_count,
+                    self.thread_count,
+                    condition_set,
+                    engine=self.engine,
+                    buffers=(
+                        np.zeros(2, np.int64),
+                        tuple(np.zeros(np.prod(shape), np.uint64) for shape in shapes),
+                        np.zeros((0, 3, 2), np.int16),
+                    ),
+                )
+                session.job = Job(sampler)
+                session.job.sessions.add(session)
+                self.jobs[condition_set.key] = session.job
+                self.condition.notify()
+            self.counts[source] += 1
+        self.logger.debug("%s submitted %s (%s)", client, condition_set.digest, source)
+        return source
+
+    def remove(self, client: str):
+        """Drop the session of client"""
+        with self.condition:
+            session = self.sessions.pop(client, None)
+            if session is not None:
+                self.detach(session)
+
+    def detach(self, session: Session):
+        """
+        Stop waiting on the session's job, cancelling it if nobody else is,
+        must be called with the condition held
+        """
+        job = session.job
+        session.job = None
+        if job is None:
+            return
+        job.sessions.discard(session)
+        if not job.sessions:
+            job.sampler.cancel()
+            del self.jobs[job.key]
+
+    def expire_sessions(self):
+        """Drop sessions idle for SESSION_TIMEOUT, must be called with the condition held"""
+        now = monotonic()
+        for client, session in list(self.sessions.items()):
+            if now - session.last_seen > SESSION_TIMEOUT:
+                self.detach(session)
+                del self.sessions[client]
+
+    @staticmethod
+    def progress(accepted: int, tested: int, sample_count: int) -> dict:
+        """Progress field of a state"""
+        return {"accepted": accepted, "tested": tested, "sample_count": sample_count}
+
+    def publish_partial(self, job: Job, sessions):
+        """Publish the job's partial result to sessions"""
+        sampler = job.sampler
+        progress = self.progress(
+            max(sampler.accepted, 0), sampler.tested, sampler.sample_count
+        )
+        if sampler.accepted <= 0:
+            for session in sessions:
+                session.state.publish(progress=progress)
+            return
+        first, all_ = sampler.partial_result()
+        for session in sessions:
+            session.state.publish(first, all_, progress=progress)
+
+    def next_job(self) -> Job:
+        """Job of the least served session waiting on one"""
+        return min(
+            (session for session in self.sessions.values() if session.job is not None),
+            key=lambda session: session.service,
+        ).job
+
+    def stop(self):
+        """Cancel every job and stop the thread after its current burst"""
+        with self.condition:
+            self.stopped = True
+            for job in self.jobs.values():
+                job.sampler.cancel()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.jobs or self.stopped)
+                if self.stopped:
+                    return
+                job = self.next_job()
+            sampler = job.sampler
+            start = perf_counter()
+            sampler.burst(sampler.tested + job.burst_tests)
+            elapsed = perf_counter() - start
+            job.burst_tests = max(
+                int(
+                    job.burst_tests
+                    * min(max(QUANTUM_DURATION / max(elapsed, 1e-6), 0.5), 2.0)
+                ),
+                100,
+            )
+            with self.condition:
+                for session in job.sessions:
+                    session.service += elapsed / len(job.sessions)
+                if sampler.cancelled:
+                    continue
+                if sampler.done:
+                    self.finish_job(job)
+                elif perf_counter() - job.published >= PUBLISH_INTERVAL:
+                    job.published = perf_counter()
+                    self.publish_partial(job, job.sessions)
+
+    def finish_job(self, job: Job):
+        """Cache and publish a finished job, must be called with the condition held"""
+        sampler = job.sampler
+        del self.jobs[job.key]
+        for session in job.sessions:
+            session.job = None
+        if sampler.impossible:
+            for session in job.sessions:
+                session.state.publish(final=True, impossible=True)
+            return
+        sampler.finish()
+        self.cache.put(job.key, *sampler.result, sampler.sample_count)
+        first, all_ = sampler.partial_result()
+        progress = self.progress(sampler.accepted, sampler.tested, sampler.sample_count)
+        for session in job.sessions:
+            session.state.publish(first, all_, progress=progress, final=True)
+
+
+class JobRequestHandler(HeatmapRequestHandler):
+    """
+    Request handler for the job queue API, the single user API per client
+
+    GET /clients/C/{state,conditions,heatmap/first,heatmap/all} like the
+    single user API, long-polling with since and timeout
+    PUT /clients/C/conditions replaces the conditions of C from a JSON list
+    DELETE /clients/C drops the session of C
+    """
+
+    server: "JobServer"
+
+    def client_path(self):
+        """Client and the rest of the path of a /clients/ url, or None"""
+        parts = urlparse(self.path).path.split("/", 3)
+        if len(parts) < 3 or parts[1] != "clients" or not parts[2]:
+            return None
+        return parts[2], "/" + (parts[3] if len(parts) > 3 else "")
+
+    def do_GET(self):
+        client_path = self.client_path()
+        if client_path is None:
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+            return
+        client, path = client_path
+        self.send_state(
+            self.server.queue.state(client), path, parse_qs(urlparse(self.path).query)
+        )
+
+    def do_PUT(self):
+        client_path = self.client_path()
+        if client_path is None or client_path[1] != "/conditions":
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+            return
+        try:
+            conditions = [parse_condition(body) for body in self.read_json()]
+        except (TypeError, ValueError):
+            self.send_json({"error": "invalid conditions"}, HTTPStatus.BAD_REQUEST)
+            return
+        source = self.server.queue.submit(client_path[0], conditions)
+        self.send_json({"source": source}, HTTPStatus.ACCEPTED)
+
+    def do_POST(self):
+        self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+
+    def do_DELETE(self):
+        client_path = self.client_path()
+        if client_path is None or client_path[1] != "/":
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+            return
+        self.server.queue.remove(client_path[0])
+        self.send_json({"removed": client_path[0]}, HTTPStatus.ACCEPTED)
+
+
+class JobServer(ThreadingHTTPServer):
+    """Threaded HTTP server around a JobQueue"""
+
+    daemon_threads = True
+    # every client may connect at once, like at the start of a race
+    request_queue_size = 128
+
+    def __init__(
+        self, queue: JobQueue, host: str = "127.0.0.1", port: int = DEFAULT_PORT
+    ) -> None:
+        super().__init__((host, port), JobRequestHandler)
+        self.logger = logging.getLogger("JobServer")
+        self.queue = queue
+
+    def start(self):
+        """Serve requests on a daemon thread"""
+        Thread(target=self.serve_forever, daemon=True).start()
+        self.logger.info(
+            "Serving job queue API on http://%s:%d", *self.server_address[:2]
+        )
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.shutdown()
+        self.server_close()
+
+
+class SimulatedClient(Thread):
+    """
+    Runner logging a first portal then a random follow up condition and
+    undoing it, waiting for each final heatmap, through the queue directly or
+    through the API
+    """
+
+    def __init__(self, client: str, queue: JobQueue, url: str = None, seed=0):
+        super().__init__(daemon=True)
+        self.client = client
+        self.queue = queue
+        self.url = url
+        self.rng = np.random.default_rng(seed)
+        # (source, seconds to the first partial heatmap, seconds to the final one)
+        self.results = []
+
+    def conditions(self) -> list:
+        """Condition sets the runner logs, one after the other"""
+        first = (build_first_portal_condition(int(self.rng.integers(4))),)
+        branches = predict_next_conditions(first)
+        # then undoes the follow up, which the cache should answer
+        return [first, first + (branches[self.rng.integers(len(branches))],), first]
+
+    def submit(self, conditions) -> str:
+        if self.url is None:
+            return self.queue.submit(self.client, conditions)
+        from urllib.request import Request, urlopen
+
+        request = Request(
+            f"{self.url}/clients/{self.client}/conditions",
+            json.dumps([condition._asdict() for condition in conditions]).encode(),
+            {"Content-Type": "application/json"},
+            method="PUT",
+        )
+        with urlopen(request) as response:
+            return json.loads(response.read())["source"]
+
+    def poll(self, since: int) -> tuple[int, dict]:
+        """Wait for a version newer than since, returning it and its fields"""
+        if self.url is None:
+            state = self.queue.state(self.client)
+            state.wait(since, 5.0)
+            with state.condition:
+                return state.version, dict(state.fields)
+        from urllib.request import urlopen
+
+        with urlopen(
+            f"{self.url}/clients/{self.client}/state?since={since}&timeout=5"
+        ) as response:
+            fields = json.loads(response.read())
+        return fields.pop("version"), fields
+
+    def run(self):
+        for conditions in self.conditions():
+            start = perf_counter()
+            source = self.submit(conditions)
+            version, first_partial = 0, None
+            while True:
+                version, fields = self.poll(version)
+                if first_partial is None and fields["progress"]:
+                    first_partial = perf_counter() - start
+                if fields["final"]:
+                    break
+            self.results.append((source, first_partial, perf_counter() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the job queue API, or simulate clients against it"
+    )
+    parser.add_argument("--sample-count", type=int, default=100_000)
+    parser.add_argument("--thread-count", type=int, default=1)
+    parser.add_argument("--engine", default="numba", choices=("numba", "numpy"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--simulate", type=int, metavar="CLIENTS", help="run simulated clients"
+    )
+    parser.add_argument(
+        "--http", action="store_true", help="simulated clients go through the API"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    job_queue = JobQueue(args.sample_count, args.thread_count, args.engine)
+    job_queue.start()
+    server = None
+    if args.simulate is None or args.http:
+        server = JobServer(job_queue, args.host, args.port)
+        server.start()
+    if args.simulate is None:
+        job_queue.join()
+    else:
+        url = f"http://{args.host}:{server.server_port}" if args.http else None
+        start = perf_counter()
+        clients = [
+            SimulatedClient(f"runner{index}", job_queue, url, seed=index)
+            for index in range(args.simulate)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = perf_counter() - start
+        for client in clients:
+            print(
+                client.client,
+                " | ".join(
+                    f"{source} first {first or 0.0:.2f}s final {final:.2f}s"
+                    for source, first, final in client.results
+                ),
+            )
+        finals = [final for client in clients for _, _, final in client.results]
+        print(
+            f"{len(finals)} requests in {elapsed:.1f}s, final after "
+            f"{np.median(finals):.2f}s median {max(finals):.2f}s worst, "
+            + ", ".join(
+                f"{count} {source}" for source, count in job_queue.counts.items()
+            )
+        )
+        job_queue.stop()
+        if server is not None:
+            server.stop()
@@ -0,0 +1,162 @@
+"""Travel cost kernels for scoring heatmap positions, with per-kernel fast convolution paths"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+KERNELS = ("disk", "gaussian", "cosine", "travel")
+# gaussian standard deviation as a fraction of the maximum distance
+GAUSSIAN_SIGMA = 0.5
+# gaussians are cut off at this many standard deviations
+GAUSSIAN_TRUNCATE = 3.0
+# gaussians with at most this many taps per axis are faster convolved one axis
+# at a time than as FFTs, measured on a 701*701 heatmap
+SEPARABLE_MAXIMUM_TAPS = 9
+# disks up to this radius are faster as row span running sums than as FFTs,
+# measured on a 701*701 heatmap
+RUNNING_SUM_MAXIMUM_RADIUS = 24
+
+
+def kernel_weights(kernel: str, distances: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Weight of a stronghold at the given distances, 1 at the center
+
+    disk: within radius
+    gaussian: normal falloff with a standard deviation of GAUSSIAN_SIGMA * radius,
+    truncated to the square support so it stays separable
+    cosine: half cosine falloff reaching 0 at radius
+    travel: fraction of the maximum distance left over after reaching the stronghold
+    """
+    if kernel == "disk":
+        return (distances <= radius).astype(np.float64)
+    if kernel == "gaussian":
+        return np.exp(-0.5 * (distances / max(radius * GAUSSIAN_SIGMA, 1e-9)) ** 2)
+    if kernel == "cosine":
+        return np.where(
+            distances < radius, 0.5 + 0.5 * np.cos(np.pi * distances / radius), 0.0
+        )
+    if kernel == "travel":
+        return np.clip(1 - distances / max(radius, 1e-9), 0.0, None)
+    raise ValueError(f"Unknown kernel {kernel!r}")
+
+
+def support(kernel: str, radius: float) -> int:
+    """Half width in cells of the square holding every nonzero weight"""
+    if kernel == "gaussian":
+        return int(np.ceil(radius * GAUSSIAN_SIGMA * GAUSSIAN_TRUNCATE))
+    return int(np.ceil(radius))
+
+
+def radial_kernel(kernel: str, radius: float) -> np.ndarray:
+    """Centered (2 * support + 1) square 2d kernel"""
+    offsets = np.arange(-support(kernel, radius), support(kernel, radius) + 1)
+    return kernel_weights(kernel, np.hypot(*np.meshgrid(offsets, offsets)), radius)
+
+
+def fft_size(minimum: int) -> int:
+    """Smallest 2, 3, 5-smooth size of at least minimum, which FFTs handle quickly"""
+    size = minimum
+    while True:
+        remainder = size
+        for factor in (2, 3, 5):
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return size
+        size += 1
+
+
+def fft_convolve(data: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Linear convolution of data with a centered odd sized kernel, same sized output"""
+    half = kernel.shape[0] // 2
+    size = fft_size(max(data.shape) + half)
+    # kernel centered on the origin so the result needs no shifting, and the
+    # padding keeps wrapped around terms out of the kept region
+    wrapped = np.zeros((size, size))
+    indices = np.arange(-half, half + 1) % size
+    wrapped[np.ix_(indices, indices)] = kernel
+    return np.fft.irfft2(
+        np.fft.rfft2(data, s=(size, size)) * np.fft.rfft2(wrapped), s=(size, size)
+    )[: data.shape[0], : data.shape[1]]
+
+
+def separable_convolve(data: np.ndarray, taps: np.ndarray) -> np.ndarray:
+    """Convolve both axes with a short symmetric 1d kernel by summing shifted copies"""
+    half = len(taps) // 2
+    # each pass works along rows, transposing in between
+    for _ in range(2):
+        padded = np.pad(data, ((0, 0), (half, half)))
+        width = data.shape[1]
+        result = taps[0] * padded[:, :width]
+        for i, tap in enumerate(taps[1:], 1):
+            result += tap * padded[:, i : i + width]
+        data = result.T
+    return data
+
+
+if numba is not None:
+
+    @numba.njit(
+        numba.float64[:, :](numba.float64[:, :], numba.float64),
+        nogil=True,
+    )
+    def running_sum_disk(data, radius):
+        """
+        Convolve with a disk by summing one precomputed row span per kernel row,
+        in time linear in the radius
+
+        Serial, as it runs on the Tk thread while sampler kernels may hold
+        numba's parallel runtime
+        """
+        height, width = data.shape
+        cumulative = np.zeros((height, width + 1))
+        for z in range(height):
+            for x in range(width):
+                cumulative[z, x + 1] = cumulative[z, x] + data[z, x]
+        reach = np.int64(np.floor(radius))
+        spans = np.zeros(2 * reach + 1, np.int64)
+        for offset in range(-reach, reach + 1):
+            spans[offset + reach] = np.int64(np.floor(np.sqrt(radius**2 - offset**2)))
+        result = np.zeros((height, width))
+        for z in range(height):
+            for offset in range(-reach, reach + 1):
+                row = z + offset
+                if row < 0 or row >= height:
+                    continue
+                span = spans[offset + reach]
+                for x in range(width):
+                    result[z, x] += (
+                        cumulative[row, min(x + span + 1, width)]
+                        - cumulative[row, max(x - span, 0)]
+                    )
+        return result
+
+
+def choose_method(kernel: str, radius: float) -> str:
+    """Fastest convolution method for a kernel of the given radius"""
+    if (
+        kernel == "gaussian"
+        and 2 * support(kernel, radius) + 1 <= SEPARABLE_MAXIMUM_TAPS
+    ):
+        return "separable"
+    if kernel == "disk" and numba is not None and radius <= RUNNING_SUM_MAXIMUM_RADIUS:
+        return "running_sum"
+    return "fft"
+
+
+def convolve(data: np.ndarray, kernel: str, radius: float, method: str = None):
+    """Score every heatmap position by convolving data with a kernel of radius cells"""
+    data = np.asarray(data, dtype=np.float64)
+    if method is None:
+        method = choose_method(kernel, radius)
+    if method == "separable":
+        offsets = np.arange(-support(kernel, radius), support(kernel, radius) + 1)
+        return separable_convolve(
+            data, np.exp(-0.5 * (offsets / max(radius * GAUSSIAN_SIGMA, 1e-9)) ** 2)
+        )
+    if method == "running_sum":
+        return running_sum_disk(np.ascontiguousarray(data), float(radius))
+    return fft_convolve(data, radial_kernel(kernel, radius))
@@ -0,0 +1,478 @@
+"""
+Sampling several condition sets in a single pass over one seed stream
+
+Each seed's strongholds are generated once however many sets accept it, and
+the rng of each salt is seeded once per seed however many conditions use it
+"""
+
+import argparse
+from typing import NamedTuple
+
+import numba
+import numpy as np
+from numba_progress.numba_atomic import atomic_add, atomic_min
+
+from . import java_random, stronghold
+from .condition_model import ConditionSet, condition_key
+from .heatmap import CHUNK_SIZE, IMPOSSIBLE_TEST_COUNT, claim_chunk, reserve_quota
+from .sampler import MAX_KEPT_SAMPLES, SamplerThread
+from .seed_stream import counter_seed
+
+# each kept row records the queries that kept it as bits of a uint64
+MAXIMUM_QUERIES = 64
+HEATMAP_CELLS = 701 * 701
+
+
+class QueryArrays(NamedTuple):
+    """
+    Struct of arrays form of several condition sets, each distinct condition
+    stored once however many sets share it
+
+    Bit i of queries[j] is set if query i has condition j. Conditions shared
+    by every query come first so most seeds are rejected by them alone, and
+    the rest are ordered so that those drawing the same rng output, like the
+    16 x coordinates of a decorator, are adjacent
+    """
+
+    salts: np.ndarray
+    int_maxima: np.ndarray
+    int_values: np.ndarray
+    float_maxima: np.ndarray
+    queries: np.ndarray
+
+
+def query_arrays(condition_sets) -> QueryArrays:
+    """QueryArrays of condition sets"""
+    keys = [condition_key(conditions) for conditions in condition_sets]
+    shared = set(keys[0]).intersection(*keys[1:]) if keys else set()
+
+    def draw(condition):
+        salt, int_maximum, int_value, float_maximum = condition
+        return condition not in shared, salt, int_maximum, float_maximum, int_value
+
+    distinct = sorted({condition for key in keys for condition in key}, key=draw)
+    columns = tuple(zip(*distinct)) or ((), (), (), ())
+    return QueryArrays(
+        np.array(columns[0], np.int64),
+        np.array(columns[1], np.int64),
+        np.array(columns[2], np.int64),
+        np.array(columns[3], np.float64),
+        np.array(
+            [
+                sum(1 << query for query, key in enumerate(keys) if condition in key)
+                for condition in distinct
+            ],
+            np.uint64,
+        ),
+    )
+
+
+numba_QueryArrays = numba.typeof(query_arrays(((),)))
+
+
+@numba.njit(
+    numba.int64(numba.int64, numba.float32, numba.int64, numba.float32),
+    nogil=True,
+)
+def draw_outcome(state, chance_rand, int_maximum, float_maximum):
+    """
+    Output of the rng calls a condition checks, from the initial state of
+    its salted rng and the first float it generates
+
+    The output is the int for int conditions, -1 if the chance of a float int
+    pair failed, and 1 if a float condition passes or 0 if it fails
+    """
+    if float_maximum < 0.0:
+        chance_rand = -chance_rand
+    if int_maximum == 0:
+        return 1 if chance_rand < float_maximum else 0
+    if float_maximum == 0.0:
+        return java_random.next_int(state, int_maximum)[1]
+    if chance_rand > float_maximum:
+        return -1
+    state = java_random.next_seed(java_random.next_seed(state))
+    return java_random.next_int(state, int_maximum)[1]
+
+
+@numba.njit(
+    numba.void(
+        numba.int64[:],
+        numba.int64[:],
+        numba.int64[:],
+        numba.int64[:],
+        numba.int64,
+        numba.int64,
+        numba_QueryArrays,
+        numba.uint32[:],
+        numba.uint32[:],
+        numba.int16[:, :, :],
+        numba.int64[:],
+        numba.uint64[:],
+        numba.int64,
+        numba.uint64,
+    ),
+    nogil=True,
+)
+def sample_query_chunks(
+    progress,
+    claimed,
+    reserved,
+    rows,
+    count,
+    thread_count,
+    queries,
+    first_stronghold_locations,
+    all_stronghold_locations,
+    samples,
+    seeds,
+    masks,
+    tested_limit,
+    seed_key,
+):
+    """One worker of accumulate_queries, sampling claimed blocks until done"""
+    query_count = progress.shape[0] - 2
+    salts = queries.salts
+    int_maxima = queries.int_maxima
+    int_values = queries.int_values
+    float_maxima = queries.float_maxima
+    required = queries.queries
+    chunks = np.empty((CHUNK_SIZE, 3, 2), dtype=np.int16)
+    chunk_seeds = np.empty(CHUNK_SIZE, dtype=np.int64)
+    chunk_masks = np.empty(CHUNK_SIZE, dtype=np.uint64)
+    kept = np.empty(query_count, dtype=np.int64)
+    # blocks are sized by the query furthest from its quota
+    slowest = np.empty(1, dtype=np.int64)
+    while atomic_add(progress, 0, 0) >= 0:
+        slowest[0] = count
+        active = np.uint64(0)
+        for query in range(query_count):
+            accepted = atomic_add(reserved, query, 0)
+            if atomic_add(progress, 2 + query, 0) >= 0 and accepted < count:
+                active |= np.uint64(1) << np.uint64(query)
+                slowest[0] = min(slowest[0], accepted)
+        if not active:
+            return
+        start, end = claim_chunk(claimed, slowest, count, thread_count, tested_limit)
+        if start >= end:
+            return
+        accepted = 0
+        for index in range(start, end):
+            seed = counter_seed(seed_key, index)
+            mask = active
+            # conditions whose salt's rng outputs and whose draw are held
+            salted = -1
+            drawn_from = -1
+            state = np.int64(0)
+            chance_rand = np.float32(0.0)
+            drawn = np.int64(0)
+            for i in range(salts.shape[0]):
+                if not mask & required[i]:
+                    continue
+                if salted < 0 or salts[i] != salts[salted]:
+                    state = java_random.init(seed + salts[i])
+                    chance_rand = java_random.next_float(state)[1]
+                    salted = i
+                if (
+                    drawn_from < 0
+                    or salts[i] != salts[drawn_from]
+                    or int_maxima[i] != int_maxima[drawn_from]
+                    or float_maxima[i] != float_maxima[drawn_from]
+                ):
+                    drawn = draw_outcome(
+                        state, chance_rand, int_maxima[i], float_maxima[i]
+                    )
+                    drawn_from = i
+                if drawn != (int_values[i] if int_maxima[i] else 1):
+                    mask &= ~required[i]
+                    if not mask:
+                        break
+            if mask == 0:
+                continue
+            strongholds = stronghold.gen_first_ring_strongholds(seed)
+            for i in range(3):
+                chunks[accepted, i, 0] = strongholds[i][0]
+                chunks[accepted, i, 1] = strongholds[i][1]
+            chunk_seeds[accepted] = seed
+            chunk_masks[accepted] = mask
+            accepted += 1
+        tested_count = atomic_add(progress, 1, end - start) + end - start
+
+        for query in range(query_count):
+            kept[query] = 0
+            bit = np.uint64(1) << np.uint64(query)
+            if not active & bit:
+                continue
+            query_accepted = 0
+            for i in range(accepted):
+                if chunk_masks[i] & bit:
+                    query_accepted += 1
+            if query_accepted == 0:
+                # assume impossible
+                if (
+                    tested_count > IMPOSSIBLE_TEST_COUNT * thread_count
+                    and atomic_add(reserved, query, 0) == 0
+                ):
+                    atomic_min(progress, 2 + query, -1)
+                continue
+            kept[query] = reserve_quota(
+                reserved[query : query + 1], count, query_accepted
+            )[1]
+            offset = query * HEATMAP_CELLS
+            seen = 0
+            for i in range(accepted):
+                if not chunk_masks[i] & bit:
+                    continue
+                if seen >= kept[query]:
+                    # past the query's quota
+                    chunk_masks[i] &= ~bit
+                    continue
+                seen += 1
+                atomic_add(
+                    first_stronghold_locations,
+                    offset
+                    + (chunks[i, 0, 0] * 2 + 350)
+                    + 701 * (chunks[i, 0, 1] * 2 + 350),
+                    1,
+                )
+                for j in range(3):
+                    atomic_add(
+                        all_stronghold_locations,
+                        offset
+                        + (chunks[i, j, 0] * 2 + 350)
+                        + 701 * (chunks[i, j, 1] * 2 + 350),
+                        1,
+                    )
+
+        row_count = 0
+        for i in range(accepted):
+            if chunk_masks[i]:
+                row_count += 1
+        first_row = atomic_add(rows, 0, row_count)
+        row = first_row
+        for i in range(accepted):
+            if not chunk_masks[i]:
+                continue
+            if row < samples.shape[0]:
+                samples[row] = chunks[i]
+                seeds[row] = chunk_seeds[i]
+                masks[row] = chunk_masks[i]
+            row += 1
+        atomic_add(progress, 0, row_count)
+        for query in range(query_count):
+            if kept[query]:
+                atomic_add(progress, 2 + query, kept[query])
+
+
+@numba.njit(
+    numba.void(
+        numba.int64[:],
+        numba.uint64,
+        numba.uint64,
+        numba_QueryArrays,
+        numba.uint32[:],
+        numba.uint32[:],
+        numba.int16[:, :, :],
+        numba.int64[:],
+        numba.uint64[:],
+        numba.int64,
+        numba.uint64,
+    ),
+    nogil=True,
+    parallel=True,
+)
+def accumulate_queries(
+    progress,
+    count,
+    thread_count,
+    queries,
+    first_stronghold_locations,
+    all_stronghold_locations,
+    samples,
+    seeds,
+    masks,
+    tested_limit,
+    seed_key,
+):
+    """
+    Add stronghold locations of seeds passing each query's conditions to its
+    own slice of flat query count * 701*701 histograms, until every query has
+    exactly count samples or progress[1] reaches tested_limit
+
+    Seeds accepted by any query are kept once in samples and seeds, if they
+    fit, with bit i of masks set if query i kept them
+
+    progress[0] counts kept rows (negative to cancel), progress[1] counts
+    tested seeds like heatmap.accumulate_data and progress[2 + i] counts the
+    samples accepted by query i (-1 if its conditions appear impossible)
+    """
+    query_count = progress.shape[0] - 2
+    # blocks are claimed, samples reserved and rows placed on private counters
+    # so that progress only ever counts finished blocks and kept samples
+    claimed = progress[1:2].copy()
+    reserved = np.maximum(progress[2 : 2 + query_count], 0)
+    rows = progress[:1].copy()
+    for _ in numba.prange(thread_count):
+        sample_query_chunks(
+            progress,
+            claimed,
+            reserved,
+            rows,
+            np.int64(count),
+            np.int64(thread_count),
+            queries,
+            first_stronghold_locations,
+            all_stronghold_locations,
+            samples,
+            seeds,
+            masks,
+            tested_limit,
+            seed_key,
+        )
+
+
+class MultiQuerySampler(SamplerThread):
+    """
+    SamplerThread answering several condition sets at once, sample_count
+    samples each, from one pass over its seed stream
+
+    Only the numba engine and grid mode are supported
+    """
+
+    def __init__(
+        self,
+        sample_count,
+        thread_count,
+        condition_sets,
+        cpu_budget: float = None,
+        low_priority: bool = False,
+        cores=(),
+        seed_key: int = None,
+    ):
+        self.condition_sets = tuple(
+            ConditionSet.of(conditions) for conditions in condition_sets
+        )
+        query_count = len(self.condition_sets)
+        if not 0 < query_count <= MAXIMUM_QUERIES:
+            raise ValueError(
+                f"Between 1 and {MAXIMUM_QUERIES} condition sets can be sampled at once"
+            )
+        if 3 * sample_count > np.iinfo(np.uint32).max:
+            raise ValueError("Too many samples per query for 32 bit histograms")
+        self.queries = query_arrays(self.condition_sets)
+        row_count = min(sample_count * query_count, MAX_KEPT_SAMPLES)
+        super().__init__(
+            sample_count,
+            thread_count,
+            (),
+            cpu_budget,
+            low_priority,
+            cores,
+            buffers=(
+                np.zeros(2 + query_count, np.int64),
+                # 32 bit counts halve the memory traffic of the histograms of
+                # every query, which is far larger than the caches
+                tuple(
+                    np.zeros(query_count * HEATMAP_CELLS, np.uint32) for _ in range(2)
+                ),
+                np.zeros((row_count, 3, 2), np.int16),
+            ),
+            seed_key=seed_key,
+        )
+        self.shapes = ((query_count, 701, 701),) * 2
+        # bit i of a kept row's mask is set if query i kept it
+        self.masks = np.zeros(row_count, np.uint64)
+        self.outputs = self.histograms + (self.samples, self.seeds, self.masks)
+
+    @property
+    def query_accepted(self) -> np.ndarray:
+        """Samples accepted by each query so far, -1 if it appears impossible"""
+        return np.maximum(self.progress[2:], -1)
+
+    @property
+    def done(self) -> bool:
+        return self.progress[0] < 0 or bool(
+            np.all((self.progress[2:] < 0) | (self.progress[2:] >= self.sample_count))
+        )
+
+    @property
+    def impossible(self) -> bool:
+        return not self.cancelled and bool(np.all(self.progress[2:] < 0))
+
+    def partial_result(self):
+        """Copy of the histograms accumulated so far, normalized per query"""
+        accepted = np.maximum(self.progress[2:], 1)[:, None, None]
+        return tuple(
+            np.reshape(histogram, shape) / accepted
+            for histogram, shape in zip(self.histograms, self.shapes)
+        )
+
+    def numba_burst(self, tested_limit):
+        accumulate_queries(
+            self.progress,
+            self.sample_count,
+            self.thread_count,
+            self.queries,
+            *self.outputs,
+            tested_limit,
+            np.uint64(self.seed_key),
+        )
+
+    def query_rows(self, query: int) -> np.ndarray:
+        """Mask of the kept rows kept by query"""
+        rows = len(self.accepted_samples())
+        return (self.masks[:rows] >> np.uint64(query)) & np.uint64(1) == 1
+
+    def query_result(self, query: int) -> tuple:
+        """
+        Raw first and all stronghold histograms, start chunks and seeds of
+        query, or None if its conditions appear impossible
+        """
+        if self.result is None or self.progress[2 + query] < 0:
+            return None
+        rows = self.query_rows(query)
+        return (
+            self.result[0][query],
+            self.result[1][query],
+            self.accepted_samples()[rows],
+            self.accepted_seeds()[rows],
+        )
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from .condition_model import build_first_portal_condition
+    from .speculation import predict_next_conditions
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Compare sampling the predicted next conditions after a first portal "
+            "in one pass against one run each"
+        )
+    )
+    parser.add_argument("--sample-count", type=int, default=100_000)
+    parser.add_argument("--thread-count", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=MAXIMUM_QUERIES)
+    args = parser.parse_args()
+    base = (build_first_portal_condition(0),)
+    condition_sets = [
+        base + (condition,)
+        for condition in predict_next_conditions(base)[: args.queries]
+    ]
+    # compile both kernels before timing
+    MultiQuerySampler(1, args.thread_count, condition_sets[:1]).run()
+    SamplerThread(1, args.thread_count, ()).run()
+
+    start = perf_counter()
+    for conditions in condition_sets:
+        SamplerThread(args.sample_count, args.thread_count, conditions).run()
+    separate = perf_counter() - start
+    start = perf_counter()
+    sampler = MultiQuerySampler(args.sample_count, args.thread_count, condition_sets)
+    sampler.run()
+    single_pass = perf_counter() - start
+    print(
+        f"{len(condition_sets)} queries of {args.sample_count} samples: "
+        f"{separate:.2f}s separately, {single_pass:.2f}s in one pass "
+        f"({separate / single_pass:.1f}x)"
+    )
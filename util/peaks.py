@@ -0,0 +1,207 @@
+"""Ranked candidate points and compass sector optima extracted from convolved heatmaps"""
+
+import argparse
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from .samples import Disk, SampleCloud
+
+# sector counts offered for the per sector optima
+SECTOR_COUNTS = (4, 8, 16)
+# 4 sectors are the quadrants by the signs of x and z, in the order of their bit index
+QUADRANTS = ("--", "-+", "+-", "++")
+# compass points clockwise from north (-z), east being +x
+COMPASS_POINTS = (
+    "N",
+    "NNE",
+    "NE",
+    "ENE",
+    "E",
+    "ESE",
+    "SE",
+    "SSE",
+    "S",
+    "SSW",
+    "SW",
+    "WSW",
+    "W",
+    "WNW",
+    "NW",
+    "NNW",
+)
+# candidate points ranked by default
+TOP_PEAK_COUNT = 5
+# most local maxima the candidates are picked from, best first, so flat
+# plateaus don't blow up the suppression cost
+MAXIMUM_PEAK_POOL = 16384
+
+
+class Peak(NamedTuple):
+    """
+    Candidate point in heatmap (nether block) units, its convolved score and
+    the probability of a stronghold within the radius of it or any better
+    ranked candidate, None without samples to estimate it from
+    """
+
+    x: int
+    z: int
+    score: float
+    coverage: float
+
+
+def sector_names(sector_count: int) -> tuple[str, ...]:
+    """Names of the sectors, in the order of their labels"""
+    if sector_count == 4:
+        return QUADRANTS
+    if sector_count not in SECTOR_COUNTS:
+        raise ValueError(f"Unsupported sector count {sector_count}")
+    return COMPASS_POINTS[:: len(COMPASS_POINTS) // sector_count]
+
+
+@lru_cache(maxsize=len(SECTOR_COUNTS))
+def sector_labels(sector_count: int):
+    """
+    Sector of every flattened heatmap cell, the cells sorted by sector and
+    the start of each sector in that order
+
+    4 sectors split on the axes like the quadrants, more are centered on the
+    compass points
+    """
+    offsets = np.arange(701) - 350
+    z, x = np.meshgrid(offsets, offsets, indexing="ij")
+    if sector_count == 4:
+        labels = (x >= 0) * 2 + (z >= 0)
+    else:
+        sector_names(sector_count)
+        bearings = np.arctan2(x, -z) % (2 * np.pi)
+        labels = np.rint(bearings * sector_count / (2 * np.pi)).astype(np.int64)
+        labels %= sector_count
+    labels = labels.ravel()
+    # stable so the first of equal scores is the first in the heatmap, like argmax
+    order = np.argsort(labels, kind="stable")
+    starts = np.searchsorted(labels[order], np.arange(sector_count))
+    return labels, order, starts
+
+
+def sector_candidates(
+    convolved: np.ndarray, sector_count: int, threshold: float = 1.0
+) -> list[np.ndarray]:
+    """
+    Flat indices of the cells of each sector scoring at least threshold times
+    the sector's best, best first, found in one pass over the heatmap
+    """
+    _, order, starts = sector_labels(sector_count)
+    values = convolved.ravel()[order]
+    maxima = np.maximum.reduceat(values, starts)
+    counts = np.diff(np.append(starts, len(values)))
+    # ascending, so already grouped by sector
+    keep = np.flatnonzero(values >= np.repeat(maxima * threshold, counts))
+    bounds = np.searchsorted(keep, np.append(starts, len(values)))
+    return [
+        order[cells[np.argsort(-values[cells])]]
+        for cells in (keep[start:end] for start, end in zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+def sector_peaks(convolved: np.ndarray, sector_count: int = 4) -> dict:
+    """Coarse (x, z) argmax of every sector, keyed by the sector names"""
+    return {
+        name: tuple(int(coordinate) - 350 for coordinate in divmod(cells[0], 701)[::-1])
+        for name, cells in zip(
+            sector_names(sector_count), sector_candidates(convolved, sector_count)
+        )
+    }
+
+
+def local_maxima(convolved: np.ndarray) -> np.ndarray:
+    """Flat indices of the positive cells at least as high as their 8 neighbours"""
+    padded = np.pad(convolved, 1, constant_values=-np.inf)
+    # separable, the maximum over each row's 3 cells then over 3 rows
+    rows = np.maximum(np.maximum(padded[:, :-2], padded[:, 1:-1]), padded[:, 2:])
+    neighbourhood = np.maximum(np.maximum(rows[:-2], rows[1:-1]), rows[2:])
+    return np.flatnonzero((convolved >= neighbourhood) & (convolved > 0))
+
+
+def top_peaks(
+    convolved: np.ndarray,
+    radius: float,
+    count: int = TOP_PEAK_COUNT,
+    separation: float = None,
+    cloud: SampleCloud = None,
+) -> list[Peak]:
+    """
+    Up to count best local maxima of convolved at least separation apart
+    (radius by default), with the fraction of the surviving samples of cloud
+    with a stronghold in any of the disks of radius around them so far
+
+    radius is in heatmap cells like the maximum distance slider / 8
+    """
+    separation = radius if separation is None else separation
+    pool = local_maxima(convolved)
+    scores = convolved.ravel()[pool]
+    if len(pool) > MAXIMUM_PEAK_POOL:
+        best = np.argpartition(scores, -MAXIMUM_PEAK_POOL)[-MAXIMUM_PEAK_POOL:]
+        pool, scores = pool[best], scores[best]
+    order = np.lexsort((pool, -scores))
+    pool, scores = pool[order], scores[order]
+    pool_z, pool_x = np.divmod(pool, 701)
+    alive = np.ones(len(pool), np.bool_)
+    if cloud is not None:
+        covered = np.zeros(cloud.sample_count, np.bool_)
+    peaks = []
+    coverage = None
+    while len(peaks) < count and alive.any():
+        # greedy non-maximum suppression, the best survivor suppressing its
+        # neighbourhood
+        index = int(np.argmax(alive))
+        x, z = int(pool_x[index]), int(pool_z[index])
+        alive &= (pool_x - x) ** 2 + (pool_z - z) ** 2 >= separation**2
+        alive[index] = False
+        if cloud is not None:
+            covered[cloud.points_within(Disk(x - 350, z - 350, radius)) // 3] = True
+            coverage = np.count_nonzero(covered & cloud.alive) / max(
+                cloud.surviving_count, 1
+            )
+        peaks.append(Peak(x - 350, z - 350, float(scores[index]), coverage))
+    return peaks
+
+
+if __name__ == "__main__":
+    from time import perf_counter
+
+    from .condition_model import build_first_portal_condition
+    from .kernels import convolve
+    from .sampler import SamplerThread
+
+    parser = argparse.ArgumentParser(
+        description="Rank candidate points and sector optima after logging a first portal"
+    )
+    parser.add_argument("--direction", type=int, default=0, choices=range(4))
+    parser.add_argument("--sample-count", type=int, default=1_000_000)
+    parser.add_argument("--maximum-distance", type=float, default=500.0)
+    parser.add_argument("--kernel", default="disk")
+    parser.add_argument("--count", type=int, default=TOP_PEAK_COUNT)
+    parser.add_argument("--sectors", type=int, default=8, choices=SECTOR_COUNTS)
+    args = parser.parse_args()
+    sampler = SamplerThread(
+        args.sample_count, 1, (build_first_portal_condition(args.direction),)
+    )
+    sampler.run()
+    _, all_distribution = sampler.partial_result()
+    cloud = SampleCloud(sampler.accepted_samples())
+    radius = args.maximum_distance / 8
+    convolved = convolve(all_distribution, args.kernel, radius)
+    start = perf_counter()
+    peaks = top_peaks(convolved, radius, args.count, cloud=cloud)
+    sectors = sector_peaks(convolved, args.sectors)
+    elapsed = perf_counter() - start
+    for rank, peak in enumerate(peaks, 1):
+        print(
+            f"{rank}: {peak.x} {peak.z} {peak.score*100:.2f}% "
+            f"(covers {peak.coverage*100:.2f}%)"
+        )
+    for name, (x, z) in sectors.items():
+        print(f"{name}: {x} {z} {convolved[z + 350, x + 350]*100:.2f}%")
+    print(f"Extracted in {elapsed*1000:.0f}ms")
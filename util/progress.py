@@ -0,0 +1,73 @@
+"""Throughput and ETA tracking for stronghold distribution generation"""
+
+from collections import deque
+from time import perf_counter
+from typing import NamedTuple
+
+
+class ProgressStats(NamedTuple):
+    """Snapshot of generation progress"""
+
+    accepted: int
+    tested: int
+    sample_count: int
+    accepted_rate: float
+    tested_rate: float
+    eta: float
+
+    @property
+    def fraction(self) -> float:
+        """Fraction of the requested samples that have been accepted"""
+        if self.sample_count <= 0:
+            return 1.0
+        return min(max(self.accepted, 0) / self.sample_count, 1.0)
+
+    @property
+    def acceptance_ratio(self) -> float:
+        """Fraction of tested seeds that passed all conditions"""
+        if self.tested <= 0:
+            return 0.0
+        return max(self.accepted, 0) / self.tested
+
+    def __str__(self) -> str:
+        eta = "--" if self.eta == float("inf") else f"{self.eta:.1f}s"
+        return (
+            f"{max(self.accepted, 0)}/{self.sample_count} samples "
+            f"({self.fraction*100:.01f}%) | "
+            f"{self.accepted_rate:,.0f} accepted/s | "
+            f"{self.tested_rate:,.0f} tested/s | "
+            f"ratio {self.acceptance_ratio:.3g} | ETA {eta}"
+        )
+
+
+class ProgressTracker:
+    """Derive rates and ETA from the sampler's accepted/tested counters"""
+
+    def __init__(self, sample_count: int, window: float = 2.0) -> None:
+        self.sample_count = sample_count
+        self.window = window
+        self.history = deque()
+
+    def update(self, accepted: int, tested: int, now: float = None) -> ProgressStats:
+        """Record a new counter reading and compute rates over the sliding window"""
+        now = perf_counter() if now is None else now
+        self.history.append((now, accepted, tested))
+        while len(self.history) > 2 and now - self.history[1][0] >= self.window:
+            self.history.popleft()
+        start_time, start_accepted, start_tested = self.history[0]
+        elapsed = now - start_time
+        if elapsed > 0:
+            accepted_rate = max(accepted - start_accepted, 0) / elapsed
+            tested_rate = max(tested - start_tested, 0) / elapsed
+        else:
+            accepted_rate = tested_rate = 0.0
+        remaining = self.sample_count - max(accepted, 0)
+        if remaining <= 0:
+            eta = 0.0
+        elif accepted_rate > 0:
+            eta = remaining / accepted_rate
+        else:
+            eta = float("inf")
+        return ProgressStats(
+            accepted, tested, self.sample_count, accepted_rate, tested_rate, eta
+        )
@@ -0,0 +1,27 @@
+"""GUI widget for displaying generation progress"""
+
+import customtkinter as ctk
+
+from .progress import ProgressStats
+
+
+class ProgressDisplay(ctk.CTkFrame):
+    """Progress bar with throughput, acceptance ratio and ETA"""
+
+    def __init__(self, *args, width: int = 400, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.progress_bar = ctk.CTkProgressBar(self, width=width)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", padx=5, pady=(5, 0))
+        self.stats_label = ctk.CTkLabel(self, text="Idle")
+        self.stats_label.pack(fill="x", padx=5)
+
+    def show(self, stats: ProgressStats):
+        """Update the bar and label from a progress snapshot"""
+        self.progress_bar.set(stats.fraction)
+        self.stats_label.configure(text=str(stats))
+
+    def finish(self, text: str):
+        """Fill the bar and replace the stats with a final message"""
+        self.progress_bar.set(1)
+        self.stats_label.configure(text=text)
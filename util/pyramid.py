@@ -0,0 +1,153 @@
+"""Hierarchical optimum search refining the coarse heatmap argmax on fine tiles"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .peaks import sector_candidates, sector_names
+
+# half width of a fine tile in heatmap (nether block) units
+TILE_RADIUS = 2.0
+# fine tile step, 2 overworld blocks
+TILE_STEP = 0.25
+# most coarse peaks refined per search
+MAX_TILES = 4
+# coarse peaks scoring below this fraction of the best one aren't refined
+TILE_THRESHOLD = 0.9
+
+
+class Optimum(NamedTuple):
+    """Refined position in heatmap (nether block) units and its exact score"""
+
+    x: float
+    z: float
+    score: float
+
+
+class SparseHeatmap:
+    """Nonzero cells of a 701*701 heatmap as point masses, sorted by x for range queries"""
+
+    def __init__(self, distribution: np.ndarray) -> None:
+        z, x = np.nonzero(distribution)
+        order = np.argsort(x, kind="stable")
+        self.x = (x[order] - 350).astype(np.float64)
+        self.z = (z[order] - 350).astype(np.float64)
+        self.mass = distribution[z[order], x[order]].astype(np.float64)
+
+    def near(self, x: float, z: float, radius: float):
+        """Coordinates and masses of every point within the square of radius around (x, z)"""
+        points = slice(
+            np.searchsorted(self.x, x - radius, side="left"),
+            np.searchsorted(self.x, x + radius, side="right"),
+        )
+        keep = np.abs(self.z[points] - z) <= radius
+        return self.x[points][keep], self.z[points][keep], self.mass[points][keep]
+
+    def tile_scores(self, x: float, z: float, radius: float):
+        """
+        Tile offsets and the exact disk scores on a fine tile centered on
+        (x, z), indexed [z offset, x offset] like the heatmaps
+        """
+        offsets = np.arange(-TILE_RADIUS, TILE_RADIUS + TILE_STEP / 2, TILE_STEP)
+        point_x, point_z, mass = self.near(x, z, radius + TILE_RADIUS)
+        # only points near the disk's edge can be in for some offsets and out for others
+        reach = TILE_RADIUS * np.sqrt(2)
+        distances = np.hypot(point_x - x, point_z - z)
+        edge = np.abs(distances - radius) <= reach
+        inside = mass[distances < radius - reach].sum()
+        point_x, point_z, mass = point_x[edge], point_z[edge], mass[edge]
+        scores = np.full((len(offsets), len(offsets)), inside)
+        delta_x = point_x[None, :] - (x + offsets)[:, None]
+        # one row of the tile at a time to bound memory on large radii
+        for row, offset in enumerate(offsets):
+            delta_z = point_z - (z + offset)
+            scores[row] += (
+                (delta_x**2 + delta_z[None, :] ** 2 <= radius**2) * mass[None, :]
+            ).sum(axis=1)
+        return offsets, scores
+
+
+def separated_peaks(cells: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Up to MAX_TILES coarse (x, z) peaks worth refining, at least a tile
+    apart, among best first flat heatmap indices
+    """
+    peaks = []
+    # capped so flat plateaus don't blow up the candidate count
+    for candidate in cells[:4096]:
+        z, x = divmod(int(candidate), 701)
+        x, z = x - 350, z - 350
+        if any(
+            abs(x - peak_x) <= TILE_RADIUS and abs(z - peak_z) <= TILE_RADIUS
+            for peak_x, peak_z in peaks
+        ):
+            continue
+        peaks.append((x, z))
+        if len(peaks) == MAX_TILES:
+            break
+    return peaks
+
+
+def refine_peaks(
+    sparse: SparseHeatmap,
+    convolved: np.ndarray,
+    peaks: list[tuple[int, int]],
+    radius: float,
+    kernel: str = "disk",
+) -> Optimum:
+    """
+    Refine the best of the coarse peaks of a disk convolution by scoring fine
+    tiles around them exactly, with the unrounded radius in heatmap units
+
+    Smooth kernels barely change within a cell, so their first peak is
+    returned as is
+    """
+    best = None
+    if kernel != "disk":
+        peak_x, peak_z = peaks[0]
+        return Optimum(
+            float(peak_x), float(peak_z), float(convolved[peak_z + 350, peak_x + 350])
+        )
+    for peak_x, peak_z in peaks:
+        offsets, scores = sparse.tile_scores(peak_x, peak_z, radius)
+        row, column = divmod(int(np.argmax(scores)), scores.shape[1])
+        # prefer the offset nearest the coarse peak among equal scores
+        ties = np.argwhere(scores == scores[row, column])
+        row, column = ties[
+            np.argmin(np.abs(offsets[ties[:, 0]]) + np.abs(offsets[ties[:, 1]]))
+        ]
+        optimum = Optimum(
+            peak_x + float(offsets[column]),
+            peak_z + float(offsets[row]),
+            float(scores[row, column]),
+        )
+        if best is None or optimum.score > best.score:
+            best = optimum
+    return best
+
+
+def heatmap_optima(
+    distribution: np.ndarray,
+    convolved: np.ndarray,
+    radius: float,
+    kernel: str = "disk",
+    sector_count: int = 4,
+) -> tuple[Optimum, dict]:
+    """
+    Overall optimum and the optima of each sector, keyed by their names (the
+    signs of the quadrants or compass points)
+
+    Every sector's peaks worth refining come from one pass over the heatmap,
+    and the overall optimum is the best sector optimum
+    """
+    sparse = SparseHeatmap(distribution)
+    sector_optima = {
+        name: refine_peaks(sparse, convolved, separated_peaks(cells), radius, kernel)
+        for name, cells in zip(
+            sector_names(sector_count),
+            sector_candidates(convolved, sector_count, TILE_THRESHOLD),
+        )
+    }
+    # the sectors cover the heatmap, so the best of them holds the overall argmax
+    overall_optimum = max(sector_optima.values(), key=lambda optimum: optimum.score)
+    return overall_optimum, sector_optima
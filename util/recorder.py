@@ -0,0 +1,78 @@
+"""Recording of a session's timestamped input events, to be replayed by util.replay"""
+
+import json
+import os
+import time
+from threading import Lock
+from time import perf_counter
+from typing import NamedTuple
+
+
+class RecordedEvent(NamedTuple):
+    """
+    One line of a recording
+
+    kind is one of
+    clipboard: the new clipboard contents
+    keybind: the name of the keybind that fired
+    settings: sampling and display settings in effect from then on
+    display: the coordinates text after a redraw, to measure live latency
+    """
+
+    time: float
+    kind: str
+    value: object
+
+
+def session_path(directory: str) -> str:
+    """New timestamped recording file in directory"""
+    return os.path.join(directory, time.strftime("session-%Y%m%d-%H%M%S.jsonl"))
+
+
+class EventRecorder:
+    """Appends events to a JSON lines file, timed from when recording started"""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = Lock()
+        self.start = perf_counter()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, kind: str, value=None):
+        """Append an event, callable from any thread"""
+        line = json.dumps(
+            {
+                "time": round(perf_counter() - self.start, 6),
+                "kind": kind,
+                "value": value,
+            }
+        )
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line + "\n")
+            # flushed so a crash loses at most the event being written
+            self.file.flush()
+
+    def close(self):
+        """Stop recording"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_events(path: str) -> list[RecordedEvent]:
+    """Events of a recording in order, skipping a truncated last line"""
+    events = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            events.append(RecordedEvent(event["time"], event["kind"], event["value"]))
+    return events
@@ -0,0 +1,406 @@
+"""Headless replay of recorded sessions, timing each stage from clipboard to coordinates"""
+
+import argparse
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+
+from .cache import ResultCache
+from .condition_model import GenericCondition, condition_key
+from .eyes import DEFAULT_STANDARD_DEVIATION
+from .peaks import TOP_PEAK_COUNT
+from .recorder import read_events
+from .samples import Disk
+from .session import (
+    DisplacementCache,
+    EditHistory,
+    apply_clipboard,
+    cached_result,
+    convolve_heatmaps,
+    draw_heatmaps,
+    eye_posterior,
+    result_distributions,
+    score_heatmaps,
+    summarize,
+)
+
+STAGES = (
+    "parse",
+    "cache",
+    "sample",
+    "exclude",
+    "convolve",
+    "optima",
+    "eyes",
+    "draw",
+    "advise",
+    "total",
+)
+
+
+def percentiles(durations) -> tuple[float, float, float, float]:
+    """p50, p90, p99 and maximum of durations in milliseconds"""
+    milliseconds = np.asarray(durations) * 1000
+    return (*np.percentile(milliseconds, (50, 90, 99)), float(np.max(milliseconds)))
+
+
+def recorded_latencies(events) -> list[float]:
+    """
+    Live latencies in a recording, from each clipboard or keybind event to the
+    first redraw after it and before the next input
+    """
+    latencies = []
+    start = None
+    for event in events:
+        if event.kind in ("clipboard", "keybind"):
+            start = event.time
+        elif event.kind == "display" and start is not None:
+            latencies.append(event.time - start)
+            start = None
+    return latencies
+
+
+class Replayer:
+    """
+    Feeds recorded events through the same parsing, sampling and optimization
+    code as the GUI, timing every stage
+
+    Grid mode only draws to an offscreen figure in place of the canvas, angle
+    mode sessions are replayed without drawing
+    """
+
+    def __init__(
+        self,
+        sample_count: int = None,
+        thread_count: int = None,
+        engine: str = None,
+        draw: bool = True,
+        displacement_path: str = "displacement.npz",
+    ) -> None:
+        # overrides of the recorded settings
+        self.overrides = {
+            key: value
+            for key, value in (
+                ("sample_count", sample_count),
+                ("thread_count", thread_count),
+                ("engine", engine),
+            )
+            if value is not None
+        }
+        self.settings = {
+            "sample_count": 100_000,
+            "thread_count": 1,
+            "maximum_distance": 500,
+            "eye_throw_mode": False,
+            "engine": "numba",
+            "mode": "grid",
+            "kernel": "disk",
+            "sector_count": 4,
+            "candidate_count": TOP_PEAK_COUNT,
+            "biome_displacement": False,
+            "eye_standard_deviation": DEFAULT_STANDARD_DEVIATION,
+            "speculation": False,
+            **self.overrides,
+        }
+        self.draw = draw
+        self.history = ResultCache(256 << 20)
+        self.speculation_cache = ResultCache(256 << 20)
+        # started on the first run replayed with speculation enabled
+        self.speculator = None
+        self.displacement = DisplacementCache(displacement_path)
+        self.conditions = []
+        self.edits = EditHistory()
+        self.eye_throws = []
+        self.distributions = None
+        self.sample_cloud = None
+        self.overall_optimum = None
+        # coordinates text of the last redraw
+        self.display_text = None
+        self.resyncs = 0
+        self.timings = defaultdict(list)
+        self.figure = None
+
+    def edit_conditions(self, conditions):
+        """Replace the conditions, recording the edit for undo like ConditionList"""
+        self.edits.push(tuple(self.conditions))
+        self.conditions = list(conditions)
+
+    def replay(self, events):
+        """Replay every event, adding to the stage timings"""
+        for event in events:
+            if event.kind == "settings":
+                self.apply_settings(event.value)
+            elif event.kind == "clipboard":
+                self.clipboard(event.value)
+            elif event.kind == "keybind":
+                self.keybind(event.value)
+        if self.speculator is not None:
+            self.speculator.preempt()
+        return self.timings
+
+    def apply_settings(self, settings: dict):
+        """Take on recorded settings, and the conditions if they were edited by hand"""
+        settings = dict(settings)
+        conditions = settings.pop("conditions", None)
+        self.settings.update(settings)
+        self.settings.update(self.overrides)
+        if conditions is None:
+            return
+        # edits made in the condition list directly aren't recorded
+        conditions = [GenericCondition(*condition) for condition in conditions]
+        if condition_key(conditions) != condition_key(self.conditions):
+            self.resyncs += 1
+            self.conditions = conditions
+
+    def clipboard(self, clipboard: str):
+        """Replay a clipboard change like MainApplication.clipboard_handler"""
+        start = perf_counter()
+        action = apply_clipboard(
+            clipboard, self.conditions, self.eye_throws, self.settings["eye_throw_mode"]
+        )
+        self.timings["parse"].append(perf_counter() - start)
+        if action is None:
+            return
+        if action.throw is not None:
+            self.redraw(start)
+            return
+        self.edit_conditions([*self.conditions, action.condition])
+        self.generate(start)
+
+    def keybind(self, setting: str):
+        """Replay a keybind like MainApplication.key_press_handler"""
+        start = perf_counter()
+        if setting == "Reset":
+            self.eye_throws.clear()
+            self.edit_conditions(())
+        elif setting in ("Undo", "Redo"):
+            step = self.edits.undo if setting == "Undo" else self.edits.redo
+            snapshot = step(tuple(self.conditions))
+            if snapshot is None:
+                return
+            self.conditions = list(snapshot)
+        elif setting == "Not Found at Overall":
+            if self.sample_cloud is None or self.overall_optimum is None:
+                return
+            self.sample_cloud.exclude(
+                Disk(
+                    self.overall_optimum.x,
+                    self.overall_optimum.z,
+                    self.settings["maximum_distance"] / 8,
+                )
+            )
+            self.distributions = self.sample_cloud.distributions()
+            self.timings["exclude"].append(perf_counter() - start)
+            self.redraw(start)
+            return
+        elif setting == "Advise Next Observation":
+            self.advise(start)
+            return
+        else:
+            return
+        self.generate(start)
+
+    def generate(self, start: float):
+        """Sample the current conditions like MainApplication.start_generation"""
+        from .sampler import SamplerThread
+
+        settings = self.settings
+        sample_count = settings["sample_count"]
+        key = condition_key(self.conditions)
+        stage_start = perf_counter()
+        hit = None
+        if settings["mode"] == "grid":
+            hit = cached_result(
+                (
+                    (self.history, "from history"),
+                    (self.speculation_cache, "precomputed speculatively"),
+                ),
+                key,
+                sample_count,
+            )
+        if hit is not None:
+            result, _ = hit
+            self.timings["cache"].append(perf_counter() - stage_start)
+            self.speculate()
+        else:
+            # real work always takes priority over speculation
+            if self.speculator is not None:
+                self.speculator.preempt()
+            sampler = SamplerThread(
+                sample_count,
+                settings["thread_count"],
+                tuple(self.conditions),
+                engine=settings["engine"],
+                mode=settings["mode"],
+            )
+            sampler.run()
+            self.timings["sample"].append(perf_counter() - stage_start)
+            if sampler.result is None:
+                return
+            if settings["mode"] == "angle":
+                self.draw_angles(sampler.result, sample_count, start)
+                return
+            result = (
+                *sampler.result,
+                sample_count,
+                sampler.accepted_samples(),
+                sampler.accepted_seeds(),
+            )
+            if not sampler.impossible:
+                self.history.put(key, *result)
+                self.speculate()
+        *self.distributions, self.sample_cloud = result_distributions(*result)
+        self.redraw(start)
+
+    def speculate(self):
+        """Speculate on the branches of the current conditions, if enabled"""
+        from .speculation import SpeculativeScheduler
+
+        if not self.settings["speculation"]:
+            return
+        if self.speculator is None:
+            self.speculator = SpeculativeScheduler(self.speculation_cache)
+            self.speculator.start()
+        self.speculator.speculate(
+            self.conditions,
+            self.settings["sample_count"],
+            thread_count=self.settings["thread_count"],
+            engine=self.settings["engine"],
+            mode=self.settings["mode"],
+        )
+
+    def advise(self, start: float):
+        """Rank the next observations like MainApplication.advise_next_observation"""
+        from .advisor import advise
+
+        cloud = self.sample_cloud
+        if cloud is None or cloud.seeds is None or self.settings["mode"] != "grid":
+            return
+        advise(
+            cloud.surviving_samples(),
+            cloud.surviving_seeds(),
+            self.conditions,
+            self.settings["maximum_distance"] / 8,
+            self.settings["kernel"],
+        )
+        self.timings["advise"].append(perf_counter() - start)
+        self.timings["total"].append(perf_counter() - start)
+
+    def redraw(self, start: float):
+        """Score, optimize and draw like MainApplication.draw_heatmap"""
+        if self.distributions is None or self.settings["mode"] != "grid":
+            return
+        settings = self.settings
+        first, all_ = self.distributions
+        if settings["biome_displacement"]:
+            first, all_ = self.displacement.displace(self.distributions)
+        radius = settings["maximum_distance"] / 8
+        kernel = settings["kernel"]
+        stage_start = perf_counter()
+        convolved = convolve_heatmaps(first, all_, kernel, radius)
+        self.timings["convolve"].append(perf_counter() - stage_start)
+        stage_start = perf_counter()
+        scores = score_heatmaps(
+            all_,
+            convolved,
+            radius,
+            kernel,
+            settings["sector_count"],
+            settings["candidate_count"],
+            self.sample_cloud,
+        )
+        self.overall_optimum = scores.overall
+        self.timings["optima"].append(perf_counter() - stage_start)
+        posterior = None
+        if self.eye_throws:
+            stage_start = perf_counter()
+            posterior = eye_posterior(
+                self.eye_throws,
+                self.sample_cloud,
+                self.distributions[1],
+                settings["eye_standard_deviation"],
+            )
+            self.timings["eyes"].append(perf_counter() - stage_start)
+        if self.draw:
+            stage_start = perf_counter()
+            self.display_text, _ = summarize(
+                scores, posterior, settings["maximum_distance"], len(self.eye_throws)
+            )
+            self.draw_heatmaps(scores, posterior)
+            self.timings["draw"].append(perf_counter() - stage_start)
+        self.timings["total"].append(perf_counter() - start)
+
+    def draw_heatmaps(self, scores, posterior):
+        """Render the heatmaps and optima offscreen"""
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        if self.figure is None:
+            self.figure = Figure()
+            FigureCanvasAgg(self.figure)
+            self.axes = self.figure.subplots(1, 2)
+        draw_heatmaps(self.axes, scores, posterior)
+        self.figure.canvas.draw()
+
+    def draw_angles(self, result, sample_count, start):
+        """Find the best headings like MainApplication.draw_angles"""
+        from .angles import best_headings
+
+        _, all_angles, distances = result
+        stage_start = perf_counter()
+        best_headings(
+            all_angles / sample_count,
+            distances / sample_count,
+            self.settings["maximum_distance"],
+        )
+        self.timings["optima"].append(perf_counter() - stage_start)
+        self.timings["total"].append(perf_counter() - start)
+
+
+def report(timings, recorded=()) -> str:
+    """Table of the per stage latency percentiles"""
+    lines = [
+        f"{'stage':<10}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}"
+    ]
+    rows = [(stage, timings[stage]) for stage in STAGES if timings.get(stage)]
+    if len(recorded):
+        rows.append(("recorded", recorded))
+    for stage, durations in rows:
+        lines.append(
+            f"{stage:<10}{len(durations):>7}"
+            + "".join(f"{value:>10.1f}" for value in percentiles(durations))
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from .sampler import SamplerThread
+
+    parser = argparse.ArgumentParser(
+        description="Replay recorded sessions and report per stage latencies"
+    )
+    parser.add_argument("recordings", nargs="+", help="session .jsonl files")
+    parser.add_argument("--sample-count", type=int)
+    parser.add_argument("--thread-count", type=int)
+    parser.add_argument("--engine", choices=("numba", "numpy", "exact"))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-draw", action="store_true")
+    args = parser.parse_args()
+    # compile and start the parallel runtime outside of the timings
+    SamplerThread(1, 1, ()).run()
+    timings = defaultdict(list)
+    recorded = []
+    for path in args.recordings:
+        events = read_events(path)
+        recorded += recorded_latencies(events)
+        for _ in range(args.repeat):
+            replayer = Replayer(
+                args.sample_count, args.thread_count, args.engine, not args.no_draw
+            )
+            for stage, durations in replayer.replay(events).items():
+                timings[stage] += durations
+            if replayer.resyncs:
+                print(f"{path}: {replayer.resyncs} hand edited condition changes")
+    print(report(timings, recorded))
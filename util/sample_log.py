@@ -0,0 +1,187 @@
+"""Append-only on-disk log of accepted seeds and their stronghold start chunks"""
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from .condition_model import GenericCondition, condition_digest, condition_key
+
+MAGIC = b"ADCSEEDS"
+LOG_VERSION = 1
+# records start on a page boundary after the header
+HEADER_ALIGNMENT = 4096
+RECORD_DTYPE = np.dtype([("seed", "<i8"), ("chunks", "<i2", (3, 2))])
+# kept rows are written once at least this many are waiting, and at the end
+LOG_FLUSH_ROWS = 1 << 16
+# records tested per chunk when re-filtering, bounding the intermediate arrays
+FILTER_CHUNK_SIZE = 1 << 20
+
+
+def log_path(directory: str, conditions) -> str:
+    """Log file of a condition set, shared by every run of it"""
+    return os.path.join(directory, condition_digest(conditions) + ".seeds")
+
+
+def read_header(path: str) -> dict:
+    """Header of a log, with its conditions and the offset of its first record"""
+    with open(path, "rb") as file:
+        magic, version, header_size, length = struct.unpack("<8sIII", file.read(20))
+        if magic != MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} seed log")
+        header = json.loads(file.read(length))
+    header["conditions"] = tuple(
+        GenericCondition(*condition) for condition in header["conditions"]
+    )
+    header["header_size"] = header_size
+    return header
+
+
+class SampleLog:
+    """
+    Appends accepted samples to the log of their condition set, creating it
+    if needed
+
+    Every run of the same conditions samples the same distribution from its
+    own seed stream, so their records can share a log
+    """
+
+    def __init__(self, path: str, conditions) -> None:
+        self.path = path
+        self.conditions = tuple(conditions)
+        if os.path.exists(path):
+            header = read_header(path)
+            if condition_key(header["conditions"]) != condition_key(self.conditions):
+                raise ValueError(f"{path} logs a different condition set")
+            self.header_size = header["header_size"]
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            header = json.dumps({"conditions": condition_key(self.conditions)}).encode()
+            header_size = -(-(20 + len(header)) // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+            self.header_size = header_size
+            with open(path, "wb") as file:
+                file.write(
+                    struct.pack("<8sIII", MAGIC, LOG_VERSION, header_size, len(header))
+                )
+                file.write(header.ljust(header_size - 20, b"\0"))
+
+    def __len__(self) -> int:
+        """Whole records in the log"""
+        return (os.path.getsize(self.path) - self.header_size) // RECORD_DTYPE.itemsize
+
+    def truncate(self, count: int):
+        """
+        Drop every record after the first count, only call on a log no other
+        run appends to and no one has open
+        """
+        count = min(count, len(self))
+        with open(self.path, "r+b") as file:
+            file.truncate(self.header_size + count * RECORD_DTYPE.itemsize)
+
+    def extend(self, path: str):
+        """Append every record of another log of the same conditions"""
+        if condition_key(read_header(path)["conditions"]) != condition_key(
+            self.conditions
+        ):
+            raise ValueError(f"{path} logs a different condition set")
+        records = open_log(path)
+        for start in range(0, len(records), FILTER_CHUNK_SIZE):
+            chunk = records[start : start + FILTER_CHUNK_SIZE]
+            self.append(chunk["seed"], chunk["chunks"])
+
+    def append(self, seeds: np.ndarray, samples: np.ndarray):
+        """Append the seeds and (n, 3, 2) start chunks of accepted samples"""
+        records = np.empty(len(seeds), RECORD_DTYPE)
+        records["seed"] = seeds
+        records["chunks"] = samples
+        with open(self.path, "r+b") as file:
+            # a record torn by an interrupted append is dropped first, or every
+            # record after it would be misaligned
+            size = file.seek(0, os.SEEK_END)
+            end = size - (size - self.header_size) % RECORD_DTYPE.itemsize
+            if end != size:
+                file.truncate(end)
+                file.seek(end)
+            # whole records in a single write, readers ignore a torn last one
+            file.write(records.tobytes())
+
+
+def open_log(path: str) -> np.ndarray:
+    """Read only, zero copy structured array of a log's records"""
+    header_size = read_header(path)["header_size"]
+    count = (os.path.getsize(path) - header_size) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, RECORD_DTYPE)
+    return np.memmap(path, RECORD_DTYPE, "r", header_size, (count,))
+
+
+def histograms(records: np.ndarray, cell_size: int = 8):
+    """
+    First stronghold and all first ring stronghold histograms of records with
+    cells of cell_size overworld blocks, indexed like the heatmaps with +z down
+
+    The default cell size gives exactly the 701*701 heatmaps the sampler fills
+    """
+    size = 5600 // cell_size + 1
+    indices = (records["chunks"].astype(np.int64) * 16 + 2800) // cell_size
+    flat = indices[:, :, 0] + size * indices[:, :, 1]
+    first = np.bincount(flat[:, 0], minlength=size * size)
+    all_ = np.bincount(flat.ravel(), minlength=size * size)
+    return first.reshape(size, size), all_.reshape(size, size)
+
+
+def refilter(
+    records: np.ndarray, conditions, chunk_size: int = FILTER_CHUNK_SIZE
+) -> np.ndarray:
+    """Records whose seeds also pass conditions, a sample of the narrower distribution"""
+    from .vectorized import test_all_conditions
+
+    conditions = tuple(conditions)
+    kept = [
+        records[start : start + chunk_size][
+            test_all_conditions(records["seed"][start : start + chunk_size], conditions)
+        ]
+        for start in range(0, len(records), chunk_size)
+    ]
+    return np.concatenate(kept) if kept else records[:0].copy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and reuse seed logs")
+    parser.add_argument("log", help="seed log file")
+    parser.add_argument(
+        "--condition",
+        action="append",
+        default=[],
+        metavar="SALT,INT_MAXIMUM,INT_VALUE,FLOAT_MAXIMUM",
+        help="extra condition the records must pass",
+    )
+    parser.add_argument("--cell-size", type=int, default=8, help="in overworld blocks")
+    parser.add_argument("--output", help="save the histograms to this .npz")
+    parser.add_argument("--filtered-log", help="append the kept records to this log")
+    args = parser.parse_args()
+    header = read_header(args.log)
+    records = open_log(args.log)
+    print(f"{len(records)} records of {len(header['conditions'])} conditions")
+    extra = tuple(
+        GenericCondition(
+            int(salt), int(int_maximum), int(int_value), float(float_maximum)
+        )
+        for salt, int_maximum, int_value, float_maximum in (
+            condition.split(",") for condition in args.condition
+        )
+    )
+    if extra:
+        records = refilter(records, extra)
+        print(f"{len(records)} records pass the extra conditions")
+    if args.filtered_log:
+        log = SampleLog(args.filtered_log, header["conditions"] + extra)
+        log.append(records["seed"], records["chunks"])
+    if args.output:
+        first, all_ = histograms(records, args.cell_size)
+        np.savez(args.output, first=first, all=all_, sample_count=len(records))
+        print(f"Saved {first.shape[0]}*{first.shape[1]} histograms to {args.output}")
@@ -0,0 +1,410 @@
+"""Background stronghold distribution sampling"""
+
+import os
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+import numpy as np
+
+from . import angles, vectorized
+from .condition_model import ConditionSet
+from .checkpoint import run_log_path
+from .sample_log import LOG_FLUSH_ROWS, SampleLog
+from .seed_stream import new_key
+
+try:
+    import numba
+
+    from .angles import accumulate_angles
+    from .exact import exact_distributions
+    from .governor import configure_workers, workers_pinned
+    from .heatmap import accumulate_data
+except ImportError:
+    numba = None
+
+# written to the accepted counter to stop the numba workers early
+CANCELLED = -(1 << 62)
+# numba's parallel runtime cannot run two kernels at once
+KERNEL_LOCK = Lock()
+# target wall time of a single burst in cpu budgeted mode
+BURST_DURATION = 0.02
+# target wall time of a burst between checkpoints when not cpu budgeted
+CHECKPOINT_BURST_DURATION = 0.5
+# accepted samples kept for the sample cloud, bounding memory on huge runs
+MAX_KEPT_SAMPLES = 10_000_000
+# rows the kernels write logged samples to before they are flushed, so logs
+# aren't bounded by the kept samples, bursts are shortened to fit
+LOG_SCRATCH_ROWS = 1 << 20
+ENGINES = ("numba", "numpy", "exact")
+# full 2d heatmaps, or only the 1d ring angle and distance
+MODES = ("grid", "angle")
+
+
+def available_engines() -> tuple[str, ...]:
+    """Engines that can be used in the current environment"""
+    return ENGINES if numba is not None else ("numpy",)
+
+
+def duty_cycle(cpu_budget: float, thread_count: int) -> float:
+    """
+    Fraction of wall time the workers may run so that thread_count busy
+    threads use at most cpu_budget of the whole machine
+    """
+    return min(1.0, cpu_budget * (os.cpu_count() or 1) / thread_count)
+
+
+def histogram_shapes(mode: str) -> tuple:
+    """Shapes of the histograms a sampling mode fills"""
+    if mode == "angle":
+        return (
+            (angles.ANGLE_BINS,),
+            (angles.ANGLE_BINS,),
+            (angles.DISTANCE_BINS,),
+        )
+    return ((701, 701), (701, 701))
+
+
+def sample_rows(mode: str, sample_count: int) -> int:
+    """Rows needed to keep every accepted sample, up to MAX_KEPT_SAMPLES"""
+    if mode != "grid":
+        return 0
+    return min(sample_count, MAX_KEPT_SAMPLES)
+
+
+class SamplerThread(Thread):
+    """Thread running generate_data off of the Tk thread"""
+
+    def __init__(
+        self,
+        sample_count,
+        thread_count,
+        conditions,
+        cpu_budget: float = None,
+        low_priority: bool = False,
+        cores=(),
+        engine: str = "numba",
+        mode: str = "grid",
+        buffers=None,
+        seed_key: int = None,
+        checkpoint=None,
+        sample_log=None,
+        seeds=None,
+    ):
+        super().__init__(daemon=True)
+        self.sample_count = sample_count
+        self.thread_count = thread_count
+        # snapshot whose canonical arrays are marshaled once and shared by
+        # every burst, and by other runs of the same snapshot
+        self.condition_set = ConditionSet.of(conditions)
+        self.conditions = self.condition_set.conditions
+        self.engine = engine if engine in available_engines() else "numpy"
+        self.cpu_budget = cpu_budget
+        self.low_priority = low_priority
+        self.cores = tuple(cores)
+        self.mode = mode
+        # the run is fully determined by the seed stream and how far into it it got
+        self.seed_key = new_key() if seed_key is None else seed_key
+        # checkpoint.Checkpointer saving progress between bursts, if any
+        self.checkpoint = checkpoint
+        self.shapes = histogram_shapes(mode)
+        if buffers is None:
+            # flat histograms filled in place so partial results can be read mid-run
+            buffers = (
+                np.zeros(2, np.int64),
+                tuple(
+                    np.zeros(np.prod(shape), dtype=np.uint64) for shape in self.shapes
+                ),
+                np.zeros((sample_rows(mode, sample_count), 3, 2), np.int16),
+            )
+        # start chunks of each accepted sample are kept in samples
+        self.progress, self.histograms, self.samples = buffers
+        # sample_log.SampleLog the kept samples are streamed to, if any
+        self.sample_log = sample_log
+        # seed of each kept sample, so later questions can be asked of them
+        if seeds is None:
+            seeds = np.zeros(len(self.samples), np.int64)
+        self.seeds = seeds
+        # a resumed run's earlier samples were logged by the run it continues
+        self.logged_rows = max(self.accepted, 0)
+        # shared log of the conditions while a checkpointed run logs to its own
+        self.shared_log = None
+        # scratch rows logged samples are written to, set up by run_bursts
+        self.log_samples = self.log_seeds = None
+        self.outputs = self.histograms + (
+            (self.samples, self.seeds) if mode == "grid" else ()
+        )
+        self.cancelled = False
+        self.result = None
+        self.elapsed = 0.0
+        # whether the result was integrated exactly rather than sampled
+        self.exact = False
+
+    @property
+    def accepted(self) -> int:
+        """Number of samples accepted so far"""
+        return int(self.progress[0])
+
+    @property
+    def tested(self) -> int:
+        """Number of seeds tested so far"""
+        return int(self.progress[1])
+
+    @property
+    def impossible(self) -> bool:
+        """Whether the run was aborted due to no seeds passing the conditions"""
+        return not self.cancelled and self.progress[0] < 0
+
+    def cancel(self):
+        """Stop the workers as soon as possible and discard the result"""
+        self.cancelled = True
+        self.progress[0] = CANCELLED
+
+    @property
+    def done(self) -> bool:
+        """Whether the workers have stopped for any reason"""
+        return not 0 <= self.progress[0] < self.sample_count
+
+    @property
+    def accepted_rate(self) -> float:
+        """Accepted samples per second of wall time over the whole run"""
+        if self.elapsed <= 0:
+            return 0.0
+        return max(self.accepted, 0) / self.elapsed
+
+    def partial_result(self):
+        """Copy of the histograms accumulated so far, normalized by accepted samples"""
+        if self.exact:
+            return tuple(result / self.sample_count for result in self.result)
+        accepted = max(self.accepted, 1)
+        return tuple(
+            np.reshape(histogram, shape) / accepted
+            for histogram, shape in zip(self.histograms, self.shapes)
+        )
+
+    def accepted_samples(self) -> np.ndarray:
+        """Start chunks of the samples accepted so far, empty if exact or angle only"""
+        if self.exact:
+            return self.samples[:0]
+        return self.samples[: min(max(self.accepted, 0), len(self.samples))]
+
+    def accepted_seeds(self) -> np.ndarray:
+        """Seeds of accepted_samples, row for row"""
+        return self.seeds[: len(self.accepted_samples())]
+
+    def release(self) -> bool:
+        """
+        Free what the run holds beyond its results once it has stopped, only
+        call from the thread reading its progress, False while still running
+        """
+        return not self.is_alive()
+
+    @property
+    def row_offset(self) -> int:
+        """Accepted index of the first row the kernels write samples to"""
+        return 0 if self.log_samples is None else self.logged_rows
+
+    def keep_log_rows(self):
+        """Copy the scratch rows that are also kept into samples and seeds"""
+        end = min(self.accepted, len(self.samples))
+        if self.logged_rows < end:
+            rows = slice(0, end - self.logged_rows)
+            self.samples[self.logged_rows : end] = self.log_samples[rows]
+            self.seeds[self.logged_rows : end] = self.log_seeds[rows]
+
+    def flush_log(self, minimum_rows: int = LOG_FLUSH_ROWS):
+        """
+        Append the samples accepted since the last flush to the sample log, if
+        at least minimum_rows are waiting, only call between bursts
+        """
+        if self.log_samples is None:
+            return
+        waiting = self.accepted - self.logged_rows
+        if waiting < max(minimum_rows, 1):
+            return
+        self.sample_log.append(self.log_seeds[:waiting], self.log_samples[:waiting])
+        self.logged_rows += waiting
+
+    def run(self):
+        start = perf_counter()
+        if self.engine == "exact" and self.run_exact():
+            self.elapsed = perf_counter() - start
+            return
+        self.open_run_log()
+        if self.engine == "numpy":
+            self.run_bursts(self.burst)
+        else:
+            self.run_numba()
+        self.elapsed = perf_counter() - start
+        if self.cancelled:
+            return
+        self.finish()
+
+    def burst(self, tested_limit):
+        """Sample the seed stream until done or progress[1] reaches tested_limit"""
+        if self.engine == "numpy":
+            arguments = (
+                self.progress,
+                self.sample_count,
+                self.conditions,
+                *self.outputs,
+                tested_limit,
+            )
+            if self.mode == "angle":
+                angles.accumulate_angles_vectorized(*arguments, seed_key=self.seed_key)
+            else:
+                vectorized.accumulate_data(
+                    *arguments, seed_key=self.seed_key, row_offset=self.row_offset
+                )
+            return
+        with KERNEL_LOCK:
+            # size the pool to match the prange split so no threads sit idle
+            numba.set_num_threads(self.thread_count)
+            self.numba_burst(tested_limit)
+
+    def open_run_log(self):
+        """
+        Log a checkpointed run to a file of its own until it finishes, so a
+        resumed run can drop what it logged past its last checkpoint without
+        touching the records other runs appended to the shared log
+        """
+        if self.sample_log is None or self.checkpoint is None:
+            return
+        path = run_log_path(self.checkpoint.path)
+        if self.checkpoint.log_records is None and os.path.exists(path):
+            # left behind by a checkpointed run that was never resumed
+            os.remove(path)
+        self.shared_log = self.sample_log
+        self.sample_log = SampleLog(path, self.conditions)
+        if self.checkpoint.log_records is not None:
+            self.sample_log.truncate(self.checkpoint.log_records)
+
+    def merge_run_log(self):
+        """Append a finished checkpointed run's own log to the shared log"""
+        if self.shared_log is None:
+            return
+        self.shared_log.extend(self.sample_log.path)
+        os.remove(self.sample_log.path)
+        self.sample_log, self.shared_log = self.shared_log, None
+
+    def finish(self):
+        """Flush the log, drop the checkpoint and set the result of a finished run"""
+        self.flush_log(0)
+        if self.checkpoint is not None and not self.impossible:
+            # the checkpoint goes first, a run interrupted while merging is
+            # never resumed and merged a second time
+            self.checkpoint.remove()
+            self.merge_run_log()
+        self.result = tuple(
+            np.reshape(histogram, shape)
+            for histogram, shape in zip(self.histograms, self.shapes)
+        )
+
+    def run_exact(self) -> bool:
+        """
+        Integrate the distribution exactly, returning False if the conditions
+        are not supported so the run can fall back to sampling
+        """
+        distributions = (
+            angles.exact_angles(self.conditions)
+            if self.mode == "angle"
+            else exact_distributions(self.conditions)
+        )
+        if distributions is None or self.cancelled:
+            return False
+        # scaled to match the sampled histograms, which are normalized by sample count
+        self.result = tuple(
+            distribution * self.sample_count for distribution in distributions
+        )
+        self.exact = True
+        self.progress[0] = self.sample_count
+        return True
+
+    def numba_burst(self, tested_limit):
+        """Run the numba kernel of the mode up to tested_limit, holding KERNEL_LOCK"""
+        arguments = (
+            self.progress,
+            self.sample_count,
+            self.thread_count,
+            self.condition_set.arrays,
+            *self.outputs,
+            tested_limit,
+            np.uint64(self.seed_key),
+        )
+        if self.mode == "angle":
+            accumulate_angles(*arguments)
+        else:
+            accumulate_data(*arguments, np.int64(self.row_offset))
+
+    def run_numba(self):
+        """Generate with the numba kernel, in bursts if resource governed"""
+        if (
+            self.cpu_budget is None
+            and not self.low_priority
+            and not self.cores
+            and self.checkpoint is None
+            and self.sample_log is None
+        ):
+            if workers_pinned():
+                # unpin the shared pool from the core set of an earlier run
+                with KERNEL_LOCK:
+                    numba.set_num_threads(self.thread_count)
+                    configure_workers(self.thread_count, False)
+            if not self.cancelled:
+                self.burst(np.iinfo(np.int64).max)
+            return
+        with KERNEL_LOCK:
+            numba.set_num_threads(self.thread_count)
+            configure_workers(self.thread_count, self.low_priority, self.cores)
+        self.run_bursts(self.burst)
+
+    def run_bursts(self, burst):
+        """
+        Call burst in short bursts, sleeping between them to stay within the
+        cpu budget, and checkpointing and logging samples between them if enabled
+        """
+        duty = (
+            1.0
+            if self.cpu_budget is None
+            else duty_cycle(self.cpu_budget, self.thread_count)
+        )
+        target_duration = (
+            CHECKPOINT_BURST_DURATION
+            if self.checkpoint is not None and self.cpu_budget is None
+            else BURST_DURATION
+        )
+        if self.sample_log is not None and self.mode == "grid":
+            # logged samples go to scratch rows that are reused once flushed,
+            # the kept ones being copied out of them after every burst
+            self.log_samples = np.zeros((LOG_SCRATCH_ROWS, 3, 2), np.int16)
+            self.log_seeds = np.zeros(LOG_SCRATCH_ROWS, np.int64)
+            self.outputs = self.histograms + (self.log_samples, self.log_seeds)
+        burst_tests = 1000
+        while not self.cancelled and not self.done:
+            if self.log_samples is not None:
+                # no more samples can be accepted than seeds tested
+                burst_tests = min(
+                    burst_tests,
+                    LOG_SCRATCH_ROWS - (self.accepted - self.logged_rows),
+                )
+            burst_start = perf_counter()
+            burst(self.progress[1] + burst_tests)
+            burst_elapsed = perf_counter() - burst_start
+            if self.log_samples is not None and not self.cancelled:
+                self.keep_log_rows()
+            # every seed below the tested count is accounted for between bursts
+            if (
+                self.checkpoint is not None
+                and not self.cancelled
+                and 0 <= self.progress[0] < self.sample_count
+            ):
+                self.checkpoint.maybe_save(self)
+            if not self.cancelled and self.progress[0] >= 0:
+                self.flush_log()
+            # steer the burst size towards the target duration
+            burst_tests = int(
+                burst_tests
+                * min(max(target_duration / max(burst_elapsed, 1e-6), 0.5), 2.0)
+            )
+            burst_tests = max(burst_tests, 100)
+            if duty < 1.0:
+                sleep(burst_elapsed * (1 / duty - 1))
@@ -0,0 +1,110 @@
+"""In-memory cloud of accepted stronghold samples for re-optimizing after a miss"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+# side length of a spatial index bucket in heatmap (nether block) units
+BUCKET_SIZE = 32
+# buckets per side, covering the whole 701*701 heatmap
+BUCKET_COUNT = -(-701 // BUCKET_SIZE)
+
+
+class Disk(NamedTuple):
+    """Disk in heatmap (nether block) coordinates found to contain no stronghold"""
+
+    x: int
+    z: int
+    radius: float
+
+
+class SampleCloud:
+    """
+    Accepted samples with a grid bucket index over every stronghold,
+    supporting chained "no stronghold within this disk" constraints
+    """
+
+    def __init__(self, samples: np.ndarray, seeds: np.ndarray = None) -> None:
+        # (n, 3, 2) start chunks -> heatmap coordinates
+        self.points = samples.reshape(-1, 2).astype(np.int32) * 2
+        self.sample_count = len(samples)
+        # seed of each sample, if known
+        self.seeds = seeds
+        self.alive = np.ones(self.sample_count, np.bool_)
+        self.exclusions = []
+        buckets = self.bucket_ids(self.points[:, 0], self.points[:, 1])
+        # points sorted by bucket, with starts[b]:starts[b + 1] indexing bucket b
+        self.order = np.argsort(buckets, kind="stable")
+        self.starts = np.searchsorted(
+            buckets[self.order], np.arange(BUCKET_COUNT * BUCKET_COUNT + 1)
+        )
+
+    @staticmethod
+    def bucket_ids(x, z):
+        """Index bucket of heatmap coordinates"""
+        return ((z + 350) // BUCKET_SIZE) * BUCKET_COUNT + (x + 350) // BUCKET_SIZE
+
+    @staticmethod
+    def bucket_range(center, radius) -> tuple[int, int]:
+        """First and last bucket along one axis overlapping [center - radius, center + radius]"""
+        return tuple(
+            int(
+                np.clip(
+                    (center + sign * radius + 350) // BUCKET_SIZE, 0, BUCKET_COUNT - 1
+                )
+            )
+            for sign in (-1, 1)
+        )
+
+    @property
+    def surviving_count(self) -> int:
+        """Number of samples consistent with every exclusion"""
+        return int(np.count_nonzero(self.alive))
+
+    def points_within(self, disk: Disk) -> np.ndarray:
+        """Indices into points of every stronghold within disk"""
+        low_x, high_x = self.bucket_range(disk.x, disk.radius)
+        low_z, high_z = self.bucket_range(disk.z, disk.radius)
+        candidates = [
+            # buckets of a row are contiguous in the sorted order
+            self.order[self.starts[row + low_x] : self.starts[row + high_x + 1]]
+            for row in range(
+                low_z * BUCKET_COUNT, high_z * BUCKET_COUNT + 1, BUCKET_COUNT
+            )
+        ]
+        candidates = np.concatenate(candidates) if candidates else np.zeros(0, np.int64)
+        offsets = self.points[candidates] - (disk.x, disk.z)
+        return candidates[(offsets**2).sum(axis=1) <= disk.radius**2]
+
+    def exclude(self, disk: Disk) -> int:
+        """Drop every sample with a stronghold within disk, returning how many were dropped"""
+        excluded = np.unique(self.points_within(disk) // 3)
+        dropped = int(np.count_nonzero(self.alive[excluded]))
+        self.alive[excluded] = False
+        self.exclusions.append(disk)
+        return dropped
+
+    def clear_exclusions(self):
+        """Restore every sample"""
+        self.alive[:] = True
+        self.exclusions.clear()
+
+    def surviving_samples(self) -> np.ndarray:
+        """(n, 3, 2) start chunks of the samples consistent with every exclusion"""
+        return self.points.reshape(-1, 3, 2)[self.alive] // 2
+
+    def surviving_seeds(self) -> np.ndarray:
+        """Seeds of surviving_samples, or None if the seeds weren't kept"""
+        if self.seeds is None:
+            return None
+        return self.seeds[self.alive]
+
+    def distributions(self):
+        """(first, all) heatmaps of the surviving samples, normalized by their count"""
+        points = self.points.reshape(-1, 3, 2)[self.alive]
+        indices = (points[:, :, 0] + 350) + 701 * (points[:, :, 1] + 350)
+        count = max(len(points), 1)
+        return (
+            np.bincount(indices[:, 0], minlength=701 * 701).reshape(701, 701) / count,
+            np.bincount(indices.ravel(), minlength=701 * 701).reshape(701, 701) / count,
+        )
@@ -0,0 +1,47 @@
+"""Counter based seed stream, so the nth seed of a run can be regenerated at any time"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+# seeds are drawn from [-(1 << 47) + 1, 1 << 47), 2**48 - 1 values
+SEED_RANGE = np.uint64((1 << 48) - 1)
+SEED_OFFSET = np.int64((1 << 47) - 1)
+
+
+def new_key() -> int:
+    """Random key identifying a run's seed stream"""
+    return int(np.random.default_rng().integers(0, 1 << 63, dtype=np.int64))
+
+
+def counter_seeds(key: int, start: int, size: int) -> np.ndarray:
+    """Seeds start to start + size of the stream identified by key"""
+    with np.errstate(over="ignore"):
+        value = (
+            np.uint64(key)
+            + (np.arange(start, start + size, dtype=np.uint64) + np.uint64(1))
+            * GOLDEN_GAMMA
+        )
+        # splitmix64 finalizer
+        value = (value ^ (value >> np.uint64(30))) * MIX_1
+        value = (value ^ (value >> np.uint64(27))) * MIX_2
+        value ^= value >> np.uint64(31)
+    return (value % SEED_RANGE).astype(np.int64) - SEED_OFFSET
+
+
+if numba is not None:
+
+    @numba.njit(numba.int64(numba.uint64, numba.int64), nogil=True)
+    def counter_seed(key, index):
+        """Seed index of the stream identified by key, matching counter_seeds"""
+        value = key + (np.uint64(index) + np.uint64(1)) * GOLDEN_GAMMA
+        value = (value ^ (value >> np.uint64(30))) * MIX_1
+        value = (value ^ (value >> np.uint64(27))) * MIX_2
+        value ^= value >> np.uint64(31)
+        return np.int64(value % SEED_RANGE) - SEED_OFFSET
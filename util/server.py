@@ -0,0 +1,276 @@
+"""Localhost HTTP API exposing heatmaps to overlays and companion tools"""
+
+import json
+import logging
+import struct
+import zlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from .condition_model import GenericCondition
+
+DEFAULT_PORT = 52533
+# longest a long-poll request may wait for a new version
+MAXIMUM_POLL_TIMEOUT = 30.0
+# magic, version, width, height, accepted, sample_count, scale
+FRAME_HEADER = struct.Struct("<4sIHHqqd")
+FRAME_MAGIC = b"ADCH"
+
+
+def encode_frame(version, distribution, accepted, sample_count) -> bytes:
+    """
+    Encode a probability grid as a compact binary frame
+
+    The grid is quantized to uint16 relative to its maximum (the scale in the
+    header) and zlib compressed, as most of the grid is empty
+    """
+    scale = float(distribution.max()) if distribution.size else 0.0
+    if scale > 0:
+        quantized = np.round(distribution / scale * 65535).astype("<u2")
+    else:
+        quantized = np.zeros(distribution.shape, "<u2")
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        version,
+        distribution.shape[1],
+        distribution.shape[0],
+        accepted,
+        sample_count,
+        scale,
+    )
+    return header + zlib.compress(quantized.tobytes(), 1)
+
+
+def decode_frame(frame: bytes):
+    """Decode a frame built by encode_frame into (header fields, float grid)"""
+    magic, version, width, height, accepted, sample_count, scale = (
+        FRAME_HEADER.unpack_from(frame)
+    )
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a heatmap frame")
+    grid = np.frombuffer(zlib.decompress(frame[FRAME_HEADER.size :]), "<u2").reshape(
+        height, width
+    )
+    return (version, accepted, sample_count), grid * (scale / 65535)
+
+
+class HeatmapState:
+    """Latest published results, versioned so encoded responses can be cached"""
+
+    def __init__(self) -> None:
+        self.condition = Condition()
+        self.version = 0
+        self.fields = {
+            "conditions": [],
+            "progress": None,
+            "optimal": None,
+            "final": False,
+        }
+        self.distributions = {"first": None, "all": None}
+        self.cache = {}
+
+    def publish(self, first=None, all_=None, **fields):
+        """Replace any of the published fields and wake up long-polling clients"""
+        with self.condition:
+            self.fields.update(fields)
+            if first is not None:
+                self.distributions["first"] = first
+            if all_ is not None:
+                self.distributions["all"] = all_
+            self.version += 1
+            self.cache.clear()
+            self.condition.notify_all()
+
+    def wait(self, since: int, timeout: float) -> int:
+        """Wait until the version is newer than since, returning the current version"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > since, timeout)
+            return self.version
+
+    def cached(self, key, build):
+        """Return the response for key at the current version, building it at most once"""
+        with self.condition:
+            version = self.version
+            if key not in self.cache:
+                self.cache[key] = build(version)
+            return self.cache[key]
+
+    def json(self, version, field=None) -> bytes:
+        """Encode one or all of the published fields as JSON"""
+        if field is not None:
+            return json.dumps(self.fields[field]).encode()
+        return json.dumps({"version": version, **self.fields}).encode()
+
+    def frame(self, version, which) -> bytes:
+        """Encode one of the published distributions as a binary frame"""
+        distribution = self.distributions[which]
+        if distribution is None:
+            return b""
+        progress = self.fields["progress"] or {}
+        return encode_frame(
+            version,
+            distribution,
+            progress.get("accepted", 0),
+            progress.get("sample_count", 0),
+        )
+
+
+def parse_condition(body) -> GenericCondition:
+    """GenericCondition from a decoded JSON object, raising ValueError if invalid"""
+    try:
+        condition = GenericCondition(
+            int(body["salt"]),
+            int(body.get("int_maximum", 0)),
+            int(body.get("int_value", 0)),
+            float(body.get("float_maximum", 0.0)),
+        )
+    except (TypeError, KeyError, AttributeError, OverflowError) as error:
+        raise ValueError("invalid condition") from error
+    # salts are java longs and int bounds positive java ints, anything else
+    # would only fail later in the sampler
+    if not (
+        -(1 << 63) <= condition.salt < 1 << 63
+        and 0 <= condition.int_maximum < 1 << 31
+        and 0 <= condition.int_value < 1 << 31
+        and np.isfinite(condition.float_maximum)
+    ):
+        raise ValueError("invalid condition")
+    return condition
+
+
+class HeatmapRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the heatmap API
+
+    GET /state?since=V&timeout=T long-polls for a version newer than V
+    GET /conditions lists the current conditions
+    GET /optimal returns the optimal coordinates of the last finished run
+    GET /heatmap/{first,all}?since=V&timeout=T long-polls for a binary frame
+    POST /conditions adds a condition from an application/json object
+    DELETE /conditions/I removes the condition at index I
+
+    Only GET responses may be read cross-origin. Bodies must be
+    application/json, which browsers won't send cross-origin without a
+    preflight this server never answers, so other pages can't edit the
+    conditions
+    """
+
+    server: "HeatmapServer"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug(format, *args)
+
+    def send_body(self, body: bytes, content_type: str, status=HTTPStatus.OK):
+        """Send a complete response"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if self.command == "GET":
+            self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, value, status=HTTPStatus.OK):
+        """Send a JSON response"""
+        self.send_body(json.dumps(value).encode(), "application/json", status)
+
+    def wait_for_version(self, query, state: HeatmapState):
+        """Block for long-polling requests until there is something newer than since"""
+        if "since" in query:
+            state.wait(
+                int(query["since"][0]),
+                min(
+                    float(query.get("timeout", (MAXIMUM_POLL_TIMEOUT,))[0]),
+                    MAXIMUM_POLL_TIMEOUT,
+                ),
+            )
+
+    def read_json(self):
+        """Decode the JSON body of the request, raising ValueError if it isn't JSON"""
+        if self.headers.get_content_type() != "application/json":
+            raise ValueError("expected an application/json body")
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.send_state(self.server.state, url.path, parse_qs(url.query))
+
+    def send_state(self, state: HeatmapState, path: str, query):
+        """Answer a GET of one of the paths of state, after long-polling for it"""
+        try:
+            self.wait_for_version(query, state)
+        except ValueError:
+            self.send_json({"error": "invalid query"}, HTTPStatus.BAD_REQUEST)
+            return
+        if path == "/state":
+            self.send_body(state.cached("json", state.json), "application/json")
+        elif path in ("/conditions", "/optimal"):
+            field = path[1:]
+            self.send_body(
+                state.cached(field, lambda version: state.json(version, field)),
+                "application/json",
+            )
+        elif path in ("/heatmap/first", "/heatmap/all"):
+            which = path.rsplit("/", 1)[1]
+            frame = state.cached(which, lambda version: state.frame(version, which))
+            if not frame:
+                self.send_json({"error": "no heatmap yet"}, HTTPStatus.NOT_FOUND)
+                return
+            self.send_body(frame, "application/octet-stream")
+        else:
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/conditions":
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+            return
+        try:
+            body = self.read_json()
+            condition = parse_condition(body)
+        except (TypeError, ValueError):
+            self.send_json({"error": "invalid condition"}, HTTPStatus.BAD_REQUEST)
+            return
+        self.server.on_add_condition(condition, body.get("name"))
+        self.send_json(condition._asdict(), HTTPStatus.ACCEPTED)
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        prefix = "/conditions/"
+        if not path.startswith(prefix) or not path[len(prefix) :].isdigit():
+            self.send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+            return
+        index = int(path[len(prefix) :])
+        if index >= len(self.server.state.fields["conditions"]):
+            self.send_json({"error": "no such condition"}, HTTPStatus.NOT_FOUND)
+            return
+        self.server.on_remove_condition(index)
+        self.send_json({"removed": index}, HTTPStatus.ACCEPTED)
+
+
+class HeatmapServer(ThreadingHTTPServer):
+    """Threaded localhost HTTP server around a HeatmapState"""
+
+    daemon_threads = True
+
+    def __init__(
+        self, on_add_condition, on_remove_condition, port: int = DEFAULT_PORT
+    ) -> None:
+        super().__init__(("127.0.0.1", port), HeatmapRequestHandler)
+        self.logger = logging.getLogger("HeatmapServer")
+        self.state = HeatmapState()
+        self.on_add_condition = on_add_condition
+        self.on_remove_condition = on_remove_condition
+
+    def start(self):
+        """Serve requests on a daemon thread"""
+        Thread(target=self.serve_forever, daemon=True).start()
+        self.logger.info("Serving heatmap API on http://127.0.0.1:%d", self.server_port)
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,240 @@
+"""Tk independent steps of the GUI's handlers, shared with headless replay"""
+
+from typing import NamedTuple
+
+from .clipboard import ClipboardAction, parse_clipboard
+from .eyes import EyePosterior, grid_posterior, sample_posterior
+from .peaks import Peak, top_peaks
+from .pyramid import Optimum, heatmap_optima
+from .samples import SampleCloud
+
+# most edits kept for undo
+MAXIMUM_UNDO = 100
+
+
+class EditHistory:
+    """Undo and redo stacks of snapshots taken before every edit"""
+
+    def __init__(self, maximum: int = MAXIMUM_UNDO) -> None:
+        self.maximum = maximum
+        self.undo_stack: list = []
+        self.redo_stack: list = []
+
+    def push(self, snapshot):
+        """Record the state before an edit"""
+        self.undo_stack.append(snapshot)
+        del self.undo_stack[: -self.maximum]
+        self.redo_stack.clear()
+
+    def undo(self, current):
+        """Snapshot to revert to from current, None if there was no edit"""
+        if not self.undo_stack:
+            return None
+        self.redo_stack.append(current)
+        return self.undo_stack.pop()
+
+    def redo(self, current):
+        """Snapshot to reapply from current, None if there was no undone edit"""
+        if not self.redo_stack:
+            return None
+        self.undo_stack.append(current)
+        return self.redo_stack.pop()
+
+
+def apply_clipboard(
+    clipboard: str, conditions, eye_throws: list, eye_throw_mode: bool
+) -> ClipboardAction:
+    """
+    Parse a clipboard change, logging an eye throw in eye_throws, returning
+    None if it is neither a throw nor a condition
+    """
+    action = parse_clipboard(clipboard, conditions, eye_throw_mode)
+    if action is not None and action.throw is not None:
+        eye_throws.append(action.throw)
+    return action
+
+
+def cached_result(caches, key, sample_count):
+    """
+    First cached (first, all, sample count, samples, seeds) of key among
+    (cache, source) pairs, and its source, or None
+    """
+    for cache, source in caches:
+        cached = cache.get(key, sample_count)
+        if cached is not None:
+            return cached, source
+    return None
+
+
+def result_distributions(first, all_, sample_count, samples=None, seeds=None):
+    """Normalized first and all stronghold distributions of a result and its sample cloud"""
+    return (
+        first / sample_count,
+        all_ / sample_count,
+        None if samples is None or not len(samples) else SampleCloud(samples, seeds),
+    )
+
+
+class DisplacementCache:
+    """Biome displaced copies of the latest distributions, reused until they are replaced"""
+
+    def __init__(self, model_path: str) -> None:
+        self.model_path = model_path
+        self.model = None
+        # source distributions and their displaced copies
+        self.displaced = None
+
+    def displace(self, sources) -> tuple:
+        """Displaced copies of sources, the distributions being replaced rather than modified"""
+        from .displacement import displace, load_model, prior_model
+
+        if self.model is None:
+            try:
+                self.model = load_model(self.model_path)
+            except FileNotFoundError:
+                self.model = prior_model()
+        sources = tuple(sources)
+        if self.displaced is None or any(
+            cached is not source for cached, source in zip(self.displaced[0], sources)
+        ):
+            self.displaced = (
+                sources,
+                tuple(displace(distribution, self.model) for distribution in sources),
+            )
+        return self.displaced[1]
+
+
+def convolve_heatmaps(first, all_, kernel: str, radius: float) -> tuple:
+    """All and first stronghold distributions convolved with the kernel, in that order"""
+    from .kernels import convolve
+
+    return convolve(all_, kernel, radius), convolve(first, kernel, radius)
+
+
+class HeatmapScores(NamedTuple):
+    """Convolved heatmaps, all stronghold one first, and the points picked from them"""
+
+    convolved: tuple
+    overall: Optimum
+    sectors: dict
+    candidates: list[Peak]
+
+
+def score_heatmaps(
+    all_,
+    convolved,
+    radius: float,
+    kernel: str,
+    sector_count: int,
+    candidate_count: int,
+    cloud: SampleCloud = None,
+) -> HeatmapScores:
+    """Overall and sector optima and ranked candidates of convolved heatmaps"""
+    # the convolution only narrows the search down, optima are refined on
+    # fine tiles with the exact unrounded radius
+    overall, sectors = heatmap_optima(all_, convolved[0], radius, kernel, sector_count)
+    candidates = top_peaks(convolved[0], radius, candidate_count, cloud=cloud)
+    return HeatmapScores(convolved, overall, sectors, candidates)
+
+
+def eye_posterior(
+    eye_throws, cloud: SampleCloud, all_, standard_deviation: float
+) -> EyePosterior:
+    """Posterior of the logged eye throws, from the samples if kept or else the heatmap"""
+    # no posterior without any stronghold positions
+    if not eye_throws or not all_.any():
+        return None
+    if cloud is not None:
+        return sample_posterior(
+            cloud.surviving_samples(), eye_throws, standard_deviation
+        )
+    return grid_posterior(all_, eye_throws, standard_deviation)
+
+
+def summarize(
+    scores: HeatmapScores,
+    posterior: EyePosterior,
+    maximum_distance: float,
+    eye_count: int,
+) -> tuple[str, dict]:
+    """Coordinates text and api json of scored heatmaps"""
+
+    def optimum_json(optimum):
+        return {
+            "x": round(optimum.x),
+            "z": round(optimum.z),
+            "fine_x": optimum.x,
+            "fine_z": optimum.z,
+            "score": optimum.score,
+        }
+
+    overall = scores.overall
+    optimal = {
+        "maximum_distance": round(maximum_distance),
+        "overall": optimum_json(overall),
+        "sectors": {},
+        "candidates": [peak._asdict() for peak in scores.candidates],
+    }
+    # the quadrants keep their old key for existing clients
+    if len(scores.sectors) == 4:
+        optimal["quadrants"] = optimal["sectors"]
+    display_text = (
+        "Highest Probability Coordinates:\n"
+        f"Overall: {overall.x:g} {overall.z:g} Score: {overall.score*100:.02f}%"
+    )
+    for rank, peak in enumerate(scores.candidates, 1):
+        display_text += f"\n#{rank}: {peak.x} {peak.z} {peak.score*100:.02f}%"
+        if peak.coverage is not None:
+            display_text += f" | {peak.coverage*100:.02f}% covered"
+    for name, optimum in scores.sectors.items():
+        display_text += (
+            f"\n{name}: {optimum.x:g}, {optimum.z:g} {optimum.score*100:.02f}%"
+        )
+        optimal["sectors"][name] = optimum_json(optimum)
+    if posterior is not None:
+        # nether units like the optima above, the overworld target alongside
+        radius = posterior.credible_radius / 8
+        display_text += (
+            f"\nEyes ({eye_count}): {posterior.nether_coords[0]} "
+            f"{posterior.nether_coords[1]} {posterior.probability*100:.02f}% | "
+            f"90% within {radius:.0f} | overworld {posterior.coords[0]} "
+            f"{posterior.coords[1]}"
+        )
+        optimal["eyes"] = {
+            "x": posterior.nether_coords[0],
+            "z": posterior.nether_coords[1],
+            "overworld_x": posterior.coords[0],
+            "overworld_z": posterior.coords[1],
+            "probability": posterior.probability,
+            "credible_radius": radius,
+        }
+    return display_text, optimal
+
+
+def draw_heatmaps(axes, scores: HeatmapScores, posterior: EyePosterior):
+    """Draw the all and first stronghold heatmaps and their optima on a pair of axes"""
+    for axis, convolved in zip(axes, scores.convolved):
+        axis.clear()
+        axis.imshow(
+            convolved,
+            origin="upper",
+            cmap="hot",
+            interpolation="nearest",
+            extent=[-350, 350, 350, -350],
+        )
+    overall_coords = (scores.overall.x, scores.overall.z)
+    axes[0].plot(*overall_coords, marker="*", c="green")
+    for rank, peak in enumerate(scores.candidates, 1):
+        axes[0].annotate(str(rank), (peak.x, peak.z), color="lime")
+    for optimum in scores.sectors.values():
+        if (optimum.x, optimum.z) == overall_coords:
+            continue
+        axes[0].plot(optimum.x, optimum.z, marker="o", c="green")
+    if posterior is not None:
+        axes[0].contour(
+            posterior.credible_region,
+            levels=[0.5],
+            colors="cyan",
+            extent=[-350, 350, -350, 350],
+        )
+        axes[0].plot(*posterior.nether_coords, marker="x", c="cyan")
@@ -0,0 +1,169 @@
+"""Speculative precomputation of the likely next divine conditions"""
+
+import logging
+from collections import deque
+from threading import Condition, Thread
+
+from .condition_model import (
+    GenericCondition,
+    build_first_portal_condition,
+    build_third_portal_condition,
+    condition_key,
+)
+from .sampler import SamplerThread
+
+try:
+    from .multi_query import MAXIMUM_QUERIES, MultiQuerySampler
+except ImportError:
+    MultiQuerySampler = None
+
+WATER_POOL = GenericCondition(10000, 0, 0, 0.25)
+LAVA_POOL = GenericCondition(10000, 0, 0, 0.125)
+# share of the machine speculation may use, so the game keeps its frame rate
+# while results nobody asked for yet are precomputed
+SPECULATION_CPU_BUDGET = 0.25
+
+
+def predict_next_conditions(conditions) -> list[GenericCondition]:
+    """
+    Conditions most likely to be logged next, most likely first
+
+    After the first portal the next clipboard event is almost always the
+    third portal, a pool, or an 80k decorator in chunk 0,0
+    """
+    conditions = tuple(conditions)
+
+    def logged(predicate):
+        return any(predicate(*condition) for condition in conditions)
+
+    branches = []
+    if not logged(lambda salt, im, iv, fm: salt == 0 and im == 4 and fm == 0.0):
+        branches += [build_first_portal_condition(i) for i in range(4)]
+    elif not logged(lambda salt, im, iv, fm: salt == 0 and im == 4 and fm == 2.0):
+        branches += [build_third_portal_condition(i) for i in range(4)]
+    if not logged(lambda salt, im, iv, fm: salt == 10000):
+        branches += [WATER_POOL, LAVA_POOL]
+    if not logged(lambda salt, im, iv, fm: salt == 80000 and fm == 0.0):
+        branches += [GenericCondition(80000, 16, x, 0.0) for x in range(16)]
+    return branches
+
+
+class SpeculativeScheduler(Thread):
+    """
+    Thread pre-sampling heatmaps for predicted next conditions into a ResultCache
+
+    Speculation is preempted by calling preempt, which cancels the running
+    branch immediately so real work never waits on it
+
+    With the numba engine in grid mode every branch is sampled together in a
+    single multi_query pass rather than one run each
+    """
+
+    def __init__(self, cache, maximum_branches: int = 24) -> None:
+        super().__init__(daemon=True)
+        self.logger = logging.getLogger("SpeculativeScheduler")
+        self.cache = cache
+        self.maximum_branches = maximum_branches
+        self.condition = Condition()
+        self.pending = deque()
+        self.current = None
+
+    def speculate(self, conditions, sample_count, **sampler_kwargs):
+        """
+        Replace any pending speculation with branches of conditions, sampled
+        within SPECULATION_CPU_BUDGET or the run's own cpu budget if smaller
+        """
+        conditions = tuple(conditions)
+        cpu_budget = sampler_kwargs.get("cpu_budget")
+        sampler_kwargs["cpu_budget"] = min(
+            SPECULATION_CPU_BUDGET if cpu_budget is None else cpu_budget,
+            SPECULATION_CPU_BUDGET,
+        )
+        branches = deque()
+        for condition in predict_next_conditions(conditions):
+            branch = conditions + (condition,)
+            key = condition_key(branch)
+            if self.cache.get(key, sample_count) is None:
+                branches.append((key, branch))
+            if len(branches) >= self.maximum_branches:
+                break
+        with self.condition:
+            self.cancel_current()
+            self.pending = deque(
+                (key, branch, sample_count, sampler_kwargs) for key, branch in branches
+            )
+            self.condition.notify()
+        self.logger.debug("Speculating on %d branches", len(branches))
+
+    def preempt(self):
+        """Drop all pending branches and cancel the running one"""
+        with self.condition:
+            self.pending.clear()
+            self.cancel_current()
+
+    def cancel_current(self):
+        """Cancel the running branch, must be called with the condition held"""
+        if self.current is not None:
+            self.current.cancel()
+
+    def next_batch(self) -> list:
+        """
+        Pop the branches to sample next, all of them at once if they can share
+        one pass over a seed stream, must be called with the condition held
+        """
+        _, _, _, sampler_kwargs = self.pending[0]
+        if (
+            MultiQuerySampler is None
+            or sampler_kwargs.get("engine", "numba") != "numba"
+            or sampler_kwargs.get("mode", "grid") != "grid"
+        ):
+            return [self.pending.popleft()]
+        return [
+            self.pending.popleft()
+            for _ in range(min(len(self.pending), MAXIMUM_QUERIES))
+        ]
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+                batch = self.next_batch()
+                _, _, sample_count, sampler_kwargs = batch[0]
+                if len(batch) > 1:
+                    sampler = MultiQuerySampler(
+                        sample_count,
+                        condition_sets=[branch for _, branch, _, _ in batch],
+                        **{
+                            name: value
+                            for name, value in sampler_kwargs.items()
+                            if name not in ("engine", "mode")
+                        },
+                    )
+                else:
+                    sampler = SamplerThread(
+                        sample_count, conditions=batch[0][1], **sampler_kwargs
+                    )
+                self.current = sampler
+            # run on this thread rather than starting the sampler's own
+            sampler.run()
+            with self.condition:
+                self.current = None
+            if sampler.cancelled or sampler.result is None:
+                continue
+            if len(batch) > 1:
+                results = [sampler.query_result(query) for query in range(len(batch))]
+            elif sampler.impossible:
+                results = [None]
+            else:
+                results = [
+                    (
+                        *sampler.result,
+                        sampler.accepted_samples(),
+                        sampler.accepted_seeds(),
+                    )
+                ]
+            for (key, branch, sample_count, _), result in zip(batch, results):
+                if result is None:
+                    continue
+                self.cache.put(key, *result[:2], sample_count, *result[2:])
+                self.logger.debug("Speculated %r", branch[-1])
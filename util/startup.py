@@ -0,0 +1,98 @@
+"""Staged startup: timing marks and preloading heavy modules off of the Tk thread"""
+
+import importlib
+import logging
+import os
+import sys
+from threading import Thread
+from time import perf_counter
+
+# imported in this order, plotting first so the figures can be shown early
+HEAVY_MODULES = (
+    "matplotlib.figure",
+    "matplotlib.backends.backend_tkagg",
+    "pynput.keyboard",
+    # numba modules compile their kernels on import
+    "util.kernels",
+    "util.sampler",
+    "util.angles",
+    "util.exact",
+    "util.governor",
+    "util.speculation",
+    "util.worker",
+    "util.tuning",
+    "util.advisor",
+)
+PLOTTING_MODULES = HEAVY_MODULES[:2]
+
+
+class StartupTimer:
+    """Named time marks since the timer was created, and per module import times"""
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.marks = {}
+        self.imports = {}
+
+    def mark(self, name: str):
+        """Record the time name was reached, only the first time"""
+        self.marks.setdefault(name, perf_counter() - self.start)
+
+    def report(self) -> str:
+        """Human readable summary of the marks and slowest imports"""
+        lines = ["Startup timings:"]
+        lines += [f"  {name}: {seconds:.3f}s" for name, seconds in self.marks.items()]
+        if self.imports:
+            lines.append("Background imports:")
+            lines += [
+                f"  {name}: {seconds:.3f}s"
+                for name, seconds in sorted(
+                    self.imports.items(), key=lambda item: item[1], reverse=True
+                )
+            ]
+        return "\n".join(lines)
+
+
+# created when the entry point first imports this module
+STARTUP = StartupTimer()
+
+
+class Preloader(Thread):
+    """Thread importing modules one by one, so later imports of them are free"""
+
+    def __init__(self, modules=HEAVY_MODULES, timer: StartupTimer = STARTUP) -> None:
+        super().__init__(daemon=True)
+        self.modules = modules
+        self.timer = timer
+        self.loaded = set()
+        self.errors = {}
+
+    def run(self):
+        for name in self.modules:
+            start = perf_counter()
+            try:
+                importlib.import_module(name)
+            except Exception as error:
+                # the module is imported again where it is used, raising there
+                self.errors[name] = error
+                logging.getLogger("Preloader").error("Failed to import %s", name)
+            self.timer.imports[name] = perf_counter() - start
+            self.loaded.add(name)
+
+    def has_loaded(self, modules) -> bool:
+        """Whether every one of modules has been imported (or failed to)"""
+        return self.loaded.issuperset(modules)
+
+
+def thread_limit() -> int:
+    """Size of numba's thread pool, without importing numba before it is preloaded"""
+    config = getattr(sys.modules.get("numba"), "config", None)
+    # numba defaults to the cpu count
+    return getattr(config, "NUMBA_NUM_THREADS", None) or os.cpu_count() or 1
+
+
+if __name__ == "__main__":
+    preloader = Preloader()
+    preloader.run()
+    STARTUP.mark("imports done")
+    print(STARTUP.report())
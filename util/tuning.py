@@ -0,0 +1,96 @@
+"""Automatic thread count calibration for stronghold distribution generation"""
+
+import logging
+from threading import Thread
+from time import perf_counter
+from typing import NamedTuple
+
+import numba
+import numpy as np
+
+from .condition_model import condition_arrays
+from .heatmap import generate_data
+from .sampler import KERNEL_LOCK
+
+
+class CalibrationResult(NamedTuple):
+    """Outcome of a thread count calibration burst"""
+
+    thread_count: int
+    accepted_rate: float
+    rates: dict
+
+
+def default_headroom(thread_count: int = None) -> int:
+    """Number of threads to leave free so the game itself is not starved"""
+    if thread_count is None:
+        thread_count = numba.config.NUMBA_NUM_THREADS
+    if thread_count <= 2:
+        return 0
+    return 1 if thread_count <= 4 else 2
+
+
+def candidate_thread_counts(maximum: int) -> list[int]:
+    """Powers of two up to maximum, always including maximum itself"""
+    candidates = []
+    thread_count = 1
+    while thread_count < maximum:
+        candidates.append(thread_count)
+        thread_count *= 2
+    candidates.append(maximum)
+    return candidates
+
+
+def measure_accepted_rate(thread_count, conditions, duration=0.2) -> float:
+    """Measure accepted samples per second generated on thread_count threads"""
+    sample_count = 1000
+    elapsed = 0.0
+    with KERNEL_LOCK:
+        numba.set_num_threads(thread_count)
+        # grow the burst until it is long enough to time reliably
+        while True:
+            progress = np.zeros(2, np.int64)
+            start = perf_counter()
+            generate_data(progress, sample_count, thread_count, conditions)
+            elapsed = perf_counter() - start
+            if progress[0] < 0:
+                return 0.0
+            if elapsed >= duration:
+                return float(progress[0] / elapsed)
+            sample_count *= 2
+
+
+def calibrate_thread_count(
+    conditions=None, headroom: int = None, duration: float = 0.2, tolerance=0.05
+) -> CalibrationResult:
+    """
+    Benchmark a short burst of generation on increasing thread counts and
+    pick the smallest count within tolerance of the best accepted/sec
+    """
+    logger = logging.getLogger("calibrate_thread_count")
+    if conditions is None:
+        conditions = condition_arrays(())
+    if headroom is None:
+        headroom = default_headroom()
+    maximum = max(1, numba.config.NUMBA_NUM_THREADS - headroom)
+    rates = {}
+    for thread_count in candidate_thread_counts(maximum):
+        rates[thread_count] = measure_accepted_rate(thread_count, conditions, duration)
+        logger.info("%d threads: %.0f accepted/s", thread_count, rates[thread_count])
+    best_rate = max(rates.values())
+    thread_count = min(
+        count for count, rate in rates.items() if rate >= best_rate * (1 - tolerance)
+    )
+    return CalibrationResult(thread_count, rates[thread_count], rates)
+
+
+class CalibrationThread(Thread):
+    """Thread running calibrate_thread_count in the background"""
+
+    def __init__(self, on_finish, headroom: int = None) -> None:
+        super().__init__(daemon=True)
+        self.on_finish = on_finish
+        self.headroom = headroom
+
+    def run(self):
+        self.on_finish(calibrate_thread_count(headroom=self.headroom))
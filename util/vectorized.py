@@ -0,0 +1,289 @@
+"""Pure NumPy array engine mirroring the numba seed testing and generation functions"""
+
+import argparse
+
+import numpy as np
+
+from .seed_stream import counter_seeds, new_key
+
+MULT = np.uint64(0x5DEECE66D)
+ADD = np.uint64(0xB)
+MASK = np.uint64(0xFFFFFFFFFFFF)
+# seeds tested per chunk, bounding the memory of the intermediate arrays
+DEFAULT_CHUNK_SIZE = 1 << 16
+# seeds tested with no accepted samples before giving up
+IMPOSSIBLE_TEST_COUNT = 100000
+
+
+def init(seeds: np.ndarray) -> np.ndarray:
+    """Salt seeds that would be passed to Random()"""
+    return np.asarray(seeds).astype(np.int64).view(np.uint64) ^ MULT
+
+
+def next_seed(seeds: np.ndarray) -> np.ndarray:
+    """Advance seeds via Java's Random() LCG algorithm"""
+    # uint64 arithmetic wraps modulo 2**64 which is exact under the 48 bit mask
+    return (seeds * MULT + ADD) & MASK
+
+
+def next_int(seeds: np.ndarray, maximum: int):
+    """Advance seeds and generate the next ints in range [0, maximum)"""
+    seeds = next_seed(seeds)
+    maximum = np.uint64(maximum)
+    if maximum & (maximum - np.uint64(1)):
+        return seeds, ((seeds >> np.uint64(17)) % maximum).astype(np.int64)
+    return seeds, ((maximum * (seeds >> np.uint64(17))) >> np.uint64(31)).astype(
+        np.int64
+    )
+
+
+def next_float(seeds: np.ndarray):
+    """Advance seeds and generate the next float32s"""
+    seeds = next_seed(seeds)
+    return seeds, (seeds >> np.uint64(24)).astype(np.float32) / np.float32(1 << 24)
+
+
+def next_double(seeds: np.ndarray):
+    """Advance seeds and generate the next float64s"""
+    seeds = next_seed(seeds)
+    rand_0 = (seeds >> np.uint64(22)) << np.uint64(27)
+    seeds = next_seed(seeds)
+    rand_1 = seeds >> np.uint64(21)
+    return seeds, (rand_0 + rand_1).astype(np.float64) / np.float64(1 << 53)
+
+
+def test_int_rand(seeds, salt, maximum, value) -> np.ndarray:
+    """Vectorized conditions.test_int_rand"""
+    salted = np.asarray(seeds, np.int64) + np.int64(salt)
+    return next_int(init(salted), maximum)[1] == value
+
+
+def _signed_float_rand(seeds, salt, maximum):
+    salted = np.asarray(seeds, np.int64) + np.int64(salt)
+    states, chance_rand = next_float(init(salted))
+    if maximum < 0.0:
+        chance_rand = -chance_rand
+    return states, chance_rand
+
+
+def test_float_rand(seeds, salt, maximum) -> np.ndarray:
+    """Vectorized conditions.test_float_rand"""
+    maximum = np.float32(maximum)
+    return _signed_float_rand(seeds, salt, maximum)[1] < maximum
+
+
+def test_float_int_pair_rand(
+    seeds, salt, float_maximum, int_maximum, int_value
+) -> np.ndarray:
+    """Vectorized conditions.test_float_int_pair_rand"""
+    float_maximum = np.float32(float_maximum)
+    states, chance_rand = _signed_float_rand(seeds, salt, float_maximum)
+    states = next_seed(states)
+    return ~(chance_rand > float_maximum) & (
+        next_int(states, int_maximum)[1] == int_value
+    )
+
+
+def test_all_conditions(seeds, divine_conditions) -> np.ndarray:
+    """Vectorized conditions.test_all_conditions, returning a mask of passing seeds"""
+    seeds = np.asarray(seeds, np.int64)
+    mask = np.ones(seeds.shape, np.bool_)
+    for salt, int_maximum, int_value, float_maximum in divine_conditions:
+        # only test the seeds that are still alive
+        alive = np.flatnonzero(mask)
+        if not alive.size:
+            break
+        if int_maximum != 0:
+            if float_maximum != 0.0:
+                passed = test_float_int_pair_rand(
+                    seeds[alive], salt, float_maximum, int_maximum, int_value
+                )
+            else:
+                passed = test_int_rand(seeds[alive], salt, int_maximum, int_value)
+        else:
+            passed = test_float_rand(seeds[alive], salt, float_maximum)
+        mask[alive[~passed]] = False
+    return mask
+
+
+def gen_first_ring_strongholds(seeds) -> np.ndarray:
+    """
+    Vectorized stronghold.gen_first_ring_strongholds,
+    returning an (n, 3, 2) array of start chunks
+    """
+    states = init(seeds)
+    states, rand_0 = next_double(states)
+    states, rand_1 = next_double(states)
+    states, rand_2 = next_double(states)
+    states, rand_3 = next_double(states)
+    strongholds = np.empty((len(rand_0), 3, 2), np.int64)
+    angle = rand_0 * np.pi * np.float64(2)
+    for i, rand in enumerate((rand_1, rand_2, rand_3)):
+        if i:
+            angle += np.pi * 2.0 / 3.0
+        distance_ring = np.float64(4) * np.float64(32) + (
+            rand - np.float64(0.5)
+        ) * np.float64(32) * np.float64(2.5)
+        strongholds[:, i, 0] = np.round(np.cos(angle) * distance_ring)
+        strongholds[:, i, 1] = np.round(np.sin(angle) * distance_ring)
+    return strongholds
+
+
+def random_seeds(rng: np.random.Generator, size: int) -> np.ndarray:
+    """Draw seeds from the same range generate_data uses"""
+    return rng.integers(-(1 << 47) + 1, 1 << 47, size, np.int64)
+
+
+def accumulate_data(
+    progress,
+    count,
+    divine_conditions,
+    first_stronghold_locations,
+    all_stronghold_locations,
+    samples,
+    seeds,
+    tested_limit=np.iinfo(np.int64).max,
+    seed_key=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    row_offset=0,
+):
+    """
+    Array equivalent of heatmap.accumulate_data, drawing the same seed stream
+    for the same seed_key
+
+    The final chunk is truncated so exactly count samples are accepted, and
+    unlike the numba kernel they are always the first count in the stream
+    """
+    if seed_key is None:
+        seed_key = new_key()
+    divine_conditions = tuple(divine_conditions)
+    while 0 <= progress[0] < count and progress[1] < tested_limit:
+        size = int(min(chunk_size, tested_limit - progress[1]))
+        tested_seeds = counter_seeds(seed_key, progress[1], size)
+        accepted = np.flatnonzero(test_all_conditions(tested_seeds, divine_conditions))
+        remaining = count - progress[0]
+        if accepted.size > remaining:
+            # only count seeds up to the last one needed
+            size = int(accepted[remaining - 1]) + 1
+            accepted = accepted[:remaining]
+        progress[1] += size
+        if not accepted.size:
+            if progress[0] == 0 and progress[1] > IMPOSSIBLE_TEST_COUNT:
+                progress[0] = -1
+            continue
+        strongholds = gen_first_ring_strongholds(tested_seeds[accepted])
+        indices = (strongholds[:, :, 0] * 2 + 350) + 701 * (
+            strongholds[:, :, 1] * 2 + 350
+        )
+        first_stronghold_locations += np.bincount(
+            indices[:, 0], minlength=701 * 701
+        ).astype(np.uint64)
+        all_stronghold_locations += np.bincount(
+            indices.ravel(), minlength=701 * 701
+        ).astype(np.uint64)
+        row = progress[0] - row_offset
+        stored = samples[row : row + accepted.size]
+        stored[:] = strongholds[: len(stored)]
+        stored = seeds[row : row + accepted.size]
+        stored[:] = tested_seeds[accepted[: len(stored)]]
+        progress[0] += accepted.size
+
+
+def generate_data(
+    progress, count, divine_conditions, chunk_size=DEFAULT_CHUNK_SIZE, seed_key=None
+):
+    """Array equivalent of heatmap.generate_data"""
+    first_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
+    all_stronghold_locations = np.zeros(701 * 701, dtype=np.uint64)
+    accumulate_data(
+        progress,
+        count,
+        divine_conditions,
+        first_stronghold_locations,
+        all_stronghold_locations,
+        np.zeros((0, 3, 2), dtype=np.int16),
+        np.zeros(0, dtype=np.int64),
+        seed_key=seed_key,
+        chunk_size=chunk_size,
+    )
+    return np.reshape(first_stronghold_locations, (701, 701)), np.reshape(
+        all_stronghold_locations, (701, 701)
+    )
+
+
+def cross_check(seeds, divine_conditions=()) -> dict:
+    """
+    Compare this engine against the numba functions seed by seed,
+    returning the number of mismatches per function
+    """
+    # imported here so the engine itself never requires numba
+    from . import conditions, java_random, stronghold
+    from .condition_model import condition_arrays
+
+    seeds = np.asarray(seeds, np.int64)
+    numba_conditions = condition_arrays(divine_conditions)
+    states = init(seeds)
+    mismatches = {}
+    for name, vectorized, scalar in (
+        (
+            "next_int(16)",
+            lambda s: next_int(s, 16)[1],
+            lambda s: java_random.next_int(s, 16)[1],
+        ),
+        (
+            "next_int(5)",
+            lambda s: next_int(s, 5)[1],
+            lambda s: java_random.next_int(s, 5)[1],
+        ),
+        (
+            "next_float",
+            lambda s: next_float(s)[1],
+            lambda s: java_random.next_float(s)[1],
+        ),
+        (
+            "next_double",
+            lambda s: next_double(s)[1],
+            lambda s: java_random.next_double(s)[1],
+        ),
+    ):
+        expected = np.array([scalar(state) for state in states.view(np.int64)])
+        mismatches[name] = int(np.count_nonzero(vectorized(states) != expected))
+    expected = np.array(
+        [stronghold.gen_first_ring_strongholds(seed) for seed in seeds], np.int64
+    ).reshape(-1, 3, 2)
+    mismatches["gen_first_ring_strongholds"] = int(
+        np.count_nonzero(
+            (gen_first_ring_strongholds(seeds) != expected).any(axis=(1, 2))
+        )
+    )
+    expected = np.array(
+        [conditions.test_condition_arrays(seed, numba_conditions) for seed in seeds]
+    )
+    mismatches["test_all_conditions"] = int(
+        np.count_nonzero(test_all_conditions(seeds, divine_conditions) != expected)
+    )
+    return mismatches
+
+
+if __name__ == "__main__":
+    from .condition_model import (
+        build_buried_treasure_condition,
+        build_first_portal_condition,
+        build_third_portal_condition,
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Cross-check the NumPy engine against the numba engine"
+    )
+    parser.add_argument("--seed-count", type=int, default=100000)
+    args = parser.parse_args()
+    check_seeds = random_seeds(np.random.default_rng(), args.seed_count)
+    for name, condition_set in (
+        ("no conditions", ()),
+        ("first portal", (build_first_portal_condition(1),)),
+        ("third portal", (build_third_portal_condition(2),)),
+        ("buried treasure", (build_buried_treasure_condition(3, -2),)),
+        ("chance decorator", ((80000, 16, 5, 0.1),)),
+        ("lava pool", ((10000, 0, 0, 0.125),)),
+    ):
+        print(name, cross_check(check_seeds, condition_set))
@@ -0,0 +1,251 @@
+"""Sampler worker process sharing its histograms with the GUI through shared memory"""
+
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import Lock
+
+import numpy as np
+
+from .condition_model import GenericCondition
+from .sampler import SamplerThread, histogram_shapes, sample_rows
+
+
+class SharedBuffers:
+    """
+    Progress counters, histograms, samples and seeds of one run in a single
+    shared memory block
+    """
+
+    def __init__(self, mode, sample_count, name=None) -> None:
+        shapes = histogram_shapes(mode)
+        histogram_sizes = [int(np.prod(shape)) for shape in shapes]
+        rows = sample_rows(mode, sample_count)
+        size = 2 * 8 + sum(histogram_sizes) * 8 + rows * 8 + rows * 3 * 2 * 2
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # spawned workers share the creator's resource tracker, which
+            # unregisters the block once the creator unlinks it
+            self.memory = shared_memory.SharedMemory(name=name)
+        buffer = self.memory.buf
+        self.progress = np.ndarray(2, np.int64, buffer)
+        offset = self.progress.nbytes
+        self.histograms = []
+        for histogram_size in histogram_sizes:
+            self.histograms.append(
+                np.ndarray(histogram_size, np.uint64, buffer, offset)
+            )
+            offset += histogram_size * 8
+        self.histograms = tuple(self.histograms)
+        self.seeds = np.ndarray(rows, np.int64, buffer, offset)
+        offset += rows * 8
+        self.samples = np.ndarray((rows, 3, 2), np.int16, buffer, offset)
+        if name is None:
+            self.progress[:] = 0
+            for histogram in self.histograms:
+                histogram[:] = 0
+
+    @property
+    def name(self) -> str:
+        """Name to attach to the block from another process"""
+        return self.memory.name
+
+    def buffers(self):
+        """Arrays in the layout SamplerThread expects"""
+        return self.progress, self.histograms, self.samples
+
+    def copy(self):
+        """
+        Private copies of the arrays and seeds that outlive the block, up to
+        the accepted samples
+        """
+        accepted = min(max(int(self.progress[0]), 0), len(self.samples))
+        return (
+            self.progress.copy(),
+            tuple(histogram.copy() for histogram in self.histograms),
+            self.samples[:accepted].copy(),
+        ), self.seeds[:accepted].copy()
+
+    def close(self, unlink: bool = False):
+        """
+        Release the views and the block, unlinking it if this process created
+        it, arrays anyone else still holds into it crash the process if used
+        afterwards rather than keeping it mapped
+        """
+        self.progress = self.histograms = self.samples = self.seeds = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def worker_main(connection):
+    """Serve sampling jobs over connection until None is received"""
+    # compile and start the parallel runtime before the first real run
+    SamplerThread(1, 1, ()).run()
+    connection.send(("ready",))
+    while True:
+        message = connection.recv()
+        if message is None:
+            return
+        _, name, settings = message
+        buffers = SharedBuffers(
+            settings["mode"],
+            settings["sample_count"],
+            name,
+        )
+        settings["conditions"] = tuple(
+            GenericCondition(*condition) for condition in settings["conditions"]
+        )
+        sampler = SamplerThread(
+            **settings, buffers=buffers.buffers(), seeds=buffers.seeds
+        )
+        error = None
+        try:
+            sampler.run()
+        except Exception as exception:
+            error = repr(exception)
+        reply = (
+            "done",
+            sampler.elapsed,
+            sampler.result if sampler.exact else None,
+            error,
+        )
+        # the sampler's views must be gone before the block can be closed
+        del sampler
+        buffers.close()
+        connection.send(reply)
+
+
+class SamplerService:
+    """Owner of the warm worker process, restarting it if it dies"""
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger("SamplerService")
+        self.lock = Lock()
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        """Start the worker if it isn't running"""
+        if self.process is not None and self.process.is_alive():
+            return
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.logger.info("Started sampler worker %d", self.process.pid)
+
+    def stop(self):
+        """Ask the worker to exit"""
+        if self.process is None:
+            return
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+    def run(self, name, settings):
+        """Run one job, blocking until the worker replies"""
+        with self.lock:
+            self.start()
+            try:
+                self.connection.send(("run", name, settings))
+                reply = self.connection.recv()
+                # the worker announces itself once after starting
+                if reply[0] == "ready":
+                    reply = self.connection.recv()
+                return reply
+            except (EOFError, BrokenPipeError, OSError):
+                self.logger.error("Sampler worker died, restarting on the next run")
+                self.process = None
+                return None
+
+
+class ProcessSampler(SamplerThread):
+    """SamplerThread whose kernels run in the service's worker process"""
+
+    def __init__(
+        self,
+        service: SamplerService,
+        sample_count,
+        thread_count,
+        conditions,
+        **kwargs,
+    ):
+        mode = kwargs.get("mode", "grid")
+        # seeds are written and logged by the worker
+        self.shared = SharedBuffers(mode, sample_count)
+        # a resumed run's buffers are carried over into the shared block
+        resumed = kwargs.pop("buffers", None)
+        resumed_seeds = kwargs.pop("seeds", None)
+        if resumed is not None:
+            for source, target in zip(
+                (resumed[0], *resumed[1], resumed[2]),
+                (self.shared.progress, *self.shared.histograms, self.shared.samples),
+            ):
+                target[:] = source
+        if resumed_seeds is not None:
+            self.shared.seeds[:] = resumed_seeds
+        super().__init__(
+            sample_count,
+            thread_count,
+            conditions,
+            **kwargs,
+            buffers=self.shared.buffers(),
+            seeds=self.shared.seeds,
+        )
+        self.service = service
+
+    def run(self):
+        settings = {
+            "sample_count": self.sample_count,
+            "thread_count": self.thread_count,
+            "conditions": tuple(tuple(condition) for condition in self.conditions),
+            "cpu_budget": self.cpu_budget,
+            "low_priority": self.low_priority,
+            "cores": self.cores,
+            "engine": self.engine,
+            "mode": self.mode,
+            "seed_key": self.seed_key,
+            "checkpoint": self.checkpoint,
+            "sample_log": self.sample_log,
+        }
+        reply = self.service.run(self.shared.name, settings)
+        # swap every view for private copies, the block itself is released by
+        # the thread polling this one once it has seen the run finish
+        (self.progress, self.histograms, self.samples), self.seeds = self.shared.copy()
+        self.outputs = self.histograms + (
+            (self.samples, self.seeds) if self.mode == "grid" else ()
+        )
+        if reply is None:
+            return
+        _, self.elapsed, exact_result, error = reply
+        if error is not None:
+            self.service.logger.error("Sampler worker failed: %s", error)
+            return
+        if self.cancelled:
+            return
+        if exact_result is not None:
+            self.exact = True
+            self.result = exact_result
+            return
+        self.result = tuple(
+            np.reshape(histogram, shape)
+            for histogram, shape in zip(self.histograms, self.shapes)
+        )
+
+    def release(self) -> bool:
+        if self.is_alive():
+            return False
+        if self.shared is not None:
+            self.shared.close(unlink=True)
+            self.shared = None
+        return True